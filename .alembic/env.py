@@ -14,7 +14,8 @@ from app.database import BaseAlchemyModel
 from app.doctor.model import Doctor 
 from app.patient.model import Patient
 from app.user.model import User, AccessToken
-from app.chat.model import Chat, Attachment, Message
+from app.chat.model import Chat, ChatSummary, Attachment, Message
+from app.importer.model import ImportJob
 
 
 # this is the Alembic Config object, which provides
@@ -2,8 +2,14 @@ from fastapi import Depends
 from fastapi_users import FastAPIUsers
 from fastapi_users.authentication import AuthenticationBackend, BearerTransport
 from fastapi_users.authentication.strategy.db import AccessTokenDatabase, DatabaseStrategy
+from fastapi_users_db_sqlalchemy import SQLAlchemyUserDatabase
+from fastapi_users_db_sqlalchemy.access_token import SQLAlchemyAccessTokenDatabase
 
-from app.auth.user_manager import get_user_manager
+from app.auth.jwt_strategy import JWTRefreshStrategy
+from app.auth.token_cache import CachedDatabaseStrategy, token_user_cache
+from app.config import settings
+from app.auth.user_manager import UserManager, get_user_manager
+from app.database import get_session
 from app.user.dependencies import get_access_token_db
 from app.user.model import AccessToken, User
 
@@ -13,7 +19,7 @@ bearer_transport = BearerTransport(tokenUrl="auth/login")
 def get_database_strategy(
     access_token_db: AccessTokenDatabase[AccessToken] = Depends(get_access_token_db)
 ) -> DatabaseStrategy:
-    return DatabaseStrategy(access_token_db, lifetime_seconds=360000)
+    return CachedDatabaseStrategy(access_token_db, lifetime_seconds=360000, cache=token_user_cache)
 
 auth_backend = AuthenticationBackend(
     name="bearer",
@@ -21,7 +27,45 @@ auth_backend = AuthenticationBackend(
     get_strategy=get_database_strategy,
 )
 
-fastapi_users = FastAPIUsers[User, int](get_user_manager, [auth_backend])
+
+jwt_bearer_transport = BearerTransport(tokenUrl="auth/jwt/login")
+
+def get_jwt_strategy(
+    access_token_db: AccessTokenDatabase[AccessToken] = Depends(get_access_token_db)
+) -> JWTRefreshStrategy:
+    return JWTRefreshStrategy(
+        access_token_db,
+        cache=token_user_cache,
+        access_lifetime=settings.JWT_ACCESS_LIFETIME,
+        refresh_lifetime=settings.JWT_REFRESH_LIFETIME,
+    )
+
+jwt_backend = AuthenticationBackend(
+    name="jwt",
+    transport=jwt_bearer_transport,
+    get_strategy=get_jwt_strategy,
+)
+
+# JWT проверяется первым: на чужом токене он отказывает без запроса к БД
+fastapi_users = FastAPIUsers[User, int](get_user_manager, [jwt_backend, auth_backend])
 
 current_active_user = fastapi_users.current_user(active=True)
 current_admin_user = fastapi_users.current_user(superuser=True)
+
+
+async def authenticate_token(token: str | None) -> User | None:
+    """Активный пользователь по токену вне HTTP-запроса, например у WebSocket.
+
+    Те же бэкенды, что у current_active_user, но в короткой сессии: зависимости с
+    сессией держали бы соединение из пула все время жизни сокета.
+    """
+    if not token:
+        return None
+    async with get_session() as session:
+        user_manager = UserManager(SQLAlchemyUserDatabase(session, User))
+        access_token_db = SQLAlchemyAccessTokenDatabase(session, AccessToken)
+        for backend in (jwt_backend, auth_backend):
+            user = await backend.get_strategy(access_token_db).read_token(token, user_manager)
+            if user is not None:
+                return user if user.is_active else None
+    return None
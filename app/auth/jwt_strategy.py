@@ -0,0 +1,145 @@
+"""
+Stateless-аутентификация: короткоживущий подписанный access-токен (JWT) и
+refresh-токен, который хранится в таблице access_token.
+
+Access-токен проверяется без обращения к БД и Redis: подпись, срок жизни и отзыв
+сессии (sid, см. TokenUserCache.is_revoked), пользователь берется из TokenUserCache.
+БД нужна только при входе, обновлении пары токенов и выходе.
+
+В access_token хранится не сам refresh-токен, а "r." + HMAC(SECRET_KEY, токен):
+по утечке таблицы refresh-токен не восстановить, а CachedDatabaseStrategy не
+принимает такие ключи как bearer-токены. Этот же ключ - sid сессии в JWT.
+"""
+import base64
+import hashlib
+import hmac
+import secrets
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import jwt
+from fastapi_users import exceptions
+from fastapi_users.authentication.strategy import Strategy
+from fastapi_users.authentication.strategy.db import AccessTokenDatabase
+from fastapi_users.jwt import decode_jwt, generate_jwt
+from fastapi_users.manager import BaseUserManager
+from sqlalchemy import delete, select
+
+from app.auth.token_cache import REFRESH_TOKEN_PREFIX, TokenUserCache
+from app.config import settings
+from app.exceptions import IncorrectRefreshTokenException
+from app.prometheus.metrics import AUTH_TOKEN_CACHE_REQUESTS
+from app.user.model import AccessToken, User
+from app.user.schemas import STokenPair
+
+AUDIENCE = "chat:auth"
+
+
+def refresh_token_key(refresh_token: str) -> str:
+    digest = hmac.new(settings.SECRET_KEY.encode(), refresh_token.encode(), hashlib.sha256).digest()
+    key = base64.urlsafe_b64encode(digest).decode().rstrip("=")
+    return REFRESH_TOKEN_PREFIX + key[: 43 - len(REFRESH_TOKEN_PREFIX)]
+
+
+class JWTRefreshStrategy(Strategy[User, int]):
+    def __init__(
+        self,
+        database: AccessTokenDatabase[AccessToken],
+        cache: TokenUserCache,
+        access_lifetime: int,
+        refresh_lifetime: int,
+    ):
+        self.database = database
+        self.cache = cache
+        self.access_lifetime = access_lifetime
+        self.refresh_lifetime = refresh_lifetime
+
+    async def read_token(
+        self, token: Optional[str], user_manager: BaseUserManager[User, int]
+    ) -> Optional[User]:
+        if token is None:
+            return None
+        try:
+            data = decode_jwt(token, settings.SECRET_KEY, [AUDIENCE], algorithms=[settings.ALGORITHM])
+            user_id = user_manager.parse_id(data["sub"])
+            sid = data["sid"]
+        except (jwt.PyJWTError, KeyError, exceptions.InvalidID):
+            return None
+        if self.cache.is_revoked(sid):
+            return None
+
+        user = self.cache.get_user(user_id)
+        if user is not None:
+            self.cache.observe_hit()
+            return user
+        AUTH_TOKEN_CACHE_REQUESTS.labels(result="miss").inc()
+        start = time.perf_counter()
+        try:
+            user = await user_manager.get(user_id)
+        except exceptions.UserNotExists:
+            return None
+        self.cache.observe_miss(time.perf_counter() - start)
+        self.cache.set_user(user)
+        return user
+
+    async def write_token(self, user: User) -> str:
+        return (await self.issue_tokens(user)).access_token
+
+    async def destroy_token(self, token: str, user: User) -> None:
+        try:
+            data = decode_jwt(token, settings.SECRET_KEY, [AUDIENCE], algorithms=[settings.ALGORITHM])
+            sid = data["sid"]
+        except (jwt.PyJWTError, KeyError):
+            return
+        await self.revoke(sid)
+
+    async def issue_tokens(self, user: User) -> STokenPair:
+        refresh_token = secrets.token_urlsafe(32)
+        sid = refresh_token_key(refresh_token)
+        await self.database.create({"token": sid, "user_id": user.id})
+        access_token = generate_jwt(
+            {"sub": str(user.id), "sid": sid, "aud": [AUDIENCE]},
+            settings.SECRET_KEY,
+            self.access_lifetime,
+            algorithm=settings.ALGORITHM,
+        )
+        return STokenPair(access_token=access_token, refresh_token=refresh_token)
+
+    async def refresh(
+        self, refresh_token: str, user_manager: BaseUserManager[User, int]
+    ) -> STokenPair:
+        """Обменивает refresh-токен на новую пару.
+
+        Старый refresh-токен удаляется, а выданные по нему access-токены доживают свой срок:
+        запросы, отправленные клиентом до обновления, не должны получить 401.
+
+        Токен забирается одним DELETE ... RETURNING: из двух одновременных обновлений
+        одного токена строку получит только одно, второе получит ошибку. Токен неактивного
+        пользователя не удаляется, поэтому отказ не зависит от отката транзакции.
+        """
+        max_age = datetime.now(timezone.utc) - timedelta(seconds=self.refresh_lifetime)
+        claimed = await self.database.session.execute(
+            delete(AccessToken)
+            .where(
+                AccessToken.token == refresh_token_key(refresh_token),
+                AccessToken.created_at > max_age,
+                AccessToken.user_id.in_(select(User.id).where(User.is_active)),
+            )
+            .returning(AccessToken.user_id)
+        )
+        user_id = claimed.scalar_one_or_none()
+        if user_id is None:
+            raise IncorrectRefreshTokenException
+        try:
+            user = await user_manager.get(user_id)
+        except exceptions.UserNotExists:
+            raise IncorrectRefreshTokenException
+        return await self.issue_tokens(user)
+
+    async def revoke(self, sid: str) -> None:
+        """Удаляет refresh-токен и отзывает выданные по нему access-токены на всех воркерах."""
+        stored = await self.database.get_by_token(sid)
+        if stored is not None:
+            await self.database.delete(stored)
+        await self.cache.revoke_session(sid)
@@ -1,14 +1,53 @@
 from fastapi import APIRouter, Depends, FastAPI
+from fastapi.security import OAuth2PasswordRequestForm
 
-from app.auth.auth import auth_backend, current_active_user, current_admin_user, fastapi_users
+from app.auth.auth import auth_backend, current_active_user, current_admin_user, fastapi_users, get_jwt_strategy
+from app.auth.jwt_strategy import JWTRefreshStrategy, refresh_token_key
+from app.auth.user_manager import UserManager, get_user_manager
+from app.exceptions import IncorrectEmailOrPasswordException
 from app.user.model import User
-from app.user.schemas import SUserCreate, SUserRead, SUserUpdate
+from app.user.schemas import SRefreshToken, STokenPair, SUserCreate, SUserRead, SUserUpdate
+
+
+jwt_router = APIRouter(prefix="/auth/jwt", tags=["Auth"])
+
+
+@jwt_router.post("/login")
+async def jwt_login(
+    credentials: OAuth2PasswordRequestForm = Depends(),
+    user_manager: UserManager = Depends(get_user_manager),
+    strategy: JWTRefreshStrategy = Depends(get_jwt_strategy),
+) -> STokenPair:
+    user = await user_manager.authenticate(credentials)
+    if user is None or not user.is_active:
+        raise IncorrectEmailOrPasswordException
+    await user_manager.on_after_login(user)
+    return await strategy.issue_tokens(user)
+
+
+@jwt_router.post("/refresh")
+async def jwt_refresh(
+    data: SRefreshToken,
+    user_manager: UserManager = Depends(get_user_manager),
+    strategy: JWTRefreshStrategy = Depends(get_jwt_strategy),
+) -> STokenPair:
+    return await strategy.refresh(data.refresh_token, user_manager)
+
+
+@jwt_router.post("/logout")
+async def jwt_logout(
+    data: SRefreshToken,
+    strategy: JWTRefreshStrategy = Depends(get_jwt_strategy),
+):
+    await strategy.revoke(refresh_token_key(data.refresh_token))
+    return {"message": "Сессия завершена"}
 
 
 def add_auth_routes(app: FastAPI):
     app.include_router(
         fastapi_users.get_auth_router(auth_backend), prefix="/auth", tags=["Auth"]
     )
+    app.include_router(jwt_router)
     app.include_router(
         fastapi_users.get_register_router(SUserRead, SUserCreate),
         prefix="/auth",
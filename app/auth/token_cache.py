@@ -0,0 +1,267 @@
+"""
+Кэш токен -> пользователь перед DatabaseStrategy.
+
+Без кэша каждый запрос с current_active_user делает два запроса к БД: поиск токена
+в access_token и загрузку пользователя. Кэш хранит снимок колонок пользователя в
+локальном LRU воркера не дольше AUTH_TOKEN_CACHE_TTL секунд и не дольше срока жизни
+самого токена. Ключ - sha256 токена, сами токены в памяти и в Redis не хранятся.
+
+Тот же кэш по id пользователя использует JWTRefreshStrategy. Отзыв сессии JWT (sid)
+проверяется только по памяти воркера, без обращений к Redis на каждый запрос: отзывы
+рассылаются через pub/sub и складываются в локальный набор. Кроме того, отзыв
+записывается в Redis (auth:revoked:{sid}) на срок жизни access-токенов: по этим ключам
+воркер заполняет набор при старте и после переподключения к каналу, когда сообщения
+могли быть потеряны. Пока подписки нет, поведение задает AUTH_REVOCATION_FAIL_CLOSED.
+
+Выход (logout) и изменения пользователя рассылаются через Redis pub/sub, и каждый
+воркер сбрасывает у себя соответствующие записи. Изменения в обход UserManager
+(например, через админку) становятся видны по истечении TTL. Пока подписка на
+канал сброса не запущена (start), кэш выключен: иначе чужой logout остался бы незамеченным.
+"""
+import asyncio
+import hashlib
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi_users import exceptions
+from fastapi_users.authentication.strategy.db import DatabaseStrategy
+from fastapi_users.manager import BaseUserManager
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.base.cache import TTLCache
+from app.config import settings
+from app.logger import logger
+from app.prometheus.metrics import (
+    AUTH_TOKEN_CACHE_REQUESTS, AUTH_TOKEN_CACHE_SAVED_SECONDS, AUTH_TOKEN_LOOKUP_SECONDS
+)
+from app.redis_client import redis as default_redis
+from app.user.model import User
+
+INVALIDATE_CHANNEL = "auth:invalidate"
+REVOKED_KEY = "auth:revoked:{}"
+# Префикс ключей refresh-токенов в access_token; secrets.token_urlsafe() не содержит точек
+REFRESH_TOKEN_PREFIX = "r."
+
+
+def token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenUserCache:
+    def __init__(
+        self,
+        redis: aioredis.Redis,
+        maxsize: int,
+        ttl: float,
+        revoked_ttl: float,
+        revoked_maxsize: int,
+        fail_closed: bool = False,
+    ):
+        self.redis = redis
+        self.ttl = ttl
+        self.revoked_ttl = revoked_ttl
+        self.fail_closed = fail_closed
+        # sha256 токена (или "user:{id}") -> (id пользователя, снимок колонок User)
+        self.local: TTLCache[str, tuple[int, dict]] = TTLCache(maxsize, ttl)
+        # sid отозванных сессий JWT. Полон, только пока synced
+        self.revoked: TTLCache[str, bool] = TTLCache(revoked_maxsize, revoked_ttl)
+        # Подписка на канал работает и набор отзывов догружен из Redis
+        self.synced = False
+        # Скользящее среднее времени промаха: столько экономит каждое попадание
+        self.miss_seconds = 0.0
+        self.enabled = False
+        self._pubsub = None
+        self._reader: asyncio.Task | None = None
+
+    def get(self, token: str) -> User | None:
+        return self._get(token_key(token))
+
+    def set(self, token: str, user: User, expires_in: float | None = None) -> None:
+        self._set(token_key(token), user, expires_in)
+
+    def get_user(self, user_id: int) -> User | None:
+        return self._get(f"user:{user_id}")
+
+    def set_user(self, user: User) -> None:
+        self._set(f"user:{user.id}", user)
+
+    def is_revoked(self, sid: str) -> bool:
+        if self.revoked.get(sid, False):
+            return True
+        # Без подписки отзывы других воркеров сюда не доходят
+        return not self.synced and self.fail_closed
+
+    def _get(self, key: str) -> User | None:
+        if not self.enabled:
+            return None
+        item = self.local.get(key)
+        if item is None:
+            return None
+        # Каждому запросу свой объект: сессия запроса может его изменить и сохранить
+        user = User(**item[1])
+        make_transient_to_detached(user)
+        return user
+
+    def _set(self, key: str, user: User, expires_in: float | None = None) -> None:
+        snapshot = {column.key: getattr(user, column.key) for column in User.__table__.columns}
+        ttl = self.ttl if expires_in is None else min(self.ttl, expires_in)
+        if self.enabled and ttl > 0:
+            self.local.set(key, (user.id, snapshot), ttl)
+
+    def observe_miss(self, seconds: float) -> None:
+        AUTH_TOKEN_LOOKUP_SECONDS.observe(seconds)
+        self.miss_seconds = seconds if not self.miss_seconds else 0.9 * self.miss_seconds + 0.1 * seconds
+
+    def observe_hit(self) -> None:
+        AUTH_TOKEN_CACHE_REQUESTS.labels(result="hit").inc()
+        AUTH_TOKEN_CACHE_SAVED_SECONDS.inc(self.miss_seconds)
+
+    def drop_local(self, message: str) -> None:
+        kind, _, value = message.partition(":")
+        if kind == "token":
+            self.local.pop(value)
+        elif kind == "user":
+            user_id = int(value)
+            for key, (cached_user_id, _) in self.local.items():
+                if cached_user_id == user_id:
+                    self.local.pop(key)
+        elif kind == "session":
+            self.revoked.set(value, True)
+
+    async def invalidate_token(self, token: str) -> None:
+        await self._invalidate(f"token:{token_key(token)}")
+
+    async def invalidate_user(self, user_id: int) -> None:
+        await self._invalidate(f"user:{user_id}")
+
+    async def revoke_session(self, sid: str) -> None:
+        # Запись в Redis не глотает ошибки: без нее отзыв увидят не все воркеры
+        await self.redis.set(REVOKED_KEY.format(sid), 1, ex=int(self.revoked_ttl))
+        await self._invalidate(f"session:{sid}")
+
+    async def _invalidate(self, message: str) -> None:
+        self.drop_local(message)
+        try:
+            await self.redis.publish(INVALIDATE_CHANNEL, message)
+        except RedisError:
+            logger.warning("Cannot publish token cache invalidation", exc_info=True)
+
+    async def start(self) -> None:
+        self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            await self._sync()
+        except RedisError:
+            logger.error("Token cache disabled: cannot subscribe to invalidations", exc_info=True)
+            await self._pubsub.reset()
+            self._pubsub = None
+            return
+        self._reader = asyncio.create_task(self._read())
+        self.enabled = True
+
+    async def _sync(self) -> None:
+        """(Пере)подписывается на канал и догружает отзывы, пропущенные без подписки."""
+        # Сначала подписка, потом чтение ключей: отзыв между ними придет сообщением
+        await self._pubsub.subscribe(INVALIDATE_CHANNEL)
+        prefix = REVOKED_KEY.format("")
+        cursor = 0
+        while True:
+            cursor, keys = await self.redis.scan(cursor, match=prefix + "*", count=1000)
+            if keys:
+                pipe = self.redis.pipeline(transaction=False)
+                for key in keys:
+                    pipe.ttl(key)
+                for key, ttl in zip(keys, await pipe.execute()):
+                    if ttl > 0:
+                        self.revoked.set(key[len(prefix):], True, ttl)
+            if not cursor:
+                break
+        self.synced = True
+
+    async def stop(self) -> None:
+        self.enabled = False
+        self.synced = False
+        self.local.clear()
+        if self._reader:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+            self._reader = None
+        if self._pubsub:
+            await self._pubsub.reset()
+            self._pubsub = None
+
+    async def _read(self) -> None:
+        while True:
+            try:
+                if not self.synced:
+                    await self._sync()
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=None)
+                if message is not None:
+                    self.drop_local(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Пока канал недоступен, записи могут жить до TTL: сбрасываем все, а
+                # отзывы за это время догрузим из Redis после переподключения
+                logger.error("Cannot read token cache invalidation", exc_info=True)
+                self.synced = False
+                self.local.clear()
+                await asyncio.sleep(1)
+
+
+class CachedDatabaseStrategy(DatabaseStrategy):
+    """DatabaseStrategy, которая сначала ищет пользователя в TokenUserCache."""
+
+    def __init__(self, *args, cache: TokenUserCache, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = cache
+
+    async def read_token(
+        self, token: Optional[str], user_manager: BaseUserManager
+    ) -> Optional[User]:
+        # Строки refresh-токенов JWT лежат в той же таблице, но входом не являются
+        if token is None or token.startswith(REFRESH_TOKEN_PREFIX):
+            return None
+        user = self.cache.get(token)
+        if user is not None:
+            self.cache.observe_hit()
+            return user
+        AUTH_TOKEN_CACHE_REQUESTS.labels(result="miss").inc()
+
+        start = time.perf_counter()
+        max_age = None
+        if self.lifetime_seconds:
+            max_age = datetime.now(timezone.utc) - timedelta(seconds=self.lifetime_seconds)
+        access_token = await self.database.get_by_token(token, max_age)
+        if access_token is None:
+            return None
+        try:
+            user = await user_manager.get(user_manager.parse_id(access_token.user_id))
+        except (exceptions.UserNotExists, exceptions.InvalidID):
+            return None
+        self.cache.observe_miss(time.perf_counter() - start)
+
+        expires_in = None
+        if self.lifetime_seconds:
+            expires_in = (access_token.created_at - max_age).total_seconds()
+        self.cache.set(token, user, expires_in)
+        return user
+
+    async def destroy_token(self, token: str, user: User) -> None:
+        await super().destroy_token(token, user)
+        await self.cache.invalidate_token(token)
+
+
+token_user_cache = TokenUserCache(
+    default_redis,
+    maxsize=settings.AUTH_TOKEN_CACHE_SIZE,
+    ttl=settings.AUTH_TOKEN_CACHE_TTL,
+    revoked_ttl=settings.JWT_ACCESS_LIFETIME,
+    revoked_maxsize=settings.AUTH_REVOKED_CACHE_SIZE,
+    fail_closed=settings.AUTH_REVOCATION_FAIL_CLOSED,
+)
@@ -1,9 +1,10 @@
-from typing import Optional
+from typing import Any, Dict, Optional
 
 from fastapi import Depends, Request, Response
 from fastapi_users import BaseUserManager, IntegerIDMixin
 from fastapi_users_db_sqlalchemy import SQLAlchemyUserDatabase
 
+from app.auth.token_cache import token_user_cache
 from app.config import settings
 from app.doctor.dao import DoctorDAO
 from app.logger import logger
@@ -45,6 +46,22 @@ class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
         self, user: User, request: Optional[Request] = None
     ) -> None:
         logger.info(f"User {user.id} has been verified.")
+        await token_user_cache.invalidate_user(user.id)
+
+    async def on_after_update(
+        self, user: User, update_dict: Dict[str, Any], request: Optional[Request] = None
+    ) -> None:
+        await token_user_cache.invalidate_user(user.id)
+
+    async def on_after_reset_password(
+        self, user: User, request: Optional[Request] = None
+    ) -> None:
+        await token_user_cache.invalidate_user(user.id)
+
+    async def on_after_delete(
+        self, user: User, request: Optional[Request] = None
+    ) -> None:
+        await token_user_cache.invalidate_user(user.id)
 
 
 async def get_user_manager(user_db: SQLAlchemyUserDatabase = Depends(get_user_db)):
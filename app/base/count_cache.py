@@ -0,0 +1,66 @@
+"""
+Кэш результатов COUNT в Redis для CountStrategy.cached.
+
+Ключ count:{hash запроса}:{версии таблиц запроса}, версия таблицы - счетчик
+count:{table}:v. Любая запись в таблицу увеличивает счетчик (см. обработчики событий
+сессии в app.database), и все закэшированные подсчеты с этой таблицей разом
+становятся недоступны, а старые ключи истекают по TTL. Ошибки Redis не ломают подсчет:
+кэш просто пропускается.
+"""
+import hashlib
+
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.logger import logger
+from app.redis_client import redis as default_redis
+
+KEY_PREFIX = "count:"
+
+
+class RowCountCache:
+    def __init__(self, redis: aioredis.Redis, ttl: int):
+        self.redis = redis
+        self.ttl = ttl
+
+    @staticmethod
+    def _version_key(table: str) -> str:
+        return f"{KEY_PREFIX}{table}:v"
+
+    @staticmethod
+    def query_hash(sql: str) -> str:
+        return hashlib.sha1(sql.encode()).hexdigest()
+
+    async def get(self, tables: list[str], query_hash: str) -> tuple[int | None, str | None]:
+        """Закэшированное число строк (или None) и ключ, под которым его сохранить."""
+        try:
+            versions = await self.redis.mget([self._version_key(table) for table in tables])
+            key = f"{KEY_PREFIX}{query_hash}:" + ":".join(version or "0" for version in versions)
+            value = await self.redis.get(key)
+        except RedisError:
+            logger.warning("Row count cache unavailable", exc_info=True)
+            return None, None
+        return (int(value) if value is not None else None), key
+
+    async def set(self, key: str | None, count: int) -> None:
+        if key is None:
+            return
+        try:
+            await self.redis.set(key, count, ex=self.ttl)
+        except RedisError:
+            logger.warning("Row count cache unavailable", exc_info=True)
+
+    async def invalidate(self, *tables: str) -> None:
+        if not tables:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for table in tables:
+                pipe.incr(self._version_key(table))
+            await pipe.execute()
+        except RedisError:
+            logger.warning("Cannot invalidate row count cache", extra={"tables": list(tables)}, exc_info=True)
+
+
+row_count_cache = RowCountCache(default_redis, ttl=settings.COUNT_CACHE_TTL)
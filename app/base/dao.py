@@ -1,14 +1,20 @@
+import json
 from enum import Enum
-from typing import Any, Generic, TypeVar
+from typing import Any, Generic, Iterable, TypeVar
 
 from fastapi import HTTPException
-from fastapi_pagination import Page, Params
-from fastapi_pagination.ext.async_sqlalchemy import paginate
+from fastapi_pagination import Params
 from pydantic import BaseModel
-from sqlalchemy import Select, delete, exc, func, insert, select
+from sqlalchemy import JSON, Select, delete, exc, func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.util import find_tables
 
+from app.base.count_cache import row_count_cache
+from app.base.schemas import CountedPage, CountStrategy, SBulkChunkError, SBulkInsertResult
+from app.config import settings
 from app.logger import logger
-from app.database import BaseAlchemyModel, async_session_maker
+from app.database import BaseAlchemyModel, commit, get_read_session, get_session, mark_written, rollback
+from app.utils import batched
 
 ModelType = TypeVar("ModelType", bound=BaseAlchemyModel)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
@@ -27,7 +33,7 @@ class BaseDAO(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
 
     @classmethod
     async def get_one_or_none(cls, *, id: int) -> ModelType | None:
-        async with async_session_maker() as session:
+        async with get_read_session() as session:
             query = select(cls.model).where(cls.model.id == id)
             response = await session.execute(query)
             return response.scalar_one_or_none()
@@ -35,26 +41,87 @@ class BaseDAO(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
 
     @classmethod
     async def find_one_or_none(cls, **filter_by):
-        async with async_session_maker() as session:
+        async with get_read_session() as session:
             query = select(cls.model.__table__.columns).filter_by(**filter_by)
             result = await session.execute(query)
             return result.mappings().one_or_none()
 
     @classmethod
     async def get_by_ids(cls, *, list_ids: list[int]) -> list[ModelType] | None:
-        async with async_session_maker() as session:
+        async with get_read_session() as session:
             response = await session.execute(
                 select(cls.model).where(cls.model.id.in_(list_ids))
             )
             return response.scalars().all()
 
     @classmethod
-    async def get_count(cls) -> ModelType | None:
-        async with async_session_maker() as session:
-            response = await session.execute(
-                select(func.count()).select_from(select(cls.model).subquery())
+    async def get_count(
+        cls,
+        *,
+        strategy: CountStrategy = CountStrategy.exact,
+        query: Select | None = None,
+    ) -> int:
+        """Число строк таблицы модели или запроса query, см. CountStrategy."""
+        count, _ = await cls._count(strategy, query)
+        return count
+
+    @classmethod
+    async def _count(cls, strategy: CountStrategy, query: Select | None) -> tuple[int, CountStrategy]:
+        """Число строк и стратегия, которой оно на самом деле посчитано."""
+        if query is None:
+            count_query = select(func.count()).select_from(cls.model)
+        else:
+            count_query = select(func.count()).select_from(query.order_by(None).subquery())
+
+        async with get_read_session() as session:
+            if strategy == CountStrategy.estimate:
+                estimate = await cls._estimate_count(session, query)
+                # Маленькие таблицы и результаты дешевле посчитать точно
+                if estimate is not None and estimate >= settings.COUNT_ESTIMATE_EXACT_BELOW:
+                    return estimate, strategy
+                return (await session.execute(count_query)).scalar_one(), CountStrategy.exact
+
+            if strategy == CountStrategy.cached:
+                compiled = count_query.compile(dialect=session.get_bind().dialect)
+                query_hash = row_count_cache.query_hash(f"{compiled.string}{sorted(compiled.params.items())!r}")
+                tables = sorted({table.name for table in find_tables(count_query, include_joins=True)})
+                count, key = await row_count_cache.get(tables, query_hash)
+                if count is None:
+                    count = (await session.execute(count_query)).scalar_one()
+                    await row_count_cache.set(key, count)
+                return count, strategy
+
+            return (await session.execute(count_query)).scalar_one(), CountStrategy.exact
+
+    @classmethod
+    async def _estimate_count(cls, session: AsyncSession, query: Select | None) -> int | None:
+        """Оценка числа строк без чтения таблицы или None, если оценки нет."""
+        dialect = session.get_bind().dialect
+        if dialect.name != "postgresql":
+            return None
+        if query is None:
+            # reltuples устаревает между ANALYZE: масштабируем плотность на текущий размер таблицы
+            table = dialect.identifier_preparer.format_table(cls.model.__table__)
+            estimate = await session.scalar(
+                text(
+                    "SELECT (CASE WHEN c.reltuples < 0 OR c.relpages = 0 THEN NULL "
+                    "ELSE c.reltuples / c.relpages "
+                    "* (pg_relation_size(c.oid) / current_setting('block_size')::int) END)::bigint "
+                    "FROM pg_class c WHERE c.oid = to_regclass(:table)"
+                ),
+                {"table": table},
             )
-            return response.scalar_one()
+            return estimate
+        try:
+            sql = query.compile(dialect=dialect, compile_kwargs={"literal_binds": True}).string
+        except exc.CompileError:
+            return None
+        # Не text(): SQL с подставленными значениями не должен разбираться на :параметры
+        connection = await session.connection()
+        plan = (await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
 
     @classmethod
     async def get_multi(
@@ -64,7 +131,7 @@ class BaseDAO(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         limit: int = 100,
         query: T | Select[T] | None = None
     ) -> list[ModelType]:
-        async with async_session_maker() as session:
+        async with get_read_session() as session:
             if query is None:
                 query = select(cls.model).offset(skip).limit(limit).order_by(cls.model.id)
             response = await session.execute(query)
@@ -76,11 +143,9 @@ class BaseDAO(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         *,
         params: Params | None = Params(),
         query: T | Select[T] | None = None,
-    ) -> Page[ModelType]:
-        async with async_session_maker() as session:
-            if query is None:
-                query = select(cls.model)
-            return await paginate(session, query, params)
+        count_strategy: CountStrategy = CountStrategy.exact,
+    ) -> CountedPage[ModelType]:
+        return await cls._paginate(params, query, query, count_strategy)
 
     @classmethod
     async def get_multi_paginated_ordered(
@@ -90,18 +155,36 @@ class BaseDAO(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         order_by: str | None = None,
         order: IOrderEnum | None = IOrderEnum.ascendent,
         query: T | Select[T] | None = None,
-    ) -> Page[ModelType]:
-        async with async_session_maker() as session:
-            columns = cls.model.__table__.columns
-            if order_by is None or order_by not in columns:
-                order_by = "id"
-            if query is None:
-                if order == IOrderEnum.ascendent:
-                    query = select(cls.model).order_by(columns[order_by].asc())
-                else:
-                    query = select(cls.model).order_by(columns[order_by].desc())
+        count_strategy: CountStrategy = CountStrategy.exact,
+    ) -> CountedPage[ModelType]:
+        columns = cls.model.__table__.columns
+        if order_by is None or order_by not in columns:
+            order_by = "id"
+        ordered = query
+        if query is None:
+            if order == IOrderEnum.ascendent:
+                ordered = select(cls.model).order_by(columns[order_by].asc())
+            else:
+                ordered = select(cls.model).order_by(columns[order_by].desc())
+        # Считаются строки исходного запроса: без него - вся таблица, что для оценки дешевле EXPLAIN
+        return await cls._paginate(params, ordered, query, count_strategy)
 
-            return await paginate(session, query, params)
+    @classmethod
+    async def _paginate(
+        cls,
+        params: Params,
+        query: Select | None,
+        count_query: Select | None,
+        count_strategy: CountStrategy,
+    ) -> CountedPage[ModelType]:
+        total, strategy = await cls._count(count_strategy, count_query)
+        raw_params = params.to_raw_params().as_limit_offset()
+        async with get_read_session() as session:
+            if query is None:
+                query = select(cls.model)
+            response = await session.execute(query.limit(raw_params.limit).offset(raw_params.offset))
+            items = response.unique().scalars().all()
+        return CountedPage.create(items, params, total=total, count_strategy=strategy)
 
     @classmethod
     async def get_multi_ordered(
@@ -112,7 +195,7 @@ class BaseDAO(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         order_by: str | None = None,
         order: IOrderEnum | None = IOrderEnum.ascendent,
     ) -> list[ModelType]:
-        async with async_session_maker() as session:
+        async with get_read_session() as session:
             columns = cls.model.__table__.columns
             if order_by is None or order_by not in columns:
                 order_by = "id"
@@ -142,14 +225,14 @@ class BaseDAO(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         created_by_id: int | str | None = None,
     ) -> ModelType:
         db_obj = cls.model.from_orm(obj_in)  # type: ignore
-        async with async_session_maker() as session:
+        async with get_session() as session:
             if created_by_id:
                 db_obj.created_by_id = created_by_id
             try:
                 session.add(db_obj)
-                await session.commit()
+                await commit(session)
             except exc.IntegrityError:
-                session.rollback()
+                await rollback(session)
                 raise HTTPException(
                     status_code=409,
                     detail="Resource already exists",
@@ -164,7 +247,7 @@ class BaseDAO(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         obj_current: ModelType,
         obj_new: UpdateSchemaType | dict[str, Any] | ModelType,
     ) -> ModelType:
-        async with async_session_maker() as session:
+        async with get_session() as session:
             if isinstance(obj_new, dict):
                 update_data = obj_new
             else:
@@ -173,34 +256,34 @@ class BaseDAO(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
                 setattr(obj_current, field, update_data[field])
 
             session.add(obj_current)
-            await session.commit()
+            await commit(session)
             await session.refresh(obj_current)
             return obj_current
 
     @classmethod
     async def delete(cls, *, id: int) -> ModelType:
-        async with async_session_maker() as session:
+        async with get_session() as session:
             response = await session.execute(
                 select(cls.model).where(cls.model.id == id)
             )
             obj = response.scalar_one()
             await session.delete(obj)
-            await session.commit()
+            await commit(session)
             return obj
 
     @classmethod
     async def delete_all(cls) -> None:
-        async with async_session_maker() as session:
+        async with get_session() as session:
             await session.execute(delete(cls.model))
-            await session.commit()
+            await commit(session)
 
     @classmethod
     async def add(cls, **data):
         try:
             query = insert(cls.model).values(**data)#.returning(cls.model.id)
-            async with async_session_maker() as session:
+            async with get_session() as session:
                 result = await session.execute(query)
-                await session.commit()
+                await commit(session)
                 return result.mappings().first()
         except (Exception) as e:
             msg = "Unknown Exc: Cannot insert data into table"
@@ -209,22 +292,90 @@ class BaseDAO(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         
 
 
-    # @classmethod
-    # async def add_bulk(cls, *data):
-    #     # Для загрузки массива данных [{"id": 1}, {"id": 2}]
-    #     # мы должны обрабатывать его через позиционные аргументы *args.
-    #     try:
-    #         query = insert(cls.model).values(*data).returning(cls.model.id)
-    #         async with async_session_maker() as session:
-    #             result = await session.execute(query)
-    #             await session.commit()
-    #             return result.mappings().first()
-    #     except (SQLAlchemyError, Exception) as e:
-    #         if isinstance(e, SQLAlchemyError):
-    #             msg = "Database Exc"
-    #         elif isinstance(e, Exception):
-    #             msg = "Unknown Exc"
-    #         msg += ": Cannot bulk insert data into table"
-
-    #         logger.error(msg, extra={"table": cls.model.__tablename__}, exc_info=True)
-    #         return None
+    @classmethod
+    async def add_bulk(
+        cls, data: Iterable[dict[str, Any]], chunk_size: int | None = None
+    ) -> SBulkInsertResult:
+        """Вставляет строки пачками по chunk_size (по умолчанию DB_BULK_CHUNK_SIZE).
+
+        На asyncpg пачка загружается через COPY (copy_records_to_table), на других
+        драйверах - INSERT с executemany. Каждая пачка идет в своем SAVEPOINT: ошибочная
+        пачка попадает в errors, остальные вставляются. data читается по мере вставки,
+        поэтому может быть генератором.
+        """
+        result = SBulkInsertResult()
+        table = cls.model.__table__
+        async with get_session() as session:
+            use_copy = session.get_bind().dialect.driver == "asyncpg"
+            with_ids = False
+            first_row = 0
+            for number, chunk in enumerate(batched(data, chunk_size or settings.DB_BULK_CHUNK_SIZE)):
+                try:
+                    async with session.begin_nested():
+                        if use_copy:
+                            await cls._copy_chunk(session, chunk)
+                        else:
+                            await session.execute(insert(table), chunk)
+                except Exception as e:
+                    logger.warning(
+                        "Cannot bulk insert chunk",
+                        extra={"table": table.name, "chunk": number},
+                        exc_info=True,
+                    )
+                    result.errors.append(
+                        SBulkChunkError(chunk=number, first_row=first_row, rows=len(chunk), error=str(e))
+                    )
+                else:
+                    result.inserted += len(chunk)
+                    with_ids = with_ids or "id" in chunk[0]
+                first_row += len(chunk)
+            if with_ids and "id" in table.c:
+                await cls._sync_id_sequence(session)
+            await commit(session)
+        return result
+
+    @classmethod
+    async def _copy_chunk(cls, session: AsyncSession, rows: list[dict[str, Any]]) -> None:
+        # COPY не применяет значения по умолчанию из модели: подставляем их сами,
+        # а колонки без значений оставляем серверу (например, serial id)
+        table = cls.model.__table__
+        keys = set().union(*rows)
+        defaults = {
+            column.key: column.default
+            for column in table.columns
+            if column.default is not None and (column.default.is_scalar or column.default.is_callable)
+        }
+        columns = [column for column in table.columns if column.key in keys or column.key in defaults]
+        json_keys = {column.key for column in columns if isinstance(column.type, JSON)}
+
+        def value(row: dict[str, Any], key: str) -> Any:
+            if key not in row and key in defaults:
+                default = defaults[key]
+                return default.arg if default.is_scalar else default.arg(None)
+            item = row.get(key)
+            if key in json_keys and item is not None and not isinstance(item, str):
+                return json.dumps(item)
+            return item
+
+        records = [tuple(value(row, column.key) for column in columns) for row in rows]
+        mark_written(session, table.name)
+        connection = await session.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            table.name,
+            records=records,
+            columns=[column.name for column in columns],
+            schema_name=table.schema,
+        )
+
+    @classmethod
+    async def _sync_id_sequence(cls, session: AsyncSession) -> None:
+        """После вставки с явными id сдвигает последовательность за максимальный id."""
+        table = cls.model.__table__
+        quoted = session.get_bind().dialect.identifier_preparer.format_table(table)
+        await session.execute(
+            select(func.setval(
+                func.pg_get_serial_sequence(quoted, "id"),
+                select(func.max(table.c.id)).scalar_subquery(),
+            ))
+        )
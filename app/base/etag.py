@@ -0,0 +1,30 @@
+"""
+Слабые ETag и условные GET (If-None-Match -> 304).
+
+ETag строится из дешевого ключа версии (версии строк, id последнего сообщения и т.п.),
+который читается до основного запроса. Если клиент прислал совпадающий ETag, ответ 304
+отдается без основного запроса и без сериализации тела.
+"""
+import hashlib
+
+from fastapi import Request, Response, status
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha1(":".join(map(str, parts)).encode()).hexdigest()[:32]
+    return f'W/"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Совпадает ли etag с If-None-Match (слабое сравнение, RFC 9110)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
@@ -0,0 +1,34 @@
+from enum import Enum
+from typing import Generic, TypeVar
+
+from fastapi_pagination import Page
+from pydantic import BaseModel
+
+T = TypeVar("T")
+
+
+class CountStrategy(str, Enum):
+    # COUNT(*) по запросу
+    exact = "exact"
+    # оценка планировщика: pg_class.reltuples для всей таблицы, EXPLAIN для запроса
+    estimate = "estimate"
+    # точный COUNT, закэшированный в Redis до записи в таблицы запроса или TTL
+    cached = "cached"
+
+
+class CountedPage(Page[T], Generic[T]):
+    """Страница fastapi-pagination с указанием, как посчитан total."""
+    count_strategy: CountStrategy
+
+
+class SBulkChunkError(BaseModel):
+    # номер пачки и номер ее первой строки во входных данных (с нуля)
+    chunk: int
+    first_row: int
+    rows: int
+    error: str
+
+
+class SBulkInsertResult(BaseModel):
+    inserted: int = 0
+    errors: list[SBulkChunkError] = []
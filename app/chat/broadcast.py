@@ -0,0 +1,125 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable
+
+from redis import asyncio as aioredis
+
+from app.config import settings
+from app.logger import logger
+
+# Обработчик доставки: получает id чата и уже сериализованное сообщение
+DeliverHandler = Callable[[int, str], Awaitable[None]]
+
+
+class BroadcastBackend(ABC):
+    """Рассылка сообщений чата между воркерами.
+
+    Воркер подписывается только на те чаты, к которым у него есть открытые сокеты,
+    и получает через handler сообщения, опубликованные любым воркером.
+    """
+
+    def __init__(self):
+        self._handler: DeliverHandler | None = None
+
+    async def start(self, handler: DeliverHandler) -> None:
+        self._handler = handler
+
+    async def stop(self) -> None:
+        self._handler = None
+
+    @abstractmethod
+    async def subscribe(self, chat_id: int) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def unsubscribe(self, chat_id: int) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def publish(self, chat_id: int, payload: str) -> None:
+        raise NotImplementedError
+
+
+class MemoryBroadcastBackend(BroadcastBackend):
+    """Рассылка внутри одного процесса. Используется в тестах и при одном воркере."""
+
+    def __init__(self):
+        super().__init__()
+        self._chats: set[int] = set()
+
+    async def subscribe(self, chat_id: int) -> None:
+        self._chats.add(chat_id)
+
+    async def unsubscribe(self, chat_id: int) -> None:
+        self._chats.discard(chat_id)
+
+    async def publish(self, chat_id: int, payload: str) -> None:
+        if self._handler and chat_id in self._chats:
+            await self._handler(chat_id, payload)
+
+
+class RedisBroadcastBackend(BroadcastBackend):
+    """Рассылка через Redis pub/sub: канал на каждый чат, один подписчик на воркер."""
+
+    CHANNEL_PREFIX = "chat:"
+    # Служебный канал, чтобы у подписчика было соединение еще до первого чата
+    CONTROL_CHANNEL = "chat-broadcast:control"
+
+    def __init__(self, redis: aioredis.Redis):
+        super().__init__()
+        self.redis = redis
+        self._pubsub = None
+        self._reader: asyncio.Task | None = None
+
+    def channel(self, chat_id: int) -> str:
+        return f"{self.CHANNEL_PREFIX}{chat_id}"
+
+    async def start(self, handler: DeliverHandler) -> None:
+        await super().start(handler)
+        self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(self.CONTROL_CHANNEL)
+        self._reader = asyncio.create_task(self._read())
+
+    async def stop(self) -> None:
+        if self._reader:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+            self._reader = None
+        if self._pubsub:
+            await self._pubsub.reset()
+            self._pubsub = None
+        await super().stop()
+
+    async def subscribe(self, chat_id: int) -> None:
+        await self._pubsub.subscribe(self.channel(chat_id))
+
+    async def unsubscribe(self, chat_id: int) -> None:
+        await self._pubsub.unsubscribe(self.channel(chat_id))
+
+    async def publish(self, chat_id: int, payload: str) -> None:
+        await self.redis.publish(self.channel(chat_id), payload)
+
+    async def _read(self) -> None:
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=None)
+                if message is None or not message["channel"].startswith(self.CHANNEL_PREFIX):
+                    continue
+                chat_id = int(message["channel"][len(self.CHANNEL_PREFIX):])
+                await self._handler(chat_id, message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.error("Cannot deliver broadcast message", exc_info=True)
+                await asyncio.sleep(1)
+
+
+def get_broadcast_backend() -> BroadcastBackend:
+    if settings.MODE == "TEST" or settings.WS_BROADCAST_BACKEND == "memory":
+        return MemoryBroadcastBackend()
+
+    from app.redis_client import redis
+    return RedisBroadcastBackend(redis)
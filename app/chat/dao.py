@@ -1,71 +1,130 @@
-from datetime import date
+from datetime import date, datetime
 import json
 from fastapi import HTTPException
 
-from sqlalchemy import and_, desc, func, insert, or_, select, update, text
+from sqlalchemy import (
+    DateTime, Integer, Select, String, and_, case, column, desc, func, insert, literal, or_, select, true, tuple_, update,
+    text, values
+)
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert as pg_insert
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload, selectinload
 
+from app.base.cache import TTLCache
 from app.base.dao import BaseDAO
-from app.chat.model import Chat
-from app.chat.schemas import SChatCreate, SChatForList, SChatUpdate, SMessage, SChat, SMessageCreate, SMessageUpdate
-from app.database import async_session_maker, engine
+from app.chat.model import Chat, ChatSummary
+from app.chat.tail_cache import message_tail_cache
+from app.chat.schemas import (
+    SChatCreate, SChatForList, SChatSummary, SChatUpdate, SMessage, SMessagePage, SChat, SMessageCreate,
+    SMessageUpdate, SReadState
+)
+from app.config import settings
+from app.database import after_commit, commit, engine, get_read_session, get_session, mark_written
+from app.exceptions import ChatAccessDeniedException, ChatNotFoundException, IncorrectCursorException
 from app.logger import logger
 from app.chat.model import Message
 from app.user.model import User
+from app.utils import decode_cursor, encode_cursor
 
 
 class ChatDAO(BaseDAO[Chat, SChatCreate, SChatUpdate]):
     model = Chat
+    # (chat_id, user_id) -> чат, в котором пользователь участник
+    membership_cache: TTLCache[tuple[int, int], SChat] = TTLCache(
+        settings.CHAT_MEMBERSHIP_CACHE_SIZE, settings.CHAT_MEMBERSHIP_CACHE_TTL
+    )
 
     @classmethod
     async def get_chats_list_by_user_id(cls, user_id: int) -> list[SChatForList]:
-        async with async_session_maker() as session:
-            # Получим чаты, где текущий пользователь является user1 или user2
-            stmt = select(Chat).filter((Chat.user1_id == user_id) | (Chat.user2_id == user_id))
+        # Собеседник, последнее сообщение и счетчик непрочитанных берутся одним
+        # запросом: последнее сообщение и счетчики хранятся в chat_summary,
+        # поэтому таблица message здесь не читается вовсе.
+        is_user1 = Chat.user1_id == user_id
+        other_user_id = case((is_user1, Chat.user2_id), else_=Chat.user1_id)
+        # Последнее сообщение прочитано, если у получателя нет непрочитанных
+        last_message_is_read = case(
+            (ChatSummary.last_message_sender_id == Chat.user1_id, ChatSummary.user2_unread == 0),
+            else_=ChatSummary.user1_unread == 0,
+        )
+        stmt = (
+            select(
+                Chat.id.label("chat_id"),
+                User.id.label("other_user_id"),
+                User.name.label("other_user_name"),
+                User.image_path.label("other_user_image"),
+                ChatSummary.last_message_id,
+                ChatSummary.last_message_preview,
+                ChatSummary.last_message_at,
+                ChatSummary.last_message_sender_id,
+                last_message_is_read.label("last_message_is_read"),
+                func.coalesce(
+                    case((is_user1, ChatSummary.user1_unread), else_=ChatSummary.user2_unread), 0
+                ).label("unread_count"),
+            )
+            .join(User, User.id == other_user_id)
+            .outerjoin(ChatSummary, ChatSummary.chat_id == Chat.id)
+            .where(or_(Chat.user1_id == user_id, Chat.user2_id == user_id))
+            .order_by(ChatSummary.last_message_at.desc().nulls_last(), Chat.id.desc())
+        )
+
+        async with get_read_session() as session:
             result = await session.execute(stmt)
-            user_chats = result.scalars().all()
-
-            chat_list = []
-            for chat in user_chats:
-                # Определите user_id собеседника
-                interlocutor_id = chat.user2_id if chat.user1_id == user_id else chat.user1_id
-                interlocutor = await session.get(User, interlocutor_id)
-
-                stmt = text(
-                    """
-                    SELECT * FROM message
-                    WHERE chat_id = :chat_id
-                    ORDER BY timestamp DESC
-                    LIMIT 1
-                    """
-                ).bindparams(chat_id=chat.id)
-                result = await session.execute(stmt)
-                last_message = result.first()
-
-                chat_data = SChatForList(
-                    chat_id=chat.id,
-                    other_user_id=interlocutor.id,
-                    other_user_name=interlocutor.name,
-                    other_user_image=interlocutor.image_path,
-                    last_message=SMessage(
-                        id=last_message.id if last_message else None,
-                        content=last_message.content if last_message else None,
-                        chat_id=last_message.chat_id if last_message else None,
-                        timestamp=last_message.timestamp if last_message else None,
-                        sender_id=last_message.sender_id if last_message else None,
-                        is_read=last_message.is_read if last_message else None,
-                    ) if last_message else None
-                )
-                
-                chat_list.append(chat_data)
+            rows = result.all()
 
-        return chat_list
+        return [
+            SChatForList(
+                chat_id=row.chat_id,
+                other_user_id=row.other_user_id,
+                other_user_name=row.other_user_name,
+                other_user_image=row.other_user_image,
+                last_message=SMessage(
+                    id=row.last_message_id,
+                    content=row.last_message_preview,
+                    chat_id=row.chat_id,
+                    timestamp=row.last_message_at,
+                    sender_id=row.last_message_sender_id,
+                    is_read=row.last_message_is_read,
+                ) if row.last_message_id is not None else None,
+                unread_count=row.unread_count,
+            )
+            for row in rows
+        ]
+
+
+    @classmethod
+    async def get_chats_list_version(cls, user_id: int) -> str | None:
+        """Отпечаток списка чатов пользователя для ETag.
+
+        Меняется вместе с любым полем get_chats_list_by_user_id: версии чатов и
+        собеседников, последнее сообщение и счетчики непрочитанных. Считается в БД
+        по тем же индексам, но без сортировки и передачи строк списка.
+        """
+        other_user_id = case((Chat.user1_id == user_id, Chat.user2_id), else_=Chat.user1_id)
+        fingerprint = func.concat_ws(
+            ":",
+            Chat.id,
+            Chat.version,
+            User.version,
+            func.coalesce(ChatSummary.last_message_id, 0),
+            func.coalesce(ChatSummary.user1_unread, 0),
+            func.coalesce(ChatSummary.user2_unread, 0),
+        )
+        stmt = (
+            select(func.md5(func.string_agg(fingerprint, aggregate_order_by(literal(","), Chat.id))))
+            .select_from(Chat)
+            .join(User, User.id == other_user_id)
+            .outerjoin(ChatSummary, ChatSummary.chat_id == Chat.id)
+            .where(or_(Chat.user1_id == user_id, Chat.user2_id == user_id))
+        )
+        async with get_read_session() as session:
+            return await session.scalar(stmt)
 
 
     @classmethod
     async def chat_exists(cls, user1_id: int, user2_id: int):
-        async with async_session_maker() as session:
+        # Проверка перед созданием чата: с реплики можно не увидеть только что созданный
+        async with get_session() as session:
             # Проверим, существует ли уже чат между указанными пользователями
             stmt = (
                 select(Chat)
@@ -81,7 +140,7 @@ class ChatDAO(BaseDAO[Chat, SChatCreate, SChatUpdate]):
 
     @classmethod
     async def chat_exists_by_id(cls, chat_id: int) -> Chat:
-        async with async_session_maker() as session:
+        async with get_read_session() as session:
             stmt = (
                 select(Chat)
                 .where(Chat.id == chat_id)
@@ -93,7 +152,7 @@ class ChatDAO(BaseDAO[Chat, SChatCreate, SChatUpdate]):
 
     @classmethod
     async def get_massages(cls, chat_id: int, count: int = 20):
-        async with async_session_maker() as session:
+        async with get_read_session() as session:
 
             stmt = (
                 select(Message)
@@ -111,5 +170,555 @@ class ChatDAO(BaseDAO[Chat, SChatCreate, SChatUpdate]):
         return messages
 
 
+    @staticmethod
+    def _message_cursor(message: Message | SMessage) -> str:
+        return encode_cursor(message.timestamp, message.id)
+
+    @staticmethod
+    def _parse_message_cursor(cursor: str) -> tuple[datetime, int]:
+        try:
+            timestamp, message_id = decode_cursor(cursor)
+            return datetime.fromisoformat(timestamp), int(message_id)
+        except (ValueError, TypeError):
+            raise IncorrectCursorException
+
+    @classmethod
+    async def get_member_chat(cls, chat_id: int, user_id: int) -> SChat:
+        """Чат, если user_id - его участник. Подтвержденное участие кэшируется."""
+        chat = cls.membership_cache.get((chat_id, user_id))
+        if chat is not None:
+            return chat
+        async with get_read_session() as session:
+            result = await session.execute(select(Chat).where(Chat.id == chat_id))
+            chat = result.scalar_one_or_none()
+        if chat is None:
+            raise ChatNotFoundException
+        if user_id not in (chat.user1_id, chat.user2_id):
+            raise ChatAccessDeniedException
+        chat = SChat.model_validate(chat)
+        cls.membership_cache.set((chat_id, user_id), chat)
+        return chat
+
+    @classmethod
+    async def get_messages_page(
+        cls,
+        chat_id: int,
+        limit: int = 50,
+        before: str | None = None,
+        after: str | None = None,
+        member_id: int | None = None,
+    ) -> SMessagePage:
+        """Страница истории по ключу (timestamp, id), индекс message(chat_id, timestamp, id).
+
+        Без курсоров возвращает последние limit сообщений, с before - более старые,
+        с after - более новые. Сообщения в странице всегда идут по возрастанию времени.
+        Последняя страница (открытие чата) отдается из кэша хвоста, если помещается в него.
+
+        С member_id участие пользователя в чате проверяется тем же запросом, что читает
+        сообщения (ChatNotFoundException / ChatAccessDeniedException), поэтому открытие
+        чата - один запрос к БД, а при попадании в кэши - ни одного.
+        """
+        if member_id is not None and cls.membership_cache.get((chat_id, member_id)) is not None:
+            member_id = None
+        latest = before is None and after is None and limit <= message_tail_cache.size
+        if latest:
+            if member_id is None:
+                tail = await message_tail_cache.get(chat_id)
+                if tail is not None:
+                    return cls._tail_page(tail, limit)
+            version = await message_tail_cache.get_version(chat_id)
+
+        key = tuple_(Message.timestamp, Message.id)
+        # Чат присоединяется всегда: строка без сообщения отличает пустой чат от несуществующего
+        join_on = Message.chat_id == Chat.id
+        if member_id is not None:
+            join_on &= or_(Chat.user1_id == member_id, Chat.user2_id == member_id)
+        if after is not None:
+            join_on &= key > tuple_(*cls._parse_message_cursor(after))
+            order_by = (Message.timestamp, Message.id)
+        else:
+            if before is not None:
+                join_on &= key < tuple_(*cls._parse_message_cursor(before))
+            order_by = (Message.timestamp.desc(), Message.id.desc())
+        stmt = (
+            select(Chat, Message)
+            .outerjoin(Message, join_on)
+            .options(joinedload(Message.attachments))
+            .where(Chat.id == chat_id)
+            .order_by(*order_by)
+            # Лишняя строка показывает, есть ли сообщения за пределами страницы
+            .limit((message_tail_cache.size if latest else limit) + 1)
+        )
+
+        async with get_read_session() as session:
+            result = await session.execute(stmt)
+            rows = result.unique().all()
+            # Реплика может еще не видеть сообщений, уже учтенных версией хвоста
+            from_replica = "replica" in session.info
+
+        if not rows:
+            raise ChatNotFoundException
+        chat = rows[0][0]
+        if member_id is not None:
+            if member_id not in (chat.user1_id, chat.user2_id):
+                raise ChatAccessDeniedException
+            cls.membership_cache.set((chat_id, member_id), SChat.model_validate(chat))
+        messages = [message for _, message in rows if message is not None]
+
+        if latest:
+            tail = [SMessage.model_validate(message) for message in messages]
+            if not from_replica:
+                await message_tail_cache.fill(chat_id, version, tail)
+            return cls._tail_page(tail, limit)
+
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        if after is None:
+            messages.reverse()
+            has_older, has_newer = has_more, before is not None
+        else:
+            has_older, has_newer = True, has_more
+
+        return SMessagePage(
+            items=messages,
+            prev_cursor=cls._message_cursor(messages[0]) if messages and has_older else None,
+            next_cursor=cls._message_cursor(messages[-1]) if messages and has_newer else None,
+        )
+
+    @classmethod
+    def _tail_page(cls, tail: list[SMessage], limit: int) -> SMessagePage:
+        """Последняя страница из хвоста чата (сообщения от новых к старым)."""
+        # Сообщения разных воркеров могли попасть в кэш не в порядке времени
+        tail = sorted(tail, key=lambda message: (message.timestamp, message.id), reverse=True)
+        messages = tail[:limit]
+        messages.reverse()
+        return SMessagePage(
+            items=messages,
+            prev_cursor=cls._message_cursor(messages[0]) if len(tail) > limit else None,
+            next_cursor=None,
+        )
+
+    @classmethod
+    async def read_messages(
+        cls, chat_id: int, user_id: int, up_to: int | None = None
+    ) -> SReadState | None:
+        """Сдвигает отметку прочтения пользователя до последнего сообщения (или до up_to).
+
+        Отметка в chat, флаги is_read и счетчик в chat_summary обновляются одним
+        запросом (data-modifying CTE). Возвращает None, если пользователь не участник чата.
+        """
+        watermark = select(func.max(Message.id)).where(Message.chat_id == chat_id)
+        if up_to is not None:
+            watermark = watermark.where(Message.id <= up_to)
+        watermark = watermark.scalar_subquery()
+
+        is_user1 = Chat.user1_id == user_id
+        is_user2 = Chat.user2_id == user_id
+        # greatest() игнорирует NULL, поэтому отметка только растет
+        read_chat = (
+            update(Chat)
+            .where(Chat.id == chat_id, or_(is_user1, is_user2))
+            .values(
+                user1_last_read_id=case(
+                    (is_user1, func.greatest(Chat.user1_last_read_id, watermark)),
+                    else_=Chat.user1_last_read_id,
+                ),
+                user2_last_read_id=case(
+                    (is_user2, func.greatest(Chat.user2_last_read_id, watermark)),
+                    else_=Chat.user2_last_read_id,
+                ),
+            )
+            .returning(
+                Chat.id,
+                Chat.user1_id,
+                case(
+                    (is_user1, Chat.user1_last_read_id), else_=Chat.user2_last_read_id
+                ).label("last_read_id"),
+            )
+            .cte("read_chat")
+        )
+        last_read_id = func.coalesce(read_chat.c.last_read_id, 0)
+
+        read_messages = (
+            update(Message)
+            .where(
+                Message.chat_id == read_chat.c.id,
+                Message.sender_id != user_id,
+                Message.is_read.is_(False),
+                Message.id <= last_read_id,
+            )
+            .values(is_read=True)
+            .returning(Message.id)
+            .cte("read_messages")
+        )
+
+        unread = (
+            select(func.count(Message.id))
+            .where(
+                Message.chat_id == chat_id,
+                Message.sender_id != user_id,
+                Message.id > last_read_id,
+            )
+            .scalar_subquery()
+        )
+        read_summary = (
+            update(ChatSummary)
+            .where(ChatSummary.chat_id == read_chat.c.id)
+            .values(
+                user1_unread=case(
+                    (read_chat.c.user1_id == user_id, unread), else_=ChatSummary.user1_unread
+                ),
+                user2_unread=case(
+                    (read_chat.c.user1_id == user_id, ChatSummary.user2_unread), else_=unread
+                ),
+            )
+            .returning(ChatSummary.chat_id)
+            .cte("read_summary")
+        )
+
+        stmt = (
+            select(
+                read_chat.c.last_read_id.label("last_read_message_id"),
+                unread.label("unread_count"),
+            )
+            .add_cte(read_messages, read_summary)
+        )
+
+        async with get_session() as session:
+            result = await session.execute(stmt)
+            # Запрос - SELECT, поэтому запись отмечается явно: для read-your-writes
+            # и сброса закэшированных подсчетов строк
+            mark_written(session, Chat.__tablename__, Message.__tablename__, ChatSummary.__tablename__)
+            state = result.mappings().one_or_none()
+            await commit(session)
+
+        if not state:
+            return None
+        # В кэше хвоста лежат сообщения с прежними is_read
+        await after_commit(message_tail_cache.invalidate, chat_id)
+        return SReadState.model_validate(state)
+
+    @classmethod
+    async def delete(cls, *, id: int) -> Chat:
+        chat = await super().delete(id=id)
+        cls.membership_cache.pop((id, chat.user1_id))
+        cls.membership_cache.pop((id, chat.user2_id))
+        await after_commit(message_tail_cache.invalidate, id)
+        return chat
+
+    @classmethod
+    async def delete_all(cls) -> None:
+        await super().delete_all()
+        cls.membership_cache.clear()
+        await after_commit(message_tail_cache.clear)
+
+
 class MessageDAO(BaseDAO[Message, SMessageCreate, SMessageUpdate]):
     model = Message
+
+    @classmethod
+    async def add(cls, **data):
+        try:
+            query = insert(Message).values(**data).returning(
+                Message.id, Message.chat_id, Message.sender_id, Message.content, Message.timestamp,
+                Message.is_read,
+            )
+            async with get_session() as session:
+                result = await session.execute(query)
+                message = result.mappings().first()
+                await ChatSummaryDAO.register_message(
+                    session,
+                    chat_id=message["chat_id"],
+                    message_id=message["id"],
+                    sender_id=message["sender_id"],
+                    content=message["content"],
+                    timestamp=message["timestamp"],
+                )
+                await commit(session)
+            await after_commit(message_tail_cache.push, message["chat_id"], [SMessage(**message)])
+            return message
+        except (Exception) as e:
+            msg = "Unknown Exc: Cannot insert data into table"
+            logger.error(msg, extra={"table": cls.model.__tablename__}, exc_info=True)
+            return None
+
+    @classmethod
+    async def create(
+        cls,
+        *,
+        obj_in: SMessageCreate | Message,
+        created_by_id: int | str | None = None,
+    ) -> Message:
+        db_obj = obj_in if isinstance(obj_in, Message) else Message(**obj_in.model_dump())
+        async with get_session() as session:
+            session.add(db_obj)
+            await session.flush()
+            await ChatSummaryDAO.register_message(
+                session,
+                chat_id=db_obj.chat_id,
+                message_id=db_obj.id,
+                sender_id=db_obj.sender_id,
+                content=db_obj.content,
+                timestamp=db_obj.timestamp,
+            )
+            await commit(session)
+            await session.refresh(db_obj)
+        # Вложения здесь не загружены, поэтому хвост перечитается из БД целиком
+        await after_commit(message_tail_cache.invalidate, db_obj.chat_id)
+        return db_obj
+
+    @classmethod
+    async def delete(cls, *, id: int) -> Message:
+        """Удаляет сообщение и в той же транзакции пересчитывает сводку его чата:
+        удаленное сообщение могло быть последним или непрочитанным."""
+        async with get_session() as session:
+            message = (await session.execute(select(Message).where(Message.id == id))).scalar_one()
+            await session.delete(message)
+            await session.flush()
+            await ChatSummaryDAO.refresh(session, message.chat_id)
+            await commit(session)
+        await after_commit(message_tail_cache.invalidate, message.chat_id)
+        return message
+
+
+class ChatSummaryDAO(BaseDAO[ChatSummary, SChatSummary, SChatSummary]):
+    model = ChatSummary
+
+    @classmethod
+    async def register_message(
+        cls,
+        session: AsyncSession,
+        *,
+        chat_id: int,
+        message_id: int,
+        sender_id: int,
+        content: str,
+        timestamp: datetime,
+    ) -> None:
+        """Учитывает новое сообщение в chat_summary. Коммит остается за вызывающим кодом."""
+        await cls.register_messages(
+            session,
+            [
+                {
+                    "chat_id": chat_id,
+                    "message_id": message_id,
+                    "sender_id": sender_id,
+                    "content": content,
+                    "timestamp": timestamp,
+                }
+            ],
+        )
+
+    @staticmethod
+    async def register_messages(session: AsyncSession, messages: list[dict]) -> None:
+        """Учитывает пачку новых сообщений в chat_summary одним запросом.
+
+        messages - словари с chat_id, message_id, sender_id, content и timestamp.
+        Пачка сворачивается по (чат, отправитель): последнее сообщение чата и число
+        сообщений отправителя, из них в SQL складываются счетчики непрочитанных.
+        Коммит остается за вызывающим кодом.
+        """
+        if not messages:
+            return
+        last: dict[int, dict] = {}
+        counts: dict[tuple[int, int], int] = {}
+        for message in messages:
+            chat_id = message["chat_id"]
+            if chat_id not in last or message["message_id"] > last[chat_id]["message_id"]:
+                last[chat_id] = message
+            key = (chat_id, message["sender_id"])
+            counts[key] = counts.get(key, 0) + 1
+
+        batch = values(
+            column("chat_id", Integer),
+            column("sender_id", Integer),
+            column("messages", Integer),
+            column("last_message_id", Integer),
+            column("last_message_preview", String),
+            column("last_message_at", DateTime),
+            column("last_message_sender_id", Integer),
+            name="batch",
+        ).data(
+            [
+                (
+                    chat_id,
+                    sender_id,
+                    count,
+                    last[chat_id]["message_id"],
+                    last[chat_id]["content"][:ChatSummary.PREVIEW_LENGTH],
+                    last[chat_id]["timestamp"],
+                    last[chat_id]["sender_id"],
+                )
+                for (chat_id, sender_id), count in counts.items()
+            ]
+        )
+        # Одна строка на чат: ON CONFLICT не может изменить строку дважды за запрос
+        last_columns = (
+            batch.c.last_message_id,
+            batch.c.last_message_preview,
+            batch.c.last_message_at,
+            batch.c.last_message_sender_id,
+        )
+        source = (
+            select(
+                Chat.id,
+                *last_columns,
+                func.sum(case((Chat.user1_id == batch.c.sender_id, 0), else_=batch.c.messages)),
+                func.sum(case((Chat.user2_id == batch.c.sender_id, 0), else_=batch.c.messages)),
+            )
+            .join(Chat, Chat.id == batch.c.chat_id)
+            .group_by(Chat.id, *last_columns)
+        )
+
+        stmt = pg_insert(ChatSummary).from_select(
+            [
+                ChatSummary.chat_id,
+                ChatSummary.last_message_id,
+                ChatSummary.last_message_preview,
+                ChatSummary.last_message_at,
+                ChatSummary.last_message_sender_id,
+                ChatSummary.user1_unread,
+                ChatSummary.user2_unread,
+            ],
+            source,
+        )
+        # При конкурентной записи последним остается сообщение с наибольшим id
+        is_newer = stmt.excluded.last_message_id > func.coalesce(ChatSummary.last_message_id, 0)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ChatSummary.chat_id],
+            set_={
+                **{
+                    name: case((is_newer, stmt.excluded[name]), else_=ChatSummary.__table__.c[name])
+                    for name in (
+                        "last_message_id",
+                        "last_message_preview",
+                        "last_message_at",
+                        "last_message_sender_id",
+                    )
+                },
+                "user1_unread": ChatSummary.user1_unread + stmt.excluded.user1_unread,
+                "user2_unread": ChatSummary.user2_unread + stmt.excluded.user2_unread,
+            },
+        )
+        await session.execute(stmt)
+
+    @classmethod
+    async def get_unread_total(cls, user_id: int) -> int:
+        async with get_read_session() as session:
+            result = await session.execute(
+                select(
+                    func.coalesce(
+                        func.sum(
+                            case(
+                                (Chat.user1_id == user_id, ChatSummary.user1_unread),
+                                else_=ChatSummary.user2_unread,
+                            )
+                        ),
+                        0,
+                    )
+                )
+                .join(Chat, Chat.id == ChatSummary.chat_id)
+                .where(or_(Chat.user1_id == user_id, Chat.user2_id == user_id))
+            )
+            return result.scalar_one()
+
+    @staticmethod
+    def _computed_summary() -> Select:
+        """Сводка по чатам, посчитанная заново по таблице message."""
+        last_message = (
+            select(Message.id, Message.content, Message.timestamp, Message.sender_id)
+            .where(Message.chat_id == Chat.id)
+            .order_by(Message.timestamp.desc(), Message.id.desc())
+            .limit(1)
+            .lateral("last_message")
+        )
+
+        def unread_for(participant_id):
+            return (
+                select(func.count(Message.id))
+                .where(
+                    Message.chat_id == Chat.id,
+                    Message.sender_id != participant_id,
+                    Message.is_read.is_(False),
+                )
+                .scalar_subquery()
+            )
+
+        return (
+            select(
+                Chat.id.label("chat_id"),
+                last_message.c.id.label("last_message_id"),
+                func.left(last_message.c.content, ChatSummary.PREVIEW_LENGTH).label("last_message_preview"),
+                last_message.c.timestamp.label("last_message_at"),
+                last_message.c.sender_id.label("last_message_sender_id"),
+                unread_for(Chat.user1_id).label("user1_unread"),
+                unread_for(Chat.user2_id).label("user2_unread"),
+            )
+            .outerjoin(last_message, true())
+        )
+
+    @staticmethod
+    def _upsert_computed(computed: Select):
+        columns = [c.name for c in computed.selected_columns]
+        stmt = pg_insert(ChatSummary).from_select(columns, computed)
+        return stmt.on_conflict_do_update(
+            index_elements=[ChatSummary.chat_id],
+            set_={name: stmt.excluded[name] for name in columns if name != "chat_id"},
+        )
+
+    @classmethod
+    async def backfill(cls) -> int:
+        """Пересчитывает chat_summary для всех чатов по существующим сообщениям."""
+        stmt = cls._upsert_computed(cls._computed_summary())
+        async with get_session() as session:
+            result = await session.execute(stmt)
+            await commit(session)
+            return result.rowcount
+
+    @classmethod
+    async def refresh(cls, session: AsyncSession, chat_id: int) -> None:
+        """Пересчитывает сводку одного чата по таблице message, например после удаления
+        сообщения. Коммит остается за вызывающим кодом."""
+        # Строка сводки блокируется до пересчета: конкурентный register_message
+        # прибавит свое сообщение к результату, а не будет им затерт
+        await session.execute(
+            select(ChatSummary.chat_id).where(ChatSummary.chat_id == chat_id).with_for_update()
+        )
+        await session.execute(cls._upsert_computed(cls._computed_summary().where(Chat.id == chat_id)))
+
+    @classmethod
+    async def find_inconsistent(cls) -> list[dict]:
+        """Возвращает чаты, у которых chat_summary расходится с таблицей message."""
+        computed = cls._computed_summary().subquery("computed")
+        compared = [
+            "last_message_id",
+            "last_message_at",
+            "last_message_sender_id",
+            "user1_unread",
+            "user2_unread",
+        ]
+        stmt = (
+            select(
+                computed.c.chat_id,
+                *[computed.c[name].label(f"expected_{name}") for name in compared],
+                *[ChatSummary.__table__.c[name].label(f"actual_{name}") for name in compared],
+            )
+            .outerjoin(ChatSummary, ChatSummary.chat_id == computed.c.chat_id)
+            .where(
+                or_(
+                    # Чат с сообщениями, но без сводки
+                    and_(ChatSummary.chat_id.is_(None), computed.c.last_message_id.is_not(None)),
+                    and_(
+                        ChatSummary.chat_id.is_not(None),
+                        or_(*[
+                            ChatSummary.__table__.c[name].is_distinct_from(computed.c[name])
+                            for name in compared
+                        ]),
+                    ),
+                )
+            )
+            .order_by(computed.c.chat_id)
+        )
+        async with get_session() as session:
+            result = await session.execute(stmt)
+            return [dict(row) for row in result.mappings().all()]
@@ -0,0 +1,11 @@
+from fastapi import Depends
+
+from app.auth.auth import current_active_user
+from app.chat.dao import ChatDAO
+from app.chat.schemas import SChat
+from app.user.model import User
+
+
+async def get_my_chat(id: int, current_user: User = Depends(current_active_user)) -> SChat:
+    """Чат из пути /{id}, если текущий пользователь - его участник (иначе 404/403)."""
+    return await ChatDAO.get_member_chat(id, current_user.id)
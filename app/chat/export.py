@@ -0,0 +1,123 @@
+"""
+Потоковая выгрузка переписки в NDJSON или zip-архив с вложениями.
+
+Сообщения читаются серверным курсором (stream_scalars с yield_per) и сериализуются
+по одному, поэтому память не зависит от длины переписки. Каждая строка NDJSON -
+объект с полем type: сначала "chat", затем "message" этого чата по времени.
+
+В архиве лежит messages.ndjson и файлы вложений в attachments/. Архив пишется без
+перемотки (zipfile с дескрипторами данных после каждого файла), содержимое отдается
+клиенту по мере записи. Вложения берутся только из EXPORT_ATTACHMENTS_ROOT.
+"""
+import asyncio
+import json
+import zipfile
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO
+
+from sqlalchemy import or_, select
+from sqlalchemy.orm import selectinload
+
+from app.chat.model import Attachment, Chat, Message
+from app.chat.schemas import SChat, SMessage
+from app.config import settings
+from app.database import stream_session
+from app.logger import logger
+
+MESSAGES_FILE = "messages.ndjson"
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+async def user_chat_ids(user_id: int) -> list[int]:
+    async with stream_session() as session:
+        result = await session.execute(
+            select(Chat.id)
+            .where(or_(Chat.user1_id == user_id, Chat.user2_id == user_id))
+            .order_by(Chat.id)
+        )
+        return list(result.scalars())
+
+
+async def export_ndjson(chat_ids: list[int]) -> AsyncIterator[bytes]:
+    async with stream_session() as session:
+        for chat_id in chat_ids:
+            chat = await session.get(Chat, chat_id)
+            if chat is None:
+                continue
+            yield _line("chat", SChat.model_validate(chat).model_dump(mode="json"))
+            stmt = (
+                select(Message)
+                .where(Message.chat_id == chat_id)
+                .order_by(Message.timestamp, Message.id)
+                .options(selectinload(Message.attachments))
+                .execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+            )
+            async for message in await session.stream_scalars(stmt):
+                yield _line("message", SMessage.model_validate(message).model_dump(mode="json"))
+
+
+def _line(type_: str, data: dict) -> bytes:
+    return json.dumps({"type": type_, **data}, ensure_ascii=False).encode() + b"\n"
+
+
+class _ZipBuffer:
+    """Поток без перемотки для zipfile: записанное забирается через take()."""
+
+    def __init__(self):
+        self.chunks: list[bytes] = []
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        if data:
+            self.chunks.append(bytes(data))
+            self.size += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        self.size = 0
+        return data
+
+
+async def export_zip(chat_ids: list[int]) -> AsyncIterator[bytes]:
+    buffer = _ZipBuffer()
+    archive = zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED)
+    with archive.open(MESSAGES_FILE, mode="w", force_zip64=True) as entry:
+        async for line in export_ndjson(chat_ids):
+            entry.write(line)
+            # Отдаем клиенту кусками не меньше FILE_CHUNK_SIZE, а не по строке
+            if buffer.size >= FILE_CHUNK_SIZE:
+                yield buffer.take()
+
+    root = Path(settings.EXPORT_ATTACHMENTS_ROOT).resolve()
+    async with stream_session() as session:
+        stmt = (
+            select(Attachment.id, Attachment.file_path)
+            .join(Message, Message.id == Attachment.message_id)
+            .where(Message.chat_id.in_(chat_ids))
+            .order_by(Attachment.id)
+            .execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+        )
+        async for attachment_id, file_path in await session.stream(stmt):
+            path = Path(file_path).resolve()
+            if not path.is_relative_to(root) or not path.is_file():
+                logger.warning("Attachment is not exported", extra={"attachment_id": attachment_id})
+                continue
+            info = zipfile.ZipInfo(f"attachments/{attachment_id}_{path.name}")
+            # Картинки и документы уже сжаты
+            info.compress_type = zipfile.ZIP_STORED
+            with path.open("rb") as source, archive.open(info, mode="w", force_zip64=True) as entry:
+                async for chunk in _read_chunks(source):
+                    entry.write(chunk)
+                    yield buffer.take()
+    archive.close()
+    yield buffer.take()
+
+
+async def _read_chunks(file: BinaryIO) -> AsyncIterator[bytes]:
+    while chunk := await asyncio.to_thread(file.read, FILE_CHUNK_SIZE):
+        yield chunk
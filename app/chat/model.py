@@ -1,20 +1,24 @@
 from datetime import datetime
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String, Table
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Index, Integer, String, Table
 from sqlalchemy.orm import relationship
 
-from app.database import BaseAlchemyModel, MainModel
+from app.database import BaseAlchemyModel, MainModel, VersionedModel
 
 
-class Chat(BaseAlchemyModel):
+class Chat(BaseAlchemyModel, VersionedModel):
     __tablename__ = 'chat'
     id = Column(Integer, primary_key=True, nullable=False, index=True, unique=True)
 
-    user1_id = Column(Integer, ForeignKey('user.id'))
+    user1_id = Column(Integer, ForeignKey('user.id'), index=True)
     user1 = relationship('User', foreign_keys=[user1_id])
 
-    user2_id = Column(Integer, ForeignKey('user.id'))
+    user2_id = Column(Integer, ForeignKey('user.id'), index=True)
     user2 = relationship('User', foreign_keys=[user2_id])
 
+    # Отметки прочтения: id последнего прочитанного сообщения для каждого участника
+    user1_last_read_id = Column(Integer, nullable=True)
+    user2_last_read_id = Column(Integer, nullable=True)
+
     messages = relationship('Message', back_populates='chat', cascade='all, delete-orphan')
 
     def __str__(self) -> str:
@@ -23,6 +27,10 @@ class Chat(BaseAlchemyModel):
 
 class Message(BaseAlchemyModel):
     __tablename__ = 'message'
+    __table_args__ = (
+        # Последние сообщения чата и постраничная выдача истории
+        Index('ix_message_chat_id_timestamp_id', 'chat_id', 'timestamp', 'id'),
+    )
     id = Column(Integer, primary_key=True, nullable=False, index=True, unique=True)
 
     content = Column(String, nullable=False)
@@ -61,3 +69,25 @@ class Attachment(BaseAlchemyModel):
 
     type = Column(String, nullable=False, default="image")
 
+
+class ChatSummary(BaseAlchemyModel):
+    """Проекция чата для списка чатов: последнее сообщение и счетчики непрочитанных.
+
+    Обновляется в той же транзакции, что и запись сообщения (см. ChatSummaryDAO).
+    """
+    __tablename__ = 'chat_summary'
+    PREVIEW_LENGTH = 200
+
+    chat_id = Column(Integer, ForeignKey('chat.id', ondelete='cascade'), primary_key=True)
+
+    last_message_id = Column(Integer, nullable=True)
+    last_message_preview = Column(String(PREVIEW_LENGTH), nullable=True)
+    last_message_at = Column(DateTime, nullable=True)
+    last_message_sender_id = Column(Integer, nullable=True)
+
+    user1_unread = Column(Integer, nullable=False, default=0)
+    user2_unread = Column(Integer, nullable=False, default=0)
+
+    def __str__(self) -> str:
+        return f"CS#{self.chat_id}<(m#{self.last_message_id})>"
+
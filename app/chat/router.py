@@ -1,16 +1,21 @@
-from typing import List
+from typing import List, Literal
 
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import joinedload
 from sqlalchemy import and_, desc, func, insert, or_, select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.chat.dao import ChatDAO, MessageDAO
+from app.base.etag import etag_matches, make_etag, not_modified
+from app.chat.dao import ChatDAO, ChatSummaryDAO, MessageDAO
+from app.chat.dependencies import get_my_chat
+from app.chat.export import export_ndjson, export_zip, user_chat_ids
+from app.exceptions import ChatNotFoundException
 from app.logger import logger
 from app.chat.model import Chat, Message
-from app.chat.schemas import SChatCreate, SChatForList, SMessageUpdate, SChatUpdate, SChat, SMessage
-from app.database import async_session_maker, get_async_session
+from app.chat.schemas import SChatCreate, SChatForList, SMessagePage, SMessageUpdate, SChatUpdate, SChat, SMessage
+from app.database import commit, get_async_session, get_session
 from app.doctor.dao import DoctorDAO
 from app.patient.dao import PatientDAO
 from app.auth.auth import current_active_user, current_admin_user
@@ -24,17 +29,31 @@ router = APIRouter(
 
 @router.get("")
 async def get_my_chats_list(
+    request: Request,
+    response: Response,
     current_user: User = Depends(current_active_user),
 ) -> list[SChatForList]:
+    # Отпечаток списка дешевле самого списка: при совпадении список не читается
+    etag = make_etag("chats", current_user.id, await ChatDAO.get_chats_list_version(current_user.id))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
     return await ChatDAO.get_chats_list_by_user_id(current_user.id)
 
 
+@router.get("/unread")
+async def get_my_unread_count(
+    current_user: User = Depends(current_active_user),
+) -> dict:
+    return {"unread": await ChatSummaryDAO.get_unread_total(current_user.id)}
+
+
 @router.post("")
 async def create_chat(
     other_user_id: int,
     current_user: User = Depends(current_active_user),
 ):
-    async with async_session_maker() as session:
+    async with get_session() as session:
         # Убедимся, что указанный пользователь существует
         other_user = await session.get(User, other_user_id)
         if not other_user:
@@ -51,7 +70,7 @@ async def create_chat(
         # Создадим новый чат
         new_chat = Chat(user1_id=current_user.id, user2_id=other_user.id)
         session.add(new_chat)
-        await session.commit()
+        await commit(session)
 
         return {
             "chat_id": new_chat.id,
@@ -66,58 +85,77 @@ async def delete_all(user: User = Depends(current_admin_user)):
     return {"message": "Все чаты удалены"}
 
 
+def export_response(chat_ids: list[int], format: str, name: str) -> StreamingResponse:
+    if format == "zip":
+        body, media_type = export_zip(chat_ids), "application/zip"
+    else:
+        body, media_type = export_ndjson(chat_ids), "application/x-ndjson"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}.{format}"'},
+    )
+
+
+@router.get("/export")
+async def export_my_chats(
+    format: Literal["ndjson", "zip"] = "ndjson",
+    current_user: User = Depends(current_active_user),
+) -> StreamingResponse:
+    """Вся переписка текущего пользователя (zip - вместе с вложениями)."""
+    chat_ids = await user_chat_ids(current_user.id)
+    return export_response(chat_ids, format, f"chats_user_{current_user.id}")
+
+
+@router.get("/{id}/export")
+async def export_my_chat(
+    format: Literal["ndjson", "zip"] = "ndjson",
+    chat: SChat = Depends(get_my_chat),
+) -> StreamingResponse:
+    return export_response([chat.id], format, f"chat_{chat.id}")
+
+
 @router.get("/{id}")
 async def get_my_chat_messages(
     id: int,
+    request: Request,
+    response: Response,
     current_user: User = Depends(current_active_user),
-    count: int = 2000,
-) -> list[SMessage]:
-    
-    # Проверяем, существует ли чат
-    exist_chat = await ChatDAO.get_one_or_none(id=id)
-    if not exist_chat:
-        raise HTTPException(404, detail="Чат не найден")
-    
-    # Проверяем, что текущий пользователь участвует в чате
-    if current_user.id not in (exist_chat.user1_id, exist_chat.user2_id):
-        raise HTTPException(403, detail="Нет прав на удаление этого чата")
-
-    return await ChatDAO.get_massages(id, count)
+    count: int = Query(50, ge=1, le=500),
+    before: str | None = None,
+    after: str | None = None,
+) -> SMessagePage:
+    # Участие в чате проверяется тем же запросом, что читает сообщения
+    page = await ChatDAO.get_messages_page(
+        id, limit=count, before=before, after=after, member_id=current_user.id
+    )
+    # Последняя страница обычно берется из кэша хвоста, поэтому ETag считается по ней
+    # самой (сообщения меняют только is_read), а 304 обходится без БД и сериализации
+    etag = make_etag(
+        "chat", id, page.prev_cursor, page.next_cursor,
+        *(f"{message.id}{'r' if message.is_read else ''}" for message in page.items),
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    return page
 
 
 @router.delete("/{id}")
-async def delete_one_my(id: int, current_user: User = Depends(current_active_user)):
-    # Проверяем, существует ли чат
-    exist_chat = await ChatDAO.get_one_or_none(id=id)
-    if not exist_chat:
-        raise HTTPException(404, detail="Чат не найден")
-    
-    # Проверяем, что текущий пользователь участвует в чате
-    if current_user.id not in (exist_chat.user1_id, exist_chat.user2_id):
-        raise HTTPException(403, detail="Нет прав на удаление этого чата")
-
-    await ChatDAO.delete(id=id)
+async def delete_one_my(chat: SChat = Depends(get_my_chat)):
+    await ChatDAO.delete(id=chat.id)
 
     return {"message": "Чат удален"}
 
 
 @router.put("/{id}/read")
-async def read_chat(id: int, current_user: User = Depends(current_active_user)):    
-    # Проверяем, существует ли чат
-    exist_chat = await ChatDAO.get_one_or_none(id=id)
-    if not exist_chat:
-        raise HTTPException(404, detail="Чат не найден")
-    
-    # Проверяем, что текущий пользователь участвует в чате
-    if current_user.id not in (exist_chat.user1_id, exist_chat.user2_id):
-        raise HTTPException(403, detail="Нет прав на удаление этого чата")
-
-    messages = await ChatDAO.get_massages(chat_id = id)
-    for m in messages:
-        new_message = m
-        new_message.is_read = True
-        await MessageDAO.update(
-            obj_current=m,
-            obj_in=new_message
-        )
-    return {"message": "Сообщение прочитаны"}
+async def read_chat(
+    up_to: int | None = None,
+    chat: SChat = Depends(get_my_chat),
+    current_user: User = Depends(current_active_user),
+):
+    state = await ChatDAO.read_messages(chat_id=chat.id, user_id=current_user.id, up_to=up_to)
+    if state is None:
+        # Участие взято из кэша, а чат тем временем удалили
+        raise ChatNotFoundException
+    return {"message": "Сообщения прочитаны", **state.model_dump()}
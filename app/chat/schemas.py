@@ -62,6 +62,23 @@ class SMessage(SMessageBase):
     attachments: list[SAttachment] = []
 
 
+class SMessagePage(BaseModel):
+    """Страница истории чата в хронологическом порядке.
+
+    prev_cursor передается в before для загрузки более старых сообщений,
+    next_cursor - в after для более новых. None означает, что дальше сообщений нет.
+    """
+    items: list[SMessage]
+    prev_cursor: str | None = None
+    next_cursor: str | None = None
+
+
+class SReadState(BaseModel):
+    model_config = ConfigDict(from_attributes=True)  # type: ignore
+    last_read_message_id: int | None
+    unread_count: int
+
+
 # CHAT LIST
 
 class SChatForList(BaseModel):
@@ -72,3 +89,17 @@ class SChatForList(BaseModel):
     other_user_name: str | None
     other_user_image: str | None
     last_message: SMessage | None
+    unread_count: int = 0
+
+
+# CHAT SUMMARY
+
+class SChatSummary(BaseModel):
+    model_config = ConfigDict(from_attributes=True)  # type: ignore
+    chat_id: int
+    last_message_id: int | None
+    last_message_preview: str | None
+    last_message_at: datetime | None
+    last_message_sender_id: int | None
+    user1_unread: int
+    user2_unread: int
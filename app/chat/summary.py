@@ -0,0 +1,35 @@
+"""
+Обслуживание проекции chat_summary.
+
+    python -m app.chat.summary backfill  # пересчитать сводку по всем чатам
+    python -m app.chat.summary check     # найти чаты, где сводка расходится с message
+"""
+import asyncio
+import sys
+
+from app.chat.dao import ChatSummaryDAO
+from app.logger import logger
+
+
+async def backfill() -> None:
+    count = await ChatSummaryDAO.backfill()
+    logger.info("chat_summary backfilled", extra={"chats": count})
+
+
+async def check() -> bool:
+    inconsistent = await ChatSummaryDAO.find_inconsistent()
+    for row in inconsistent:
+        logger.warning("chat_summary is inconsistent", extra=row)
+    logger.info("chat_summary checked", extra={"inconsistent": len(inconsistent)})
+    return not inconsistent
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "backfill":
+        asyncio.run(backfill())
+    elif command == "check":
+        sys.exit(0 if asyncio.run(check()) else 1)
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -0,0 +1,145 @@
+"""
+Кэш последних сообщений чатов (хвоста истории) для открытия чата без запроса к БД.
+
+В Redis по ключу chat:tail:{chat_id} лежит список сериализованных SMessage от новых
+к старым, не длиннее CHAT_TAIL_CACHE_SIZE + 1 (лишний элемент показывает, что есть
+более старые сообщения). Перед Redis стоит локальный LRU воркера с коротким TTL:
+изменения из других воркеров становятся видны не позже чем через CHAT_TAIL_LOCAL_TTL.
+
+Запись нового сообщения добавляет его в голову списка, удаление и изменение
+отметок прочтения сбрасывают список. Каждое изменение увеличивает версию чата
+(chat:tail:{chat_id}:v), и заполнение из БД не перезапишет кэш, если версия
+поменялась, пока шел запрос, - иначе в кэш мог бы попасть снимок без нового сообщения.
+
+Ошибки Redis не ломают чтение истории: кэш просто пропускается.
+"""
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError, WatchError
+
+from app.base.cache import TTLCache
+from app.chat.schemas import SMessage
+from app.config import settings
+from app.logger import logger
+from app.prometheus.metrics import CHAT_TAIL_CACHE_REQUESTS
+from app.redis_client import redis as default_redis
+
+KEY_PREFIX = "chat:tail:"
+
+
+class MessageTailCache:
+    def __init__(self, redis: aioredis.Redis, size: int, ttl: int, local_size: int, local_ttl: float):
+        self.redis = redis
+        self.size = size
+        self.ttl = ttl
+        self.local: TTLCache[int, list[SMessage]] = TTLCache(local_size, local_ttl)
+
+    @staticmethod
+    def _key(chat_id: int) -> str:
+        return f"{KEY_PREFIX}{chat_id}"
+
+    @staticmethod
+    def _version_key(chat_id: int) -> str:
+        return f"{KEY_PREFIX}{chat_id}:v"
+
+    async def get(self, chat_id: int) -> list[SMessage] | None:
+        """Хвост чата от новых к старым или None, если его нет в кэше."""
+        messages = self.local.get(chat_id)
+        if messages is not None:
+            CHAT_TAIL_CACHE_REQUESTS.labels(layer="local", result="hit").inc()
+            return messages
+        try:
+            exists, items = await (
+                self.redis.pipeline(transaction=False)
+                .exists(self._key(chat_id))
+                .lrange(self._key(chat_id), 0, -1)
+                .execute()
+            )
+        except RedisError:
+            logger.warning("Chat tail cache unavailable", exc_info=True)
+            return None
+        if not exists:
+            CHAT_TAIL_CACHE_REQUESTS.labels(layer="redis", result="miss").inc()
+            return None
+        CHAT_TAIL_CACHE_REQUESTS.labels(layer="redis", result="hit").inc()
+        messages = [SMessage.model_validate_json(item) for item in items]
+        self.local.set(chat_id, messages)
+        return messages
+
+    async def get_version(self, chat_id: int) -> str | None:
+        """Версию нужно прочитать до запроса в БД и передать в fill."""
+        try:
+            return await self.redis.get(self._version_key(chat_id))
+        except RedisError:
+            return None
+
+    async def fill(self, chat_id: int, version: str | None, messages: list[SMessage]) -> None:
+        """Кладет в кэш хвост, прочитанный из БД (от новых к старым)."""
+        key, version_key = self._key(chat_id), self._version_key(chat_id)
+        items = [message.model_dump_json() for message in messages[: self.size + 1]]
+        if not items:
+            # Пустой список Redis не хранит: такой чат читается из БД до первого сообщения
+            return
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                await pipe.watch(version_key)
+                if await pipe.get(version_key) != version:
+                    return
+                pipe.multi()
+                pipe.delete(key)
+                pipe.rpush(key, *items)
+                pipe.expire(key, self.ttl)
+                await pipe.execute()
+        except WatchError:
+            return
+        except RedisError:
+            logger.warning("Chat tail cache unavailable", exc_info=True)
+            return
+        self.local.set(chat_id, messages[: self.size + 1])
+
+    async def push(self, chat_id: int, messages: list[SMessage]) -> None:
+        """Добавляет новые сообщения в голову хвоста, если он уже в кэше."""
+        key, version_key = self._key(chat_id), self._version_key(chat_id)
+        self.local.pop(chat_id)
+        try:
+            await (
+                self.redis.pipeline(transaction=True)
+                .incr(version_key)
+                .expire(version_key, self.ttl)
+                .lpushx(key, *[message.model_dump_json() for message in messages])
+                .ltrim(key, 0, self.size)
+                .execute()
+            )
+        except RedisError:
+            logger.warning("Chat tail cache unavailable", exc_info=True)
+
+    async def invalidate(self, *chat_ids: int) -> None:
+        for chat_id in chat_ids:
+            self.local.pop(chat_id)
+        if not chat_ids:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=True)
+            for chat_id in chat_ids:
+                pipe.incr(self._version_key(chat_id))
+                pipe.expire(self._version_key(chat_id), self.ttl)
+                pipe.delete(self._key(chat_id))
+            await pipe.execute()
+        except RedisError:
+            logger.warning("Chat tail cache unavailable", exc_info=True)
+
+    async def clear(self) -> None:
+        self.local.clear()
+        try:
+            async for key in self.redis.scan_iter(match=f"{KEY_PREFIX}*"):
+                await self.redis.delete(key)
+        except RedisError:
+            logger.warning("Chat tail cache unavailable", exc_info=True)
+
+
+message_tail_cache = MessageTailCache(
+    default_redis,
+    size=settings.CHAT_TAIL_CACHE_SIZE,
+    ttl=settings.CHAT_TAIL_CACHE_TTL,
+    local_size=settings.CHAT_TAIL_LOCAL_SIZE,
+    local_ttl=settings.CHAT_TAIL_LOCAL_TTL,
+)
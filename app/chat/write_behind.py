@@ -0,0 +1,185 @@
+import asyncio
+from datetime import datetime
+from typing import Awaitable, Callable
+
+from sqlalchemy import insert, text
+
+from app.chat.dao import ChatSummaryDAO
+from app.chat.model import Message
+from app.chat.schemas import SMessage
+from app.chat.tail_cache import message_tail_cache
+from app.database import async_session_maker
+from app.logger import logger
+
+# Вызывается после коммита пачки: чат для рассылки и сообщение с присвоенными id и timestamp
+PersistedHandler = Callable[[int, dict], Awaitable[None]]
+
+_STOP = object()
+
+
+class MessageWriteBehind:
+    """Отложенная пакетная запись сообщений из WebSocket.
+
+    Сообщения копятся в очереди и записываются одним INSERT ... RETURNING, когда
+    набирается batch_size сообщений или проходит flush_interval секунд с первого
+    сообщения пачки. После коммита каждое сообщение с id передается в on_persisted.
+    При durability="relaxed" пачки коммитятся с synchronous_commit = off: сбой Postgres
+    может потерять последние подтвержденные пачки, но не нарушит целостность базы.
+    """
+
+    def __init__(
+        self,
+        on_persisted: PersistedHandler,
+        batch_size: int = 100,
+        flush_interval: float = 0.02,
+        durability: str = "full",
+    ):
+        self.on_persisted = on_persisted
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Дописывает все, что уже в очереди, и останавливает запись."""
+        if self._task is None:
+            return
+        self._queue.put_nowait(_STOP)
+        await self._task
+        self._task = None
+
+    async def submit(self, chat_id: int, message_data: dict) -> None:
+        """Ставит сообщение в очередь; после записи оно будет разослано в чат chat_id.
+
+        Кадр без chat_id, sender_id или content отклоняется сразу с ValueError.
+        """
+        self._row(message_data, datetime.now())
+        if self._task is None:
+            # Запись остановлена (например, во время завершения воркера) - пишем сразу
+            await self.flush([(chat_id, message_data)])
+        else:
+            self._queue.put_nowait((chat_id, message_data))
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            stopping = False
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                await self.flush(batch)
+            except Exception:
+                # Задача записи должна пережить любую ошибку, иначе очередь перестанет разбираться
+                logger.error("Cannot flush message batch", extra={"messages": len(batch)}, exc_info=True)
+            if stopping:
+                return
+
+    @staticmethod
+    def _row(message_data: dict, now: datetime) -> dict:
+        try:
+            return {
+                "chat_id": int(message_data["chat_id"]),
+                "sender_id": int(message_data["sender_id"]),
+                "content": str(message_data["content"]),
+                "timestamp": now,
+                "is_read": False,
+            }
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid message frame: {e!r}") from e
+
+    async def _insert(self, rows: list[dict]) -> list:
+        async with async_session_maker() as session:
+            if self.durability == "relaxed":
+                await session.execute(text("SET LOCAL synchronous_commit = off"))
+            result = await session.execute(
+                insert(Message).returning(
+                    Message.id, Message.timestamp, sort_by_parameter_order=True
+                ),
+                rows,
+            )
+            inserted = result.all()
+            await ChatSummaryDAO.register_messages(
+                session,
+                [
+                    {
+                        "chat_id": row["chat_id"],
+                        "message_id": message.id,
+                        "sender_id": row["sender_id"],
+                        "content": row["content"],
+                        "timestamp": message.timestamp,
+                    }
+                    for row, message in zip(rows, inserted)
+                ],
+            )
+            await session.commit()
+        return inserted
+
+    async def flush(self, batch: list[tuple[int, dict]]) -> None:
+        now = datetime.now()
+        accepted: list[tuple[int, dict, dict]] = []
+        for chat_id, message_data in batch:
+            try:
+                accepted.append((chat_id, message_data, self._row(message_data, now)))
+            except ValueError:
+                logger.warning("Dropping invalid message", extra={"chat_id": chat_id}, exc_info=True)
+        if not accepted:
+            return
+
+        try:
+            inserted = await self._insert([row for _, _, row in accepted])
+            persisted = list(zip(accepted, inserted))
+        except Exception:
+            if len(accepted) == 1:
+                logger.error(
+                    "Cannot write message", extra={"chat_id": accepted[0][0]}, exc_info=True
+                )
+                return
+            # Одна плохая строка (например, несуществующий chat_id) не должна отменять
+            # сообщения других пользователей: пишем пачку построчно и теряем только ее
+            logger.warning(
+                "Cannot write message batch, retrying row by row",
+                extra={"messages": len(accepted)},
+                exc_info=True,
+            )
+            persisted = []
+            for item in accepted:
+                try:
+                    persisted.append((item, (await self._insert([item[2]]))[0]))
+                except Exception:
+                    logger.error("Cannot write message", extra={"chat_id": item[0]}, exc_info=True)
+
+        tails: dict[int, list[SMessage]] = {}
+        for (_, _, row), message in persisted:
+            tails.setdefault(row["chat_id"], []).append(
+                SMessage(**{**row, "id": message.id, "timestamp": message.timestamp})
+            )
+        for chat_id, messages in tails.items():
+            await message_tail_cache.push(chat_id, messages)
+
+        for (chat_id, message_data, _), message in persisted:
+            try:
+                await self.on_persisted(
+                    chat_id,
+                    {**message_data, "id": message.id, "timestamp": message.timestamp.isoformat()},
+                )
+            except Exception:
+                logger.error("Cannot broadcast persisted message", exc_info=True)
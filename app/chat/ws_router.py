@@ -1,34 +1,306 @@
+import asyncio
 from datetime import datetime
 import json
+import time
 from typing import List
 from fastapi import WebSocket, WebSocketDisconnect
 from app.logger import logger
+from app.chat.broadcast import BroadcastBackend, get_broadcast_backend
+from app.chat.dao import ChatSummaryDAO
 from app.chat.model import Message
+from app.chat.schemas import SMessage
+from app.chat.tail_cache import message_tail_cache
+from app.chat.write_behind import MessageWriteBehind
+from app.config import settings
 from app.database import async_session_maker
+from app.prometheus.metrics import (
+    WS_CONNECTIONS, WS_OUTBOUND_DROPPED, WS_OUTBOUND_QUEUE_DEPTH, WS_OUTBOUND_QUEUE_MAX_DEPTH,
+    WS_EPHEMERAL_FRAMES, WS_SLOW_CONSUMER_EVICTIONS
+)
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.responses import HTMLResponse
 
 
+EPHEMERAL_FRAME_TYPES = ("typing", "presence", "ack")
+
+
+class TokenBucket:
+    """Ограничение частоты: rate кадров в секунду с запасом burst."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class Connection:
+    """Сокет чата с собственной ограниченной очередью исходящих сообщений.
+
+    Очередь разбирает отдельная задача-писатель, поэтому отправка в медленный
+    сокет не задерживает ни отправителя, ни других участников чата.
+    """
+
+    def __init__(self, websocket: WebSocket, chat_id: int, queue_size: int, user_id: int):
+        self.websocket = websocket
+        self.chat_id = chat_id
+        self.user_id = user_id
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=queue_size)
+        # Сколько сообщений подряд не поместилось в очередь
+        self.dropped = 0
+        self.writer: asyncio.Task | None = None
+        # Состояние эфемерных кадров: по нему отбрасываются повторы
+        self.ephemeral_bucket = TokenBucket(settings.WS_EPHEMERAL_RATE, settings.WS_EPHEMERAL_BURST)
+        self.is_typing = False
+        self.typing_sent_at = 0.0
+        self.status = "online"
+        self.last_ack_id = 0
+
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
+    """Сокеты чатов текущего воркера.
+
+    Сообщения публикуются через BroadcastBackend, который доставляет их всем воркерам,
+    а каждый воркер рассылает их только по своим локальным сокетам.
+
+    Кадры различаются полем type: message сохраняется в БД, а typing, presence и ack
+    только рассылаются, с ограничением частоты и отбрасыванием повторов.
+    """
+
+    def __init__(self, backend: BroadcastBackend):
+        self.backend = backend
+        # chat_id -> соединения чата и индекс по сокету для отключения за O(1)
+        self.chat_connections: dict[int, set[Connection]] = {}
+        self.connections: dict[WebSocket, Connection] = {}
+        # (chat_id, user_id) -> число локальных соединений пользователя в чате
+        self.user_connections: dict[tuple[int, int], int] = {}
+        WS_OUTBOUND_QUEUE_DEPTH.set_function(self.outbound_queue_depth)
+        WS_OUTBOUND_QUEUE_MAX_DEPTH.set_function(self.outbound_queue_max_depth)
+        self.write_behind = (
+            MessageWriteBehind(
+                on_persisted=self.publish,
+                batch_size=settings.WS_WRITE_BEHIND_BATCH_SIZE,
+                flush_interval=settings.WS_WRITE_BEHIND_FLUSH_MS / 1000,
+                durability=settings.WS_WRITE_BEHIND_DURABILITY,
+            )
+            if settings.WS_WRITE_BEHIND
+            else None
+        )
+
+    async def start(self):
+        await self.backend.start(self.deliver_local)
+        if self.write_behind:
+            await self.write_behind.start()
 
-    async def connect(self, websocket: WebSocket, client_id: int):
+    async def stop(self):
+        # Сначала дописываем очередь, чтобы записанные сообщения успели разойтись
+        if self.write_behind:
+            await self.write_behind.stop()
+        await self.backend.stop()
+
+    async def connect(self, websocket: WebSocket, client_id: int, user_id: int):
+        """Подключает сокет участника чата. user_id - уже проверенный пользователь соединения."""
         await websocket.accept()
-        self.active_connections.append({"websocket": websocket, "client_id": client_id})
+        connection = Connection(websocket, client_id, settings.WS_OUTBOUND_QUEUE_SIZE, user_id)
+        connection.writer = asyncio.create_task(self._write(connection))
+        connections = self.chat_connections.setdefault(client_id, set())
+        is_first = not connections
+        connections.add(connection)
+        self.connections[websocket] = connection
+        WS_CONNECTIONS.inc()
+        if is_first:
+            await self.backend.subscribe(client_id)
+        key = (client_id, user_id)
+        self.user_connections[key] = self.user_connections.get(key, 0) + 1
+        # Присутствие объявляем только при первом соединении пользователя
+        if self.user_connections[key] == 1:
+            await self.publish_presence(client_id, user_id, "online")
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections = [conn for conn in self.active_connections if conn["websocket"] != websocket]
+    async def disconnect(self, websocket: WebSocket):
+        connection = self.connections.pop(websocket, None)
+        if connection is None:
+            return
+        WS_CONNECTIONS.dec()
+        if connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
+        connections = self.chat_connections.get(connection.chat_id)
+        if connections is not None:
+            connections.discard(connection)
+            if not connections:
+                del self.chat_connections[connection.chat_id]
+                await self.backend.unsubscribe(connection.chat_id)
+        key = (connection.chat_id, connection.user_id)
+        self.user_connections[key] -= 1
+        if not self.user_connections[key]:
+            del self.user_connections[key]
+            await self.publish_presence(connection.chat_id, connection.user_id, "offline")
+
+    async def receive(self, websocket: WebSocket, frame: dict):
+        """Обрабатывает кадр клиента. Кадр без type считается сообщением."""
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return
+        if not isinstance(frame, dict):
+            logger.warning("Rejected malformed websocket frame", extra={"chat_id": connection.chat_id})
+            return
+        frame_type = frame.get("type", "message")
+        if frame_type == "message":
+            # Чат и отправитель - те, что проверены при подключении, а не из кадра
+            message_data = {
+                **frame, "type": "message", "chat_id": connection.chat_id, "sender_id": connection.user_id
+            }
+            try:
+                await self.broadcast(connection.chat_id, message_data)
+            except (KeyError, TypeError, ValueError):
+                # Кадр без content
+                logger.warning(
+                    "Rejected invalid message frame", extra={"chat_id": connection.chat_id}
+                )
+        elif frame_type in EPHEMERAL_FRAME_TYPES:
+            await self.receive_ephemeral(connection, frame_type, frame)
+        else:
+            logger.warning(
+                "Unknown websocket frame type",
+                extra={"chat_id": connection.chat_id, "type": frame_type},
+            )
+
+    async def receive_ephemeral(self, connection: Connection, frame_type: str, frame: dict):
+        if frame_type == "typing":
+            event = {"is_typing": bool(frame.get("is_typing", True))}
+            now = time.monotonic()
+            # Повтор того же состояния раньше интервала ничего не меняет для собеседника
+            if (
+                event["is_typing"] == connection.is_typing
+                and now - connection.typing_sent_at < settings.WS_TYPING_INTERVAL
+            ):
+                WS_EPHEMERAL_FRAMES.labels(type=frame_type, outcome="coalesced").inc()
+                return
+        elif frame_type == "presence":
+            event = {"status": str(frame.get("status", "online"))}
+            if event["status"] == connection.status:
+                WS_EPHEMERAL_FRAMES.labels(type=frame_type, outcome="coalesced").inc()
+                return
+        else:
+            try:
+                event = {"message_id": int(frame["message_id"])}
+            except (KeyError, TypeError, ValueError):
+                return
+            # Подтверждение более раннего сообщения уже покрыто последним отправленным
+            if event["message_id"] <= connection.last_ack_id:
+                WS_EPHEMERAL_FRAMES.labels(type=frame_type, outcome="coalesced").inc()
+                return
+
+        if not connection.ephemeral_bucket.take():
+            WS_EPHEMERAL_FRAMES.labels(type=frame_type, outcome="rate_limited").inc()
+            return
+
+        if frame_type == "typing":
+            connection.is_typing = event["is_typing"]
+            connection.typing_sent_at = time.monotonic()
+        elif frame_type == "presence":
+            connection.status = event["status"]
+        else:
+            connection.last_ack_id = event["message_id"]
+        WS_EPHEMERAL_FRAMES.labels(type=frame_type, outcome="forwarded").inc()
+        await self.publish(
+            connection.chat_id,
+            {"type": frame_type, "chat_id": connection.chat_id, "user_id": connection.user_id, **event},
+        )
+
+    async def publish_presence(self, chat_id: int, user_id: int, status: str):
+        WS_EPHEMERAL_FRAMES.labels(type="presence", outcome="forwarded").inc()
+        await self.publish(
+            chat_id, {"type": "presence", "chat_id": chat_id, "user_id": user_id, "status": status}
+        )
 
     async def send_personal_message(self, message: str, websocket: WebSocket):
         await websocket.send_text(message)
 
     async def broadcast(self, chat_id: int, message_data: dict, add_to_db: bool = True):
-        for connection in self.active_connections:
-            if connection["client_id"] == chat_id:
-                await connection["websocket"].send_text(json.dumps(message_data))
-        if add_to_db:
-            await self.add_message_to_database(message_data["chat_id"], message_data["sender_id"], message_data["content"])
+        if not add_to_db:
+            await self.publish(chat_id, message_data)
+        elif self.write_behind:
+            # Рассылка произойдет после записи пачки, уже с id сообщения
+            await self.write_behind.submit(chat_id, message_data)
+        else:
+            new_message = await self.add_message_to_database(
+                message_data["chat_id"], message_data["sender_id"], message_data["content"]
+            )
+            await self.publish(
+                chat_id,
+                {**message_data, "id": new_message.id, "timestamp": new_message.timestamp.isoformat()},
+            )
+
+    async def publish(self, chat_id: int, message_data: dict):
+        await self.backend.publish(chat_id, json.dumps(message_data))
+
+    async def deliver_local(self, chat_id: int, payload: str):
+        # Только раскладываем сообщение по очередям, отправкой занимаются писатели
+        slow = [
+            connection
+            for connection in self.chat_connections.get(chat_id, ())
+            if not self._enqueue(connection, payload)
+        ]
+        for connection in slow:
+            await self._evict(connection, reason="queue_full")
+
+    def _enqueue(self, connection: Connection, payload: str) -> bool:
+        """Ставит сообщение в очередь. Возвращает False, если клиента пора отключить."""
+        try:
+            connection.queue.put_nowait(payload)
+            connection.dropped = 0
+            return True
+        except asyncio.QueueFull:
+            WS_OUTBOUND_DROPPED.inc()
+            connection.dropped += 1
+            return (
+                settings.WS_SLOW_CONSUMER_POLICY == "drop"
+                and connection.dropped < settings.WS_SLOW_CONSUMER_MAX_DROPS
+            )
+
+    async def _write(self, connection: Connection):
+        while True:
+            payload = await connection.queue.get()
+            try:
+                await asyncio.wait_for(
+                    connection.websocket.send_text(payload), timeout=settings.WS_SEND_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                await self._evict(connection, reason="send_timeout")
+                return
+            except Exception:
+                await self._evict(connection, reason="send_error")
+                return
+
+    async def _evict(self, connection: Connection, reason: str):
+        if connection.websocket not in self.connections:
+            return
+        logger.warning(
+            "Dropping slow websocket connection",
+            extra={"chat_id": connection.chat_id, "reason": reason},
+        )
+        WS_SLOW_CONSUMER_EVICTIONS.labels(reason=reason).inc()
+        await self.disconnect(connection.websocket)
+        try:
+            # 1013 - "Try Again Later": клиент может переподключиться
+            await connection.websocket.close(code=1013)
+        except Exception:
+            pass
+
+    def outbound_queue_depth(self) -> int:
+        return sum(connection.queue.qsize() for connection in self.connections.values())
+
+    def outbound_queue_max_depth(self) -> int:
+        return max((connection.queue.qsize() for connection in self.connections.values()), default=0)
 
     @staticmethod
     async def add_message_to_database(chat_id: int, sender_id: int, content: str):
@@ -42,7 +314,18 @@ class ConnectionManager:
                 attachments=[]
             )
             session.add(new_message)
+            await session.flush()
+            await ChatSummaryDAO.register_message(
+                session,
+                chat_id=new_message.chat_id,
+                message_id=new_message.id,
+                sender_id=new_message.sender_id,
+                content=new_message.content,
+                timestamp=new_message.timestamp,
+            )
             await session.commit()
+        await message_tail_cache.push(chat_id, [SMessage.model_validate(new_message)])
+        return new_message
 
 
-ws_manager = ConnectionManager()
+ws_manager = ConnectionManager(get_broadcast_backend())
@@ -19,6 +19,64 @@ class Settings(BaseSettings):
     @property
     def DATABASE_URL(self):
         return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASS}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+
+    # пул соединений: DB_MAX_CONNECTIONS - бюджет всего приложения. Процессы celery
+    # (CELERY_CONCURRENCY) выполняют по одной задаче в одной сессии и закрывают пул после
+    # задачи, на них резервируется по соединению. Остальное делится на WEB_CONCURRENCY
+    # воркеров gunicorn (3/4 постоянных соединений, остальное overflow); DB_POOL_SIZE и
+    # DB_MAX_OVERFLOW задают размеры пула воркера явно. Движки реплик получают такой же
+    # пул на каждой реплике: бюджет действует и для каждого сервера реплики отдельно
+    WEB_CONCURRENCY: int = 4
+    CELERY_CONCURRENCY: int = 2
+    DB_MAX_CONNECTIONS: int = 80
+    DB_POOL_SIZE: int | None = None
+    DB_MAX_OVERFLOW: int | None = None
+    # сколько секунд ждать свободного соединения, возраст соединения до переоткрытия
+    DB_POOL_TIMEOUT: float = 10.0
+    DB_POOL_RECYCLE: int = 30 * 60
+    DB_POOL_PRE_PING: bool = True
+    # кэш подготовленных выражений asyncpg на соединение. 0 - режим pgbouncer (pool_mode =
+    # transaction): выключаются оба кэша выражений, а подготовленные выражения получают
+    # уникальные имена, чтобы не столкнуться на общем серверном соединении
+    DB_STATEMENT_CACHE_SIZE: int = 100
+
+    @property
+    def DB_WORKER_CONNECTIONS(self) -> int:
+        return max(1, (self.DB_MAX_CONNECTIONS - self.CELERY_CONCURRENCY) // self.WEB_CONCURRENCY)
+
+    @property
+    def DB_WORKER_POOL_SIZE(self) -> int:
+        if self.DB_POOL_SIZE is not None:
+            return self.DB_POOL_SIZE
+        return max(1, self.DB_WORKER_CONNECTIONS * 3 // 4)
+
+    @property
+    def DB_WORKER_MAX_OVERFLOW(self) -> int:
+        if self.DB_MAX_OVERFLOW is not None:
+            return self.DB_MAX_OVERFLOW
+        return max(0, self.DB_WORKER_CONNECTIONS - self.DB_WORKER_POOL_SIZE)
+
+    # реплики для чтения: URL через запятую (пусто - все читается с primary).
+    # Реплика с отставанием больше DB_REPLICA_MAX_LAG секунд пропускается, отставание
+    # проверяется не чаще раза в DB_REPLICA_LAG_CHECK_INTERVAL секунд, подключение и
+    # проверка ждут реплику не дольше DB_REPLICA_TIMEOUT секунд. Клиент, который
+    # что-то записал, DB_READ_YOUR_WRITES_WINDOW секунд читает с primary
+    DB_REPLICA_URLS: str = ""
+    DB_REPLICA_MAX_LAG: float = 5.0
+    DB_REPLICA_LAG_CHECK_INTERVAL: float = 2.0
+    DB_REPLICA_TIMEOUT: float = 1.0
+    DB_READ_YOUR_WRITES_WINDOW: float = 5.0
+
+    # подсчет строк (CountStrategy): TTL закэшированных COUNT в секундах; оценка
+    # меньше COUNT_ESTIMATE_EXACT_BELOW строк пересчитывается точно - это дешево
+    COUNT_CACHE_TTL: int = 60
+    COUNT_ESTIMATE_EXACT_BELOW: int = 10000
+    # размер пачки строк в BaseDAO.add_bulk (один COPY или один executemany)
+    DB_BULK_CHUNK_SIZE: int = 10000
+
+    @property
+    def DB_REPLICA_URL_LIST(self) -> list[str]:
+        return [url.strip() for url in self.DB_REPLICA_URLS.split(",") if url.strip()]
     
     # postgres test db
     TEST_DB_HOST: str
@@ -45,12 +103,73 @@ class Settings(BaseSettings):
     def REDIS_URL(self):
         return f"redis://{self.REDIS_HOST}:{self.REDIS_PORT}"
 
+    # websocket
+    # redis - рассылка между воркерами gunicorn, memory - только внутри процесса
+    WS_BROADCAST_BACKEND: Literal["memory", "redis"] = "redis"
+    # сколько секунд ждать отправки в один сокет, прежде чем отключить клиента
+    WS_SEND_TIMEOUT: float = 5.0
+    # размер исходящей очереди соединения и что делать при ее переполнении:
+    # drop - отбрасывать новые сообщения (и отключить после WS_SLOW_CONSUMER_MAX_DROPS подряд),
+    # disconnect - сразу отключать клиента
+    WS_OUTBOUND_QUEUE_SIZE: int = 100
+    WS_SLOW_CONSUMER_POLICY: Literal["drop", "disconnect"] = "drop"
+    WS_SLOW_CONSUMER_MAX_DROPS: int = 50
+    # эфемерные кадры (typing, presence, ack): не больше WS_EPHEMERAL_RATE в секунду
+    # с запасом WS_EPHEMERAL_BURST на соединение; повтор "печатает" не чаще WS_TYPING_INTERVAL
+    WS_EPHEMERAL_RATE: float = 5.0
+    WS_EPHEMERAL_BURST: int = 10
+    WS_TYPING_INTERVAL: float = 3.0
+    # отложенная пакетная запись сообщений из WebSocket
+    WS_WRITE_BEHIND: bool = False
+    WS_WRITE_BEHIND_BATCH_SIZE: int = 100
+    WS_WRITE_BEHIND_FLUSH_MS: int = 20
+    # relaxed - коммит пачек с synchronous_commit = off
+    WS_WRITE_BEHIND_DURABILITY: Literal["full", "relaxed"] = "full"
+
+    # кэш последних сообщений чатов: длина хвоста в Redis и TTL в секундах,
+    # локальный LRU воркера перед Redis (число чатов и TTL)
+    CHAT_TAIL_CACHE_SIZE: int = 50
+    CHAT_TAIL_CACHE_TTL: int = 24 * 60 * 60
+    CHAT_TAIL_LOCAL_SIZE: int = 1000
+    CHAT_TAIL_LOCAL_TTL: float = 1.0
+    # кэш участия в чатах (чат, пользователь): размер и TTL в секундах
+    CHAT_MEMBERSHIP_CACHE_SIZE: int = 10000
+    CHAT_MEMBERSHIP_CACHE_TTL: float = 60.0
+
+    # кэш токен -> пользователь для DatabaseStrategy: размер и TTL в секундах
+    AUTH_TOKEN_CACHE_SIZE: int = 10000
+    AUTH_TOKEN_CACHE_TTL: float = 60.0
+
+    # кэш ответов CRUD-роутеров (/doctors, /patients): TTL в секундах. Любой коммит с
+    # записью в эти таблицы (роутеры, DAO, регистрация) сбрасывает кэш сразу; TTL - на
+    # случай недоступного Redis и записи в обход SQLAlchemy (raw SQL, другие сервисы)
+    CRUD_CACHE_TTL: int = 60
+
+    # импорт CSV: сколько ошибок разбора строк хранить в задаче, каталог для загруженных
+    # файлов (общий для приложения и celery), через сколько секунд без прогресса
+    # задачу можно перезапустить
+    IMPORT_MAX_ROW_ERRORS: int = 100
+    IMPORT_SPOOL_DIR: str = "imports"
+    IMPORT_JOB_STALE_SECONDS: int = 300
+    # выгрузка переписки: сообщений на одну выборку серверного курсора и каталог,
+    # за пределами которого вложения в архив не попадают
+    EXPORT_BATCH_SIZE: int = 1000
+    EXPORT_ATTACHMENTS_ROOT: str = "app/static"
     # sentry
     SENTRY_DSN: str
 
     # cookies
     SECRET_KEY: str
     ALGORITHM: str
+    # время жизни access-токена JWT и refresh-токена, секунды
+    JWT_ACCESS_LIFETIME: int = 15 * 60
+    JWT_REFRESH_LIFETIME: int = 30 * 24 * 60 * 60
+    # отозванные сессии JWT в памяти воркера: размер должен вмещать все отзывы за
+    # JWT_ACCESS_LIFETIME, иначе вытесненный отзыв перестанет проверяться
+    AUTH_REVOKED_CACHE_SIZE: int = 100000
+    # что делать с JWT, пока воркер не получает отзывы из Redis (нет подписки на канал):
+    # false - принимать (известные отзывы все равно проверяются), true - отвечать 401
+    AUTH_REVOCATION_FAIL_CLOSED: bool = False
 
 
 settings = Settings()
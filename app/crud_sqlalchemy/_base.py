@@ -5,7 +5,7 @@ from fastapi import APIRouter, HTTPException
 from fastapi.types import DecoratedCallable
 
 from app.crud_sqlalchemy._types import DEPENDENCIES, T
-from app.crud_sqlalchemy._utils import pagination_factory, schema_factory
+from app.crud_sqlalchemy._utils import keyset_page_factory, pagination_factory, schema_factory
 
 NOT_FOUND = HTTPException(404, "Item not found")
 
@@ -24,6 +24,7 @@ class CRUDGenerator(Generic[T], APIRouter, ABC):
         prefix: Optional[str] = None,
         tags: Optional[List[str]] = None,
         paginate: Optional[int] = None,
+        keyset: bool = False,
         get_all_route: Union[bool, DEPENDENCIES] = True,
         get_one_route: Union[bool, DEPENDENCIES] = True,
         create_route: Union[bool, DEPENDENCIES] = True,
@@ -35,6 +36,12 @@ class CRUDGenerator(Generic[T], APIRouter, ABC):
 
         self.schema = schema
         self.pagination = pagination_factory(max_limit=paginate)
+        self.keyset = keyset
+        self.list_response_model = (
+            keyset_page_factory(self.schema)
+            if self.keyset
+            else Optional[List[self.schema]]  # type: ignore
+        )
         self._pk: str = self._pk if hasattr(self, "_pk") else "id"
         self.create_schema = (
             create_schema
@@ -58,7 +65,7 @@ class CRUDGenerator(Generic[T], APIRouter, ABC):
                 "",
                 self._get_all(),
                 methods=["GET"],
-                response_model=Optional[List[self.schema]],  # type: ignore
+                response_model=self.list_response_model,
                 summary="Get All",
                 dependencies=get_all_route,
             )
@@ -0,0 +1,111 @@
+import hashlib
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi import Request
+from fastapi_cache import FastAPICache
+from redis.exceptions import RedisError
+
+from app.logger import logger
+from app.redis_client import redis
+
+CACHEABLE_ROUTES = ("get_all", "get_one")
+# Key prefix of the FastAPICache backend, see app.main
+PREFIX = "cache"
+# Table info flag of models whose responses are cached, see app.database.ResponseCachedModel
+TABLE_INFO_FLAG = "response_cache"
+
+
+def table_tag(table: str) -> str:
+    """Tag of every response of a table"""
+    return table
+
+
+def list_tag(table: str) -> str:
+    return f"{table}:*"
+
+
+def item_tag(table: str, item_id: Any) -> str:
+    return f"{table}:{item_id}"
+
+
+def written_tags(table: str, item_ids: Optional[Iterable[Any]]) -> List[str]:
+    """
+    Tags to invalidate after a write: the lists and the written items, or every
+    response of the table if the written rows are unknown (item_ids is None)
+    """
+    if item_ids is None:
+        return [table_tag(table)]
+    return [list_tag(table), *(item_tag(table, item_id) for item_id in item_ids)]
+
+
+async def invalidate_written(written: Dict[str, Optional[Set[Any]]]) -> None:
+    """Invalidates the responses of the tables written by a commit (table -> item ids or None)"""
+    for table, item_ids in written.items():
+        await TagCache(table).invalidate(*written_tags(table, item_ids))
+
+
+class TagCache:
+    """
+    Response cache of one router on top of the FastAPICache Redis backend.
+
+    Every entry is tagged (e.g. doctor:* for lists, doctor:5 for an item) and its
+    key contains the current versions of its tags. Invalidating a tag increments
+    its version, so all entries with the tag are never read again and expire by TTL.
+    Versions are read before the database, so a response read before a write can
+    not be stored under the key of the newer version.
+
+    Tags are invalidated by app.database after every commit that writes a table
+    marked with TABLE_INFO_FLAG, whichever code made the write. Versions live in
+    the shared Redis client, so invalidation works in processes without
+    FastAPICache (e.g. celery workers).
+    """
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+
+    @property
+    def enabled(self) -> bool:
+        return FastAPICache._init and FastAPICache.get_enable()
+
+    def _key(self, *parts: str) -> str:
+        return ":".join([PREFIX, "crud", self.namespace, *parts])
+
+    @staticmethod
+    def request_key(route: str, request: Request) -> str:
+        query = sorted(request.query_params.multi_items())
+        digest = hashlib.sha1(f"{request.url.path}?{query!r}".encode()).hexdigest()
+        return f"{route}:{digest}"
+
+    async def get(self, tags: List[str], request_key: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        The cached entry (or None) and the key to store it under
+        """
+        if not self.enabled:
+            return None, None
+        backend = FastAPICache.get_backend()
+        try:
+            versions = await redis.mget([self._key("tag", tag) for tag in tags])
+            key = self._key(request_key, *(version or "0" for version in versions))
+            return await backend.get(key), key
+        except RedisError:
+            logger.warning("Response cache unavailable", exc_info=True)
+            return None, None
+
+    async def set(self, key: Optional[str], value: str, expire: Optional[int]) -> None:
+        if key is None:
+            return
+        try:
+            await FastAPICache.get_backend().set(key, value, expire or FastAPICache.get_expire())
+        except RedisError:
+            logger.warning("Response cache unavailable", exc_info=True)
+
+    async def invalidate(self, *tags: str) -> None:
+        if not tags:
+            return
+        try:
+            pipe = redis.pipeline(transaction=False)
+            for tag in tags:
+                pipe.incr(self._key("tag", tag))
+            await pipe.execute()
+        except RedisError:
+            logger.warning("Cannot invalidate response cache", extra={"tags": list(tags)}, exc_info=True)
@@ -1,9 +1,12 @@
-from typing import Dict, Optional, Sequence, TypeVar
+from typing import Any, Dict, Optional, Sequence, TypeVar
 
 from fastapi.params import Depends
 from pydantic import BaseModel
 
 PAGINATION = Dict[str, Optional[int]]
+KEYSET_PAGINATION = Dict[str, Any]
+# route name (get_all, get_one) -> cache expire in seconds, None - FastAPICache default
+CACHE_POLICY = Dict[str, Optional[int]]
 PYDANTIC_SCHEMA = BaseModel
 
 T = TypeVar("T", bound=BaseModel)
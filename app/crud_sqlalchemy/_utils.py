@@ -1,10 +1,16 @@
-from typing import Any, Optional, Type
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Type
 
 from fastapi import Depends, HTTPException
 from pydantic import __version__ as pydantic_version
 from pydantic import create_model
+from sqlalchemy import Column
 
-from app.crud_sqlalchemy._types import PAGINATION, PYDANTIC_SCHEMA, T
+from app.base.dao import IOrderEnum
+from app.crud_sqlalchemy._types import KEYSET_PAGINATION, PAGINATION, PYDANTIC_SCHEMA, T
+from app.utils import decode_cursor
+
+KEYSET_DEFAULT_LIMIT = 100
 
 
 class AttrDict(dict):  # type: ignore
@@ -30,12 +36,26 @@ def schema_factory(
     return schema
 
 
-def create_query_validation_exception(field: str, msg: str) -> HTTPException:
+def keyset_page_factory(schema_cls: Type[T]) -> Type[PYDANTIC_SCHEMA]:
+    """
+    Is used to create the response schema of a keyset paginated list
+    """
+    name = "S" + schema_cls.__name__ + "Page"
+    return create_model(  # type: ignore
+        __model_name=name,
+        items=(List[schema_cls], ...),  # type: ignore
+        next_cursor=(Optional[str], None),
+    )
+
+
+def create_query_validation_exception(
+    field: str, msg: str, type_: str = "type_error.integer"
+) -> HTTPException:
     return HTTPException(
         422,
         detail={
             "detail": [
-                {"loc": ["query", field], "msg": msg, "type": "type_error.integer"}
+                {"loc": ["query", field], "msg": msg, "type": type_}
             ]
         },
     )
@@ -68,3 +88,78 @@ def pagination_factory(max_limit: Optional[int] = None) -> Any:
         return {"skip": skip, "limit": limit}
 
     return Depends(pagination)
+
+
+def parse_cursor_value(column: Column, value: Any) -> Any:
+    """
+    Restores a sort key value packed by app.utils.encode_cursor
+    """
+    if value is None:
+        if not column.nullable:
+            raise ValueError(f"{column.key} can not be null")
+        return None
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    if python_type is float and isinstance(value, int):
+        return float(value)
+    if not isinstance(value, python_type) or (isinstance(value, bool) and python_type is not bool):
+        raise ValueError(f"{column.key} must be {python_type.__name__}")
+    return value
+
+
+def keyset_pagination_factory(
+    columns: Dict[str, Column], pk_field_name: str, max_limit: Optional[int] = None
+) -> Any:
+    """
+    Created the keyset pagination dependency to be used in the router.
+    The cursor is opaque for the client and is bound to order_by and order
+    """
+
+    def pagination(
+        cursor: Optional[str] = None,
+        limit: Optional[int] = max_limit or KEYSET_DEFAULT_LIMIT,
+        order_by: Optional[str] = None,
+        order: IOrderEnum = IOrderEnum.ascendent,
+    ) -> KEYSET_PAGINATION:
+        if order_by is None:
+            order_by = pk_field_name
+        elif order_by not in columns:
+            raise create_query_validation_exception(
+                field="order_by",
+                msg=f"order_by query parameter must be one of: {', '.join(columns)}",
+                type_="value_error",
+            )
+
+        if limit is not None:
+            if limit <= 0:
+                raise create_query_validation_exception(
+                    field="limit", msg="limit query parameter must be greater then zero"
+                )
+
+            elif max_limit and max_limit < limit:
+                raise create_query_validation_exception(
+                    field="limit",
+                    msg=f"limit query parameter must be less then {max_limit}",
+                )
+
+        after = None
+        if cursor is not None:
+            try:
+                cursor_order_by, cursor_order, value, pk = decode_cursor(cursor)
+                if (cursor_order_by, cursor_order) != (order_by, order.value):
+                    raise ValueError("cursor belongs to another ordering")
+                after = (
+                    parse_cursor_value(columns[order_by], value),
+                    parse_cursor_value(columns[pk_field_name], pk),
+                )
+            except (ValueError, TypeError):
+                raise create_query_validation_exception(
+                    field="cursor", msg="Invalid cursor", type_="value_error"
+                )
+
+        return {"after": after, "limit": limit, "order_by": order_by, "order": order}
+
+    return Depends(pagination)
@@ -1,15 +1,21 @@
-from typing import Any, Coroutine, Generator, List, Optional, Type, Union
+from typing import Any, Coroutine, Dict, Generator, List, Optional, Type, Union
 
-from fastapi import Depends, HTTPException
-from sqlalchemy import select
+from fastapi import Depends, HTTPException, Request, Response
+from pydantic import TypeAdapter
+from sqlalchemy import Column, ColumnElement, Result, Select, UniqueConstraint, and_, delete, or_, select, tuple_
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import DeclarativeMeta as Model
 
 import app.crud_sqlalchemy._utils
+from app.base.dao import IOrderEnum
+from app.base.etag import etag_matches, make_etag, not_modified
 from app.crud_sqlalchemy._base import NOT_FOUND, CRUDGenerator
-from app.crud_sqlalchemy._types import DEPENDENCIES, PAGINATION
+from app.crud_sqlalchemy._cache import CACHEABLE_ROUTES, TABLE_INFO_FLAG, TagCache, item_tag, list_tag, table_tag
+from app.crud_sqlalchemy._types import CACHE_POLICY, DEPENDENCIES, KEYSET_PAGINATION, PAGINATION
 from app.crud_sqlalchemy._types import PYDANTIC_SCHEMA as SCHEMA
-from app.database import async_session_maker
+from app.crud_sqlalchemy._utils import keyset_pagination_factory
+from app.database import commit, get_session, rollback
+from app.utils import encode_cursor
 
 CALLABLE = Coroutine[Any, Any, Model | None]
 CALLABLE_LIST = Coroutine[Any, Any, List[Model]]
@@ -25,6 +31,8 @@ class SQLAlchemyCRUDRouter(CRUDGenerator[SCHEMA]):
         prefix: Optional[str] = None,
         tags: Optional[List[str]] = None,
         paginate: Optional[int] = None,
+        keyset: bool = False,
+        cache: Optional[CACHE_POLICY] = None,
         get_all_route: Union[bool, DEPENDENCIES] = True,
         get_one_route: Union[bool, DEPENDENCIES] = True,
         create_route: Union[bool, DEPENDENCIES] = True,
@@ -37,6 +45,24 @@ class SQLAlchemyCRUDRouter(CRUDGenerator[SCHEMA]):
         self.db_model = db_model
         self._pk: str = db_model.__table__.primary_key.columns.keys()[0]
         self._pk_type: type = int
+        self._keyset_columns = self.keyset_columns(db_model.__table__)
+        self._projection = self.projection(db_model.__table__, schema)
+        # Models with app.database.VersionedModel get ETags on Get One
+        self._versioned = "version" in db_model.__table__.columns
+        self.keyset_pagination = keyset_pagination_factory(
+            self._keyset_columns, pk_field_name=self._pk, max_limit=paginate
+        )
+        self.cache = dict(cache or {})
+        unknown = self.cache.keys() - set(CACHEABLE_ROUTES)
+        if unknown:
+            raise ValueError(f"Only {', '.join(CACHEABLE_ROUTES)} routes can be cached, got: {', '.join(unknown)}")
+        # Writes invalidate the cache only for marked tables, see app.database.ResponseCachedModel
+        if self.cache and not db_model.__table__.info.get(TABLE_INFO_FLAG):
+            raise ValueError(
+                f"Table {db_model.__tablename__} is not marked with {TABLE_INFO_FLAG}, its responses can not be cached"
+            )
+        self._tag_cache = TagCache(db_model.__tablename__)
+        self._adapters: Dict[str, TypeAdapter] = {}
 
         super().__init__(
             schema=schema,
@@ -45,6 +71,7 @@ class SQLAlchemyCRUDRouter(CRUDGenerator[SCHEMA]):
             prefix=prefix or db_model.__tablename__,
             tags=tags,
             paginate=paginate,
+            keyset=keyset,
             get_all_route=get_all_route,
             get_one_route=get_one_route,
             create_route=create_route,
@@ -55,40 +82,274 @@ class SQLAlchemyCRUDRouter(CRUDGenerator[SCHEMA]):
         )
 
 
+    @staticmethod
+    def keyset_columns(table) -> Dict[str, Column]:
+        """
+        Columns the keyset mode can order by: the primary key and indexed columns,
+        so every page is an index range scan instead of skipping rows
+        """
+        leading = [next(iter(index.columns)) for index in table.indexes if index.columns]
+        leading += [
+            next(iter(constraint.columns))
+            for constraint in table.constraints
+            if isinstance(constraint, UniqueConstraint) and constraint.columns
+        ]
+        indexed = {column.key for column in leading} | {
+            column.key
+            for column in table.columns
+            if column.primary_key or column.index or column.unique
+        }
+        return {column.key: column for column in table.columns if column.key in indexed}
+
+
+    @staticmethod
+    def projection(table, schema: Type[SCHEMA]) -> Optional[Dict[str, Column]]:
+        """
+        Columns that fill every field of the response schema. Reads select only them
+        and serialize the rows directly, skipping the identity map and instrumentation.
+        None if the schema needs more than plain columns (relationships, properties,
+        aliases): then reads load ORM objects
+        """
+        columns = {column.key: column for column in table.columns}
+        for name, field in schema.model_fields.items():
+            if name not in columns or field.alias is not None or field.validation_alias is not None:
+                return None
+        return {name: columns[name] for name in schema.model_fields}
+
+
+    def _select(self, *keys: str) -> Select:
+        """
+        Select of the response columns plus keys, or of the ORM model
+        """
+        if self._projection is None:
+            return select(self.db_model)
+        table = self.db_model.__table__
+        columns = {**self._projection, **{key: table.c[key] for key in keys}}
+        return select(*(column.label(key) for key, column in columns.items()))
+
+
+    def _rows(self, results: Result) -> List[Any]:
+        if self._projection is None:
+            return results.unique().scalars().all()
+        return results.mappings().all()
+
+
+    def _row_value(self, row: Any, key: str) -> Any:
+        return getattr(row, key) if self._projection is None else row[key]
+
+
+    def _to_items(self, rows: List[Any]) -> List[Any]:
+        if self._projection is None:
+            return rows
+        # Plain dicts: the response TypeAdapter validates them once (see _json_response)
+        return [{key: row[key] for key in self._projection} for row in rows]
+
+
+    def _tags(self, item_id: Any = None) -> List[str]:
+        """
+        Cache tags of a response. The table tag marks every response of the router
+        and is invalidated by writes with unknown rows, e.g. Delete All
+        """
+        table = self.db_model.__tablename__
+        return [table_tag(table), list_tag(table) if item_id is None else item_tag(table, item_id)]
+
+
+    async def _cached(self, route: str, request: Request, tags: List[str]) -> tuple:
+        """
+        The cached response (or None) and the key to store a fresh one under
+        """
+        if route not in self.cache:
+            return None, None
+        entry, key = await self._tag_cache.get(tags, TagCache.request_key(route, request))
+        if entry is None:
+            return None, key
+        etag, body = entry.split("\n", 1)
+        if etag and etag_matches(request, etag):
+            return not_modified(etag), key
+        return Response(body, media_type="application/json", headers={"ETag": etag} if etag else None), key
+
+
+    def _serialized(self, key: Optional[str]) -> bool:
+        """
+        Whether a read returns a pre-serialized response: it is cached, or its rows
+        are projected. FastAPI 0.101 dumps and re-validates model instances returned
+        by a route, so the body is built once by a TypeAdapter instead
+        """
+        return key is not None or self._projection is not None
+
+
+    async def _json_response(
+        self, route: str, key: Optional[str], response_model: Any, result: Any, etag: Optional[str] = None
+    ) -> Response:
+        """
+        Validates and serializes the response once; the same body is cached (if key is set) and sent
+        """
+        if route not in self._adapters:
+            self._adapters[route] = TypeAdapter(response_model)
+        adapter = self._adapters[route]
+        body = adapter.dump_json(adapter.validate_python(result, from_attributes=True)).decode()
+        if key is not None:
+            await self._tag_cache.set(key, f"{etag or ''}\n{body}", self.cache[route])
+        return Response(body, media_type="application/json", headers={"ETag": etag} if etag else None)
+
+
     def _get_all(self, *args: Any, **kwargs: Any) -> CALLABLE_LIST:
+        if self.keyset:
+            return self._get_all_keyset()
+        return self._get_all_offset()
+
+
+    def _get_all_offset(self) -> CALLABLE_LIST:
         async def route(
+            request: Request,
             pagination: PAGINATION = self.pagination,
         ) -> List[Model]:
-            async with async_session_maker() as session:
-                skip, limit = pagination.get("skip"), pagination.get("limit")
-
-                results = await session.execute(
-                    select(self.db_model)
-                    .order_by(getattr(self.db_model, self._pk))
-                    .limit(limit)
-                    .offset(skip)
-                )
+            cached, key = await self._cached("get_all", request, self._tags())
+            if cached is not None:
+                return cached
 
-                db_models = results.unique().scalars().all()
+            result = await self._fetch_all(pagination.get("skip"), pagination.get("limit"))
 
-            return db_models
+            if self._serialized(key):
+                return await self._json_response("get_all", key, self.list_response_model, result)
+            return result
 
         return route
 
 
+    async def _fetch_all(self, skip: Optional[int], limit: Optional[int]) -> List[Any]:
+        async with get_session() as session:
+            results = await session.execute(
+                self._select()
+                .order_by(getattr(self.db_model, self._pk))
+                .limit(limit)
+                .offset(skip)
+            )
+
+            rows = self._rows(results)
+
+        return self._to_items(rows)
+
+
+    def _get_all_keyset(self) -> CALLABLE:
+        async def route(
+            request: Request,
+            pagination: KEYSET_PAGINATION = self.keyset_pagination,
+        ) -> Dict[str, Any]:
+            cached, key = await self._cached("get_all", request, self._tags())
+            if cached is not None:
+                return cached
+
+            limit = pagination["limit"]
+            async with get_session() as session:
+                query = self._keyset_query(
+                    pagination["order_by"], pagination["order"], pagination["after"]
+                )
+                # Lookahead row tells whether there is a next page
+                if limit is not None:
+                    query = query.limit(limit + 1)
+                results = await session.execute(query)
+                rows = self._rows(results)
+
+            next_cursor = None
+            if limit is not None and len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = encode_cursor(
+                    pagination["order_by"],
+                    pagination["order"].value,
+                    self._row_value(rows[-1], pagination["order_by"]),
+                    self._row_value(rows[-1], self._pk),
+                )
+            result = {"items": self._to_items(rows), "next_cursor": next_cursor}
+
+            if self._serialized(key):
+                return await self._json_response("get_all", key, self.list_response_model, result)
+            return result
+
+        return route
+
+
+    def _keyset_query(self, order_by: str, order: IOrderEnum, after: Optional[tuple]) -> Select:
+        """
+        Rows ordered by (order_by, pk) that follow the after key.
+        NULLs go last in ascending and first in descending order, as in PostgreSQL indexes
+        """
+        column = self._keyset_columns[order_by]
+        pk = self._keyset_columns[self._pk]
+        descending = order == IOrderEnum.descendent
+
+        if column is pk:
+            query = self._select(self._pk).order_by(pk.desc() if descending else pk.asc())
+            if after is not None:
+                query = query.where(pk < after[1] if descending else pk > after[1])
+            return query
+
+        if descending:
+            ordering = [column.desc().nulls_first() if column.nullable else column.desc(), pk.desc()]
+        else:
+            ordering = [column.asc().nulls_last() if column.nullable else column.asc(), pk.asc()]
+        query = self._select(order_by, self._pk).order_by(*ordering)
+        if after is not None:
+            query = query.where(self._keyset_after(column, pk, descending, *after))
+        return query
+
+
+    @staticmethod
+    def _keyset_after(
+        column: Column, pk: Column, descending: bool, value: Any, pk_value: Any
+    ) -> ColumnElement[bool]:
+        if value is None:
+            # The cursor is inside the NULL group: rest of it, then (descending) all values
+            rest = and_(column.is_(None), pk < pk_value if descending else pk > pk_value)
+            return or_(rest, column.is_not(None)) if descending else rest
+
+        key = tuple_(column, pk)
+        following = key < (value, pk_value) if descending else key > (value, pk_value)
+        if column.nullable and not descending:
+            return or_(following, column.is_(None))
+        return following
+
+
     def _get_one(self, *args: Any, **kwargs: Any) -> CALLABLE:
         async def route(
             item_id: self._pk_type, 
+            request: Request,
+            response: Response,
         ) -> Model:
-            async with async_session_maker() as session:
-                
-                result = await session.get(self.db_model, item_id)
-
-                if result:
-                    return result
+            cached, key = await self._cached("get_one", request, self._tags(item_id))
+            if cached is not None:
+                return cached
+
+            pk = getattr(self.db_model, self._pk)
+            async with get_session() as session:
+                if self._versioned and request.headers.get("if-none-match"):
+                    # Only the row version is read when the client may already have the item
+                    version = await session.scalar(select(self.db_model.version).where(pk == item_id))
+                    if version is not None:
+                        etag = make_etag(self.db_model.__tablename__, item_id, version)
+                        if etag_matches(request, etag):
+                            return not_modified(etag)
+
+                if self._projection is None:
+                    result = await session.get(self.db_model, item_id)
+                    version = getattr(result, "version", None)
                 else:
+                    keys = ("version",) if self._versioned else ()
+                    results = await session.execute(self._select(*keys).where(pk == item_id))
+                    row = results.mappings().first()
+                    result = self._to_items([row])[0] if row else None
+                    version = row["version"] if row and self._versioned else None
+
+                if not result:
                     raise NOT_FOUND from None
 
+            etag = make_etag(self.db_model.__tablename__, item_id, version) if self._versioned else None
+            if self._serialized(key):
+                return await self._json_response("get_one", key, self.schema, result, etag)
+            if etag:
+                response.headers["ETag"] = etag
+            return result
+
         return route
 
 
@@ -96,15 +357,15 @@ class SQLAlchemyCRUDRouter(CRUDGenerator[SCHEMA]):
         async def route(
             model: self.create_schema,  # type: ignore
         ) -> Model:
-            async with async_session_maker() as session:
+            async with get_session() as session:
                 try:
                     db_model: Model = self.db_model(**model.dict())
                     session.add(db_model)
-                    await session.commit()
+                    await commit(session)
                     await session.refresh(db_model)
                     return db_model
                 except IntegrityError:
-                    await session.rollback()
+                    await rollback(session)
                     raise HTTPException(422, "Key already exists") from None
 
         return route
@@ -115,7 +376,7 @@ class SQLAlchemyCRUDRouter(CRUDGenerator[SCHEMA]):
             item_id: self._pk_type,  # type: ignore
             model: self.update_schema,  # type: ignore
         ) -> Model:
-            async with async_session_maker() as session:
+            async with get_session() as session:
                 try:
                     db_model: Model = await session.get(self.db_model, item_id)
                     if not db_model:
@@ -125,12 +386,12 @@ class SQLAlchemyCRUDRouter(CRUDGenerator[SCHEMA]):
                         if hasattr(db_model, key):
                             setattr(db_model, key, value)
 
-                    await session.commit()
+                    await commit(session)
                     await session.refresh(db_model)
 
                     return db_model
                 except IntegrityError as e:
-                    await session.rollback()
+                    await rollback(session)
                     self._raise(e)
 
         return route
@@ -139,10 +400,10 @@ class SQLAlchemyCRUDRouter(CRUDGenerator[SCHEMA]):
     def _delete_all(self, *args: Any, **kwargs: Any) -> CALLABLE_LIST:
         async def route(
         ) -> List[Model]:
-            async with async_session_maker() as session:
-                session.query(self.db_model).delete()
-                await session.commit()
-                return await self._get_all()(pagination={"skip": 0, "limit":  None})
+            async with get_session() as session:
+                await session.execute(delete(self.db_model))
+                await commit(session)
+            return await self._fetch_all(skip=0, limit=None)
 
         return route
 
@@ -151,12 +412,12 @@ class SQLAlchemyCRUDRouter(CRUDGenerator[SCHEMA]):
         async def route(
             item_id: self._pk_type, 
         ) -> Model:
-            async with async_session_maker() as session:
+            async with get_session() as session:
                 db_model: Model = await session.get(self.db_model, item_id)
                 if not db_model:
                     raise NOT_FOUND from None
-                session.delete(db_model)
-                await session.commit()
+                await session.delete(db_model)
+                await commit(session)
                 return db_model
 
         return route
@@ -1,26 +1,476 @@
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from datetime import datetime
-from typing import AsyncGenerator
+from typing import AsyncGenerator, AsyncIterator, Awaitable, Callable
+from urllib.parse import urlsplit
 
-from sqlalchemy import NullPool
+import time
+import uuid
+
+from redis.exceptions import RedisError
+from sqlalchemy import NullPool, event, exc, text
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.orm import DeclarativeBase, Session, object_mapper
+from sqlalchemy.sql.dml import UpdateBase
 from sqlalchemy.ext.asyncio import async_sessionmaker
-from sqlalchemy import Column, DateTime, Integer, NullPool
+from sqlalchemy import Column, DateTime, Integer, NullPool, literal_column
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
+from app.base.cache import TTLCache
+from app.base.count_cache import row_count_cache
 from app.config import settings
+from app.crud_sqlalchemy._cache import TABLE_INFO_FLAG, invalidate_written
+from app.logger import logger
+from app.prometheus.metrics import (
+    DB_POOL_CHECKED_OUT, DB_POOL_CHECKOUT_SECONDS, DB_POOL_OVERFLOW, DB_POOL_SIZE, DB_POOL_TIMEOUTS,
+    DB_READS, DB_REPLICA_LAG,
+)
+from app.redis_client import redis
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Пул, который отдает в метрики время получения соединения и таймауты ожидания."""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            DB_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - start)
+
 
 if settings.MODE == "TEST":
     DATABASE_URL = settings.TEST_DATABASE_URL
     DATABASE_PARAMS = {"poolclass": NullPool}
 else:
     DATABASE_URL = settings.DATABASE_URL
-    DATABASE_PARAMS = {}
+    # Размеры пула - на один воркер, см. Settings.DB_MAX_CONNECTIONS
+    DATABASE_PARAMS = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": settings.DB_WORKER_POOL_SIZE,
+        "max_overflow": settings.DB_WORKER_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "connect_args": {"prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE},
+    }
+    if settings.DB_STATEMENT_CACHE_SIZE == 0:
+        # pgbouncer в режиме transaction: соединение с сервером общее для разных клиентов,
+        # поэтому выключен и кэш самого asyncpg, а имена выражений не повторяются
+        DATABASE_PARAMS["connect_args"].update(
+            statement_cache_size=0,
+            prepared_statement_name_func=lambda: f"__asyncpg_{uuid.uuid4()}__",
+        )
 
 engine = create_async_engine(DATABASE_URL, **DATABASE_PARAMS)
+
+if isinstance(engine.pool, InstrumentedQueuePool):
+    DB_POOL_SIZE.set_function(engine.pool.size)
+    DB_POOL_CHECKED_OUT.set_function(engine.pool.checkedout)
+    # overflow() отрицателен, пока не открыты все постоянные соединения
+    DB_POOL_OVERFLOW.set_function(lambda: max(0, engine.pool.overflow()))
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
 
-async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+# Сессия текущего HTTP-запроса (unit of work). Пока она задана, DAO работают в ней,
+# а коммит делается один раз в конце запроса
+request_session: ContextVar[AsyncSession | None] = ContextVar("request_session", default=None)
+# Ключ клиента запроса (хэш токена) для чтения своих записей с primary
+request_client: ContextVar[str | None] = ContextVar("request_client", default=None)
+
+
+# Фоновые задачи, запущенные из синхронных обработчиков событий сессии
+background_tasks: set[asyncio.Task] = set()
+
+
+def _spawn(coro: Awaitable[None]) -> None:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        coro.close()
+        return
+    task = loop.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+async def wait_background_tasks() -> None:
+    """Дожидается фоновых задач, например перед закрытием event loop в celery."""
+    if background_tasks:
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+
+
+def mark_written(session: Session | AsyncSession, *tables: str) -> None:
+    """Отмечает запись в таблицы в обход ORM (например, COPY): какие строки записаны, неизвестно."""
+    session.info["wrote"] = True
+    written = session.info.setdefault("written_rows", {})
+    for table in tables:
+        written[table] = None
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_flush_write(session, flush_context):
+    # Таблица -> первичные ключи записанных объектов (None - неизвестные строки)
+    session.info["wrote"] = True
+    written = session.info.setdefault("written_rows", {})
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        table = obj.__table__.name
+        if table in written and written[table] is None:
+            continue
+        pk = object_mapper(obj).primary_key_from_instance(obj)
+        written.setdefault(table, set()).add(pk[0] if len(pk) == 1 else tuple(pk))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_statement_write(orm_execute_state):
+    statement = orm_execute_state.statement
+    if orm_execute_state.is_select:
+        # SELECT с изменяющими CTE (add_cte) - тоже запись. CTE, на которые ссылается
+        # FROM, здесь не видны: такие запросы отмечают запись сами через mark_written
+        tables = [
+            cte.element.table.name
+            for cte in getattr(statement, "_independent_ctes", ())
+            if isinstance(cte.element, UpdateBase)
+        ]
+        if tables:
+            mark_written(orm_execute_state.session, *tables)
+        return
+    table = getattr(statement, "table", None)
+    mark_written(orm_execute_state.session, *([table.name] if table is not None else []))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_caches(session):
+    # Закэшированные подсчеты строк сбрасываются сразу после коммита, см. app.base.count_cache
+    written = session.info.pop("written_rows", None)
+    if not written:
+        return
+    _spawn(row_count_cache.invalidate(*written))
+    # Кэш ответов CRUD-роутеров сбрасывается при любой записи в его таблицы, а не только
+    # через сами роутеры. В запросе сброс выполнит unit_of_work до отправки ответа
+    cached = {
+        table: rows
+        for table, rows in written.items()
+        if table in BaseAlchemyModel.metadata.tables
+        and BaseAlchemyModel.metadata.tables[table].info.get(TABLE_INFO_FLAG)
+    }
+    if not cached:
+        return
+    current = request_session.get()
+    if current is not None and session is current.sync_session:
+        session.info.setdefault("after_commit", []).append((invalidate_written, (cached,)))
+    else:
+        _spawn(invalidate_written(cached))
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_written_tables(session):
+    session.info.pop("written_rows", None)
+
+
+# Ошибки, после которых чтение с реплики повторяется на primary: реплика недоступна,
+# соединение оборвалось или запрос отменен конфликтом с восстановлением
+REPLICA_READ_ERRORS = (exc.OperationalError, exc.InterfaceError, OSError, asyncio.TimeoutError)
+
+
+class ReplicaSession(AsyncSession):
+    """Сессия реплики: при ошибке чтения реплика отмечается недоступной, а запрос
+    (и все следующие запросы этой сессии) выполняется на primary.
+
+    Повторяются execute, scalar, get, stream и stream_scalars. Чтения на primary идут в
+    одной сессии, которая закрывается вместе с этой: иначе поток закрылся бы раньше,
+    чем его дочитают. Ошибка посреди уже начатого потока не повторяется.
+    """
+
+    replica: "Replica"
+    fallback = False
+    # Сессия primary после ошибки реплики; своя, если нет сессии запроса
+    _primary: AsyncSession | None = None
+    _owns_primary = False
+
+    async def execute(self, statement, *args, **kwargs):
+        return await self._read("execute", statement, *args, **kwargs)
+
+    async def scalar(self, statement, *args, **kwargs):
+        return await self._read("scalar", statement, *args, **kwargs)
+
+    async def get(self, entity, ident, *args, **kwargs):
+        return await self._read("get", entity, ident, *args, **kwargs)
+
+    async def stream(self, statement, *args, **kwargs):
+        return await self._read("stream", statement, *args, **kwargs)
+
+    async def stream_scalars(self, statement, *args, **kwargs):
+        return await self._read("stream_scalars", statement, *args, **kwargs)
+
+    async def _read(self, method: str, *args, **kwargs):
+        if not self.fallback:
+            try:
+                return await getattr(super(), method)(*args, **kwargs)
+            except REPLICA_READ_ERRORS:
+                logger.warning(
+                    "Replica read failed, retrying on primary",
+                    extra={"replica": self.replica.name},
+                    exc_info=True,
+                )
+                self.replica.mark_unhealthy()
+                self.fallback = True
+                try:
+                    await self.rollback()
+                except Exception:
+                    pass
+        DB_READS.labels(target="primary", reason="replica_error").inc()
+        if self._primary is None:
+            self._primary = request_session.get()
+            if self._primary is None:
+                self._primary = async_session_maker()
+                self._owns_primary = True
+        return await getattr(self._primary, method)(*args, **kwargs)
+
+    async def close(self) -> None:
+        if self._owns_primary:
+            await self._primary.close()
+        self._primary = None
+        self._owns_primary = False
+        await super().close()
+
+
+class Replica:
+    def __init__(self, url: str, timeout: float):
+        self.name = urlsplit(url).hostname or url
+        params = {**DATABASE_PARAMS}
+        # Недоступная реплика не должна держать запрос весь таймаут подключения asyncpg
+        params["connect_args"] = {**params.get("connect_args", {}), "timeout": timeout}
+        self.engine = create_async_engine(url, **params)
+        self.session_maker = async_sessionmaker(
+            self.engine, class_=ReplicaSession, expire_on_commit=False
+        )
+        # До первой проверки отставания реплика не используется
+        self.lag = float("inf")
+        self.checked_at = float("-inf")
+        self.lock = asyncio.Lock()
+
+    def mark_unhealthy(self) -> None:
+        # Следующая проверка - через check_interval, до нее чтения идут на другие реплики
+        self.lag = float("inf")
+        self.checked_at = time.monotonic()
+        DB_REPLICA_LAG.labels(replica=self.name).set(self.lag)
+
+    def session(self) -> ReplicaSession:
+        session = self.session_maker()
+        session.replica = self
+        session.info["replica"] = self.name
+        return session
+
+
+class ReplicaRouter:
+    """Выбор реплики для чтения.
+
+    Реплики перебираются по кругу, отставание каждой проверяется в фоновой задаче не
+    чаще раза в check_interval секунд и не дольше timeout секунд; запрос проверку не
+    ждет и использует прошлое значение. Реплика, которая отстала больше max_lag, не
+    ответила на проверку или на чтение, пропускается до следующей успешной проверки.
+    Клиенты, которые недавно писали, отмечаются в Redis на sticky_window секунд
+    (чтобы отметку видели все воркеры) и в это время читают с primary.
+    """
+
+    LAG_QUERY = text(
+        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+    )
+
+    def __init__(
+        self,
+        urls: list[str],
+        max_lag: float,
+        check_interval: float,
+        sticky_window: float,
+        timeout: float,
+    ):
+        self.replicas = [Replica(url, timeout) for url in urls]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.timeout = timeout
+        self.sticky_window = sticky_window
+        self.sticky: TTLCache[str, bool] = TTLCache(10000, sticky_window)
+        self._next = itertools.cycle(range(len(self.replicas)))
+
+    @staticmethod
+    def _key(client: str) -> str:
+        return f"db:primary:{client}"
+
+    async def is_sticky(self, client: str) -> bool:
+        if self.sticky.get(client):
+            return True
+        try:
+            return bool(await redis.exists(self._key(client)))
+        except RedisError:
+            # Без Redis не узнать о записи на другом воркере: читаем с primary
+            logger.warning("Cannot check read-your-writes window", exc_info=True)
+            return True
+
+    async def mark_sticky(self, client: str) -> None:
+        self.sticky.set(client, True)
+        try:
+            await redis.set(self._key(client), 1, px=int(self.sticky_window * 1000))
+        except RedisError:
+            logger.warning("Cannot set read-your-writes window", exc_info=True)
+
+    async def _query_lag(self, replica: Replica) -> float:
+        async with replica.engine.connect() as conn:
+            return float((await conn.execute(self.LAG_QUERY)).scalar() or 0)
+
+    async def _check_lag(self, replica: Replica) -> None:
+        async with replica.lock:
+            try:
+                replica.lag = await asyncio.wait_for(self._query_lag(replica), self.timeout)
+            except Exception:
+                logger.warning("Replica lag check failed", extra={"replica": replica.name}, exc_info=True)
+                replica.lag = float("inf")
+            replica.checked_at = time.monotonic()
+            DB_REPLICA_LAG.labels(replica=replica.name).set(replica.lag)
+
+    async def pick(self) -> Replica | None:
+        """Следующая реплика с допустимым отставанием или None."""
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[next(self._next)]
+            stale = time.monotonic() - replica.checked_at > self.check_interval
+            if stale and not replica.lock.locked():
+                _spawn(self._check_lag(replica))
+            if replica.lag <= self.max_lag:
+                return replica
+        return None
+
+    async def dispose(self) -> None:
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+
+replica_router = (
+    ReplicaRouter(
+        settings.DB_REPLICA_URL_LIST,
+        max_lag=settings.DB_REPLICA_MAX_LAG,
+        check_interval=settings.DB_REPLICA_LAG_CHECK_INTERVAL,
+        sticky_window=settings.DB_READ_YOUR_WRITES_WINDOW,
+        timeout=settings.DB_REPLICA_TIMEOUT,
+    )
+    if settings.DB_REPLICA_URL_LIST and settings.MODE != "TEST"
+    else None
+)
+
+
+@asynccontextmanager
+async def get_session() -> AsyncIterator[AsyncSession]:
+    """Сессия запроса, если она открыта, иначе новая сессия на время блока."""
+    session = request_session.get()
+    if session is not None:
+        yield session
+        return
+    async with async_session_maker() as session:
+        yield session
+
+
+@asynccontextmanager
+async def get_read_session() -> AsyncIterator[AsyncSession]:
+    """Сессия только для чтения: реплика, если с нее можно читать, иначе как get_session.
+
+    С primary читают запросы, которые уже писали в своей сессии, и клиенты в окне
+    read-your-writes после записи. Объекты из реплики после блока отсоединены.
+    """
+    session = request_session.get()
+    replica = None
+    if replica_router is None:
+        reason = "no_replicas"
+    elif session is not None and session.info.get("wrote"):
+        reason = "own_write"
+    elif request_client.get() is not None and await replica_router.is_sticky(request_client.get()):
+        reason = "read_your_writes"
+    else:
+        replica = await replica_router.pick()
+        reason = "lag"
+    if replica is None:
+        DB_READS.labels(target="primary", reason=reason).inc()
+        async with get_session() as session:
+            yield session
+        return
+    DB_READS.labels(target="replica", reason="").inc()
+    async with replica.session() as session:
+        yield session
+
+
+@asynccontextmanager
+async def stream_session() -> AsyncIterator[AsyncSession]:
+    """Отдельная от запроса сессия для долгого чтения, например при стриминге ответа.
+
+    Сессия запроса здесь не подходит: unit of work закрывает ее до того, как начнет
+    отдаваться тело StreamingResponse. Читает с реплики, если есть подходящая.
+    """
+    replica = await replica_router.pick() if replica_router is not None else None
+    DB_READS.labels(target="replica" if replica else "primary", reason="" if replica else "stream").inc()
+    async with (replica.session() if replica else async_session_maker()) as session:
+        yield session
+
+
+async def commit(session: AsyncSession) -> None:
+    """Коммит вне запроса. В сессии запроса только flush: коммит сделает unit_of_work."""
+    if session is request_session.get():
+        await session.flush()
+    else:
+        await session.commit()
+
+
+async def after_commit(func: Callable[..., Awaitable[None]], *args) -> None:
+    """Выполняет func(*args) после коммита данных.
+
+    Вне запроса DAO уже закоммитили свою сессию, и func выполняется сразу. В запросе
+    вызов откладывается до коммита unit_of_work и отменяется при откате: иначе,
+    например, сброшенный кэш успели бы заполнить еще не закоммиченными данными.
+    """
+    session = request_session.get()
+    if session is None:
+        await func(*args)
+    else:
+        session.info.setdefault("after_commit", []).append((func, args))
+
+
+@asynccontextmanager
+async def unit_of_work(client: str | None = None) -> AsyncIterator[AsyncSession]:
+    """Открывает сессию запроса и коммитит ее при выходе без исключения.
+
+    Соединение из пула берется при первом запросе к БД и одно на весь блок.
+    client - ключ клиента: после коммита с записью он какое-то время читает с primary.
+    """
     async with async_session_maker() as session:
+        token = request_session.set(session)
+        client_token = request_client.set(client)
+        try:
+            yield session
+            await session.commit()
+        except BaseException:
+            await session.rollback()
+            raise
+        finally:
+            request_session.reset(token)
+            request_client.reset(client_token)
+            callbacks = session.info.pop("after_commit", [])
+        if client is not None and replica_router is not None and session.info.get("wrote"):
+            await replica_router.mark_sticky(client)
+        for func, args in callbacks:
+            await func(*args)
+
+
+async def rollback(session: AsyncSession) -> None:
+    """Откатывает сессию и отменяет отложенные after_commit."""
+    session.info.pop("after_commit", None)
+    await session.rollback()
+
+
+async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+    async with get_session() as session:
         yield session
 
 
@@ -31,3 +481,18 @@ class BaseAlchemyModel(DeclarativeBase):
 class MainModel:
     created_on = Column(DateTime, default=datetime.now())
     updated_on = Column(DateTime, default=datetime.now(), onupdate=datetime.now())
+
+
+class ResponseCachedModel:
+    """Таблица, ответы по которой кэширует SQLAlchemyCRUDRouter: любая запись в нее
+    сбрасывает этот кэш после коммита (см. app.crud_sqlalchemy._cache)."""
+    __table_args__ = {"info": {TABLE_INFO_FLAG: True}}
+
+
+class VersionedModel:
+    """Версия строки для ETag: растет при каждом UPDATE, и через ORM, и через update()."""
+    version = Column(
+        Integer, nullable=False, default=1, server_default="1", onupdate=literal_column("version + 1")
+    )
+    # Новая версия возвращается тем же UPDATE (RETURNING), а не отдельной ленивой загрузкой
+    __mapper_args__ = {"eager_defaults": True}
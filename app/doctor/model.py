@@ -1,4 +1,4 @@
-from app.database import BaseAlchemyModel, MainModel
+from app.database import BaseAlchemyModel, MainModel, ResponseCachedModel, VersionedModel
 from app.user.model import User
 from app.chat.model import Chat
 from sqlalchemy import JSON, Column, Date, ForeignKey, Integer, String, Table
@@ -7,7 +7,7 @@ from sqlalchemy.orm import relationship
 
 
 
-class Doctor(BaseAlchemyModel, MainModel):
+class Doctor(BaseAlchemyModel, MainModel, ResponseCachedModel, VersionedModel):
     __tablename__ = "doctor"
     id = Column(Integer, primary_key=True, nullable=False, index=True, unique=True)
 
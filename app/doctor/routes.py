@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends
 
 from app.auth.auth import current_active_user, current_admin_user
+from app.config import settings
 from app.crud_sqlalchemy.sqlalchemy import SQLAlchemyCRUDRouter
 from app.doctor.dao import DoctorDAO
 from app.doctor.model import Doctor
@@ -14,6 +15,7 @@ router = SQLAlchemyCRUDRouter(
     tags=["Doctor"],
     db_model=Doctor,
     schema=SDoctor, 
+    cache={"get_all": settings.CRUD_CACHE_TTL, "get_one": settings.CRUD_CACHE_TTL},
     delete_all_route=[Depends(current_admin_user)],
     delete_one_route=[Depends(current_admin_user)],
     dependencies=[Depends(current_active_user)]     
@@ -27,6 +27,10 @@ class IncorrectTokenFormatException(ChatException):
     status_code=status.HTTP_401_UNAUTHORIZED
     detail="Неверный формат токена"
         
+class IncorrectRefreshTokenException(ChatException):
+    status_code=status.HTTP_401_UNAUTHORIZED
+    detail="Refresh-токен недействителен или истек"
+
 class UserIsNotPresentException(ChatException):
     status_code=status.HTTP_401_UNAUTHORIZED
 
@@ -37,3 +41,23 @@ class CannotAddDataToDatabase(ChatException):
 class CannotProcessCSV(ChatException):
     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
     detail="Не удалось обработать CSV файл"
+
+class ImportJobNotFoundException(ChatException):
+    status_code=status.HTTP_404_NOT_FOUND
+    detail="Задача импорта не найдена"
+
+class ImportJobNotResumableException(ChatException):
+    status_code=status.HTTP_409_CONFLICT
+    detail="Задача импорта завершена или еще выполняется"
+
+class ChatNotFoundException(ChatException):
+    status_code=status.HTTP_404_NOT_FOUND
+    detail="Чат не найден"
+
+class ChatAccessDeniedException(ChatException):
+    status_code=status.HTTP_403_FORBIDDEN
+    detail="Вы не участник этого чата"
+
+class IncorrectCursorException(ChatException):
+    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY
+    detail="Некорректный курсор"
@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta
+from typing import Any
+
+from fastapi_pagination import Params
+from sqlalchemy import and_, func, insert, or_, select, update
+
+from app.base.dao import BaseDAO
+from app.base.schemas import CountedPage, CountStrategy
+from app.database import commit, get_session
+from app.importer.model import ImportJob
+from app.importer.schemas import SImportJob
+
+
+class ImportJobLeaseLost(Exception):
+    """Задачу забрал другой запуск: этот должен остановиться, не сохраняя прогресс."""
+
+
+class ImportJobDAO(BaseDAO[ImportJob, SImportJob, SImportJob]):
+    model = ImportJob
+
+    @classmethod
+    async def create_job(
+        cls, *, job_id: str, table_name: str, file_name: str, created_by_id: int | None = None
+    ) -> SImportJob:
+        async with get_session() as session:
+            stmt = (
+                insert(ImportJob)
+                .values(
+                    id=job_id,
+                    table_name=table_name,
+                    file_name=file_name,
+                    created_by_id=created_by_id,
+                    updated_at=datetime.utcnow(),
+                )
+                .returning(ImportJob)
+            )
+            job = (await session.execute(stmt)).scalar_one()
+            await commit(session)
+            return SImportJob.model_validate(job)
+
+    @classmethod
+    async def get_user_jobs(
+        cls, user_id: int, params: Params, count_strategy: CountStrategy
+    ) -> CountedPage[ImportJob]:
+        query = (
+            select(ImportJob)
+            .where(ImportJob.created_by_id == user_id)
+            .order_by(ImportJob.created_at.desc(), ImportJob.id)
+        )
+        return await cls.get_multi_paginated(params=params, query=query, count_strategy=count_strategy)
+
+    @classmethod
+    async def _update(cls, job_id: str, *where, **values: Any) -> SImportJob | None:
+        async with get_session() as session:
+            stmt = (
+                update(ImportJob)
+                .where(ImportJob.id == job_id, *where)
+                .values(updated_at=datetime.utcnow(), **values)
+                .returning(ImportJob)
+            )
+            job = (await session.execute(stmt)).scalar_one_or_none()
+            await commit(session)
+            return SImportJob.model_validate(job) if job is not None else None
+
+    @classmethod
+    async def start(cls, job_id: str, owner: str, stale_after: float) -> SImportJob | None:
+        """Забирает задачу запуском owner и переводит ее в running.
+
+        Забрать можно задачу в очереди, упавшую или running, которая не обновлялась
+        stale_after секунд (воркер умер). None, если задачу уже выполняет другой запуск
+        (например, celery повторно доставил ее живому воркеру) или она завершена.
+        """
+        stale = datetime.utcnow() - timedelta(seconds=stale_after)
+        return await cls._update(
+            job_id,
+            or_(
+                ImportJob.status.in_(("queued", "failed")),
+                and_(ImportJob.status == "running", ImportJob.updated_at < stale),
+            ),
+            status="running",
+            lease_owner=owner,
+            error=None,
+            started_at=func.coalesce(ImportJob.started_at, datetime.utcnow()),
+        )
+
+    @classmethod
+    def _leased(cls, owner: str) -> tuple:
+        return ImportJob.status == "running", ImportJob.lease_owner == owner
+
+    @classmethod
+    async def checkpoint(cls, job_id: str, owner: str, **progress: Any) -> None:
+        """Сохраняет прогресс. В unit of work - в одной транзакции со вставкой пачки.
+
+        Если задачу забрал другой запуск, бросает ImportJobLeaseLost: транзакция с пачкой
+        откатывается, и строки не вставляются дважды.
+        """
+        if await cls._update(job_id, *cls._leased(owner), **progress) is None:
+            raise ImportJobLeaseLost(job_id)
+
+    @classmethod
+    async def finish(cls, job_id: str, owner: str) -> None:
+        await cls._update(
+            job_id, *cls._leased(owner), status="done", lease_owner=None, finished_at=datetime.utcnow()
+        )
+
+    @classmethod
+    async def fail(cls, job_id: str, owner: str, error: str) -> None:
+        await cls._update(job_id, *cls._leased(owner), status="failed", lease_owner=None, error=error)
+
+    @classmethod
+    async def requeue(cls, job_id: str, stale_after: float) -> SImportJob | None:
+        """Возвращает в очередь упавшую задачу или задачу, которая не обновлялась
+        stale_after секунд (воркер умер). None, если задачу продолжать нельзя."""
+        stale = datetime.utcnow() - timedelta(seconds=stale_after)
+        return await cls._update(
+            job_id,
+            or_(
+                ImportJob.status == "failed",
+                and_(ImportJob.status.in_(("queued", "running")), ImportJob.updated_at < stale),
+            ),
+            status="queued",
+        )
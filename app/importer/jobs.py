@@ -0,0 +1,116 @@
+"""
+Фоновый импорт CSV в celery.
+
+Загруженный файл сохраняется в IMPORT_SPOOL_DIR, а задача - в таблицу import_job.
+Воркер читает файл потоково (CSVRowReader) и вставляет его пачками; каждая пачка
+и прогресс задачи (committed_line и счетчики) коммитятся одной транзакцией.
+Поэтому перезапущенная задача продолжает со строки после committed_line и не
+вставляет уже загруженные строки повторно.
+
+Каждый запуск забирает задачу своим lease_owner, и прогресс сохраняется только при
+совпадении владельца. Если задачу забрал другой запуск (например, ее перезапустили
+через resume, пока первый воркер еще работал), первый останавливается, а его
+незакоммиченная пачка откатывается.
+"""
+import asyncio
+import shutil
+import uuid
+from pathlib import Path
+from typing import IO
+
+from app.config import settings
+from app.database import engine, unit_of_work, wait_background_tasks
+from app.importer.dao import ImportJobDAO, ImportJobLeaseLost
+from app.importer.schemas import SImportChunkError, SImportJob
+from app.importer.utils import TABLE_MODEL_MAP, CSVRowReader
+from app.logger import logger
+
+
+def spool_path(file_name: str) -> Path:
+    return Path(settings.IMPORT_SPOOL_DIR) / file_name
+
+
+def spool_file(file: IO[bytes], file_name: str) -> None:
+    """Копирует загруженный файл в каталог задач импорта (блокирующая операция)."""
+    path = spool_path(file_name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("wb") as spooled:
+        shutil.copyfileobj(file, spooled)
+
+
+async def run_import_job(job_id: str) -> None:
+    """Точка входа задачи celery: каждый запуск идет в своем event loop."""
+    try:
+        await _run_import_job(job_id)
+    finally:
+        # Соединения пула и фоновые задачи привязаны к event loop этого запуска
+        await wait_background_tasks()
+        await engine.dispose()
+
+
+async def _run_import_job(job_id: str) -> None:
+    owner = uuid.uuid4().hex
+    job = await ImportJobDAO.start(job_id, owner, settings.IMPORT_JOB_STALE_SECONDS)
+    if job is None:
+        logger.info("Import job is not startable", extra={"job_id": job_id})
+        return
+    path = spool_path(job.file_name)
+    try:
+        await _import(job, owner, path)
+    except ImportJobLeaseLost:
+        logger.warning("Import job taken over by another run", extra={"job_id": job_id})
+        return
+    except Exception as e:
+        logger.error("Import job failed", extra={"job_id": job_id}, exc_info=True)
+        await ImportJobDAO.fail(job_id, owner, str(e) or e.__class__.__name__)
+        return
+    await ImportJobDAO.finish(job_id, owner)
+    path.unlink(missing_ok=True)
+
+
+async def _import(job: SImportJob, owner: str, path: Path) -> None:
+    dao = TABLE_MODEL_MAP[job.table_name]
+    with path.open("rb") as file:
+        reader = await asyncio.to_thread(
+            CSVRowReader, dao.model, file, ";", settings.IMPORT_MAX_ROW_ERRORS, job.committed_line
+        )
+        # Продолжение: счетчики и ошибки - с прошлого коммита
+        reader.rows_read, reader.rows_invalid = job.rows_read, job.rows_invalid
+        reader.row_errors = list(job.row_errors)
+        inserted, chunks, chunk_errors = job.inserted, job.chunks, list(job.chunk_errors)
+        while True:
+            batch, first_line, last_line = await asyncio.to_thread(
+                reader.read_batch, settings.DB_BULK_CHUNK_SIZE
+            )
+            async with unit_of_work():
+                if batch:
+                    result = await dao.add_bulk(batch, chunk_size=len(batch))
+                    inserted += result.inserted
+                    chunk_errors += [
+                        SImportChunkError(
+                            chunk=chunks, first_line=first_line, last_line=last_line,
+                            rows=error.rows, error=error.error,
+                        )
+                        for error in result.errors
+                    ]
+                    chunks += 1
+                await ImportJobDAO.checkpoint(
+                    job.id,
+                    owner,
+                    committed_line=reader.line,
+                    rows_read=reader.rows_read,
+                    rows_invalid=reader.rows_invalid,
+                    inserted=inserted,
+                    chunks=chunks,
+                    ignored_columns=reader.ignored_columns,
+                    row_errors=[error.model_dump() for error in reader.row_errors],
+                    chunk_errors=[error.model_dump() for error in chunk_errors],
+                )
+            if not batch:
+                break
+            logger.info("Import progress", extra={
+                "job_id": job.id,
+                "table": job.table_name,
+                "rows_read": reader.rows_read,
+                "inserted": inserted,
+            })
@@ -0,0 +1,38 @@
+from datetime import datetime
+
+from sqlalchemy import JSON, Column, DateTime, Integer, String
+
+from app.database import BaseAlchemyModel
+
+
+class ImportJob(BaseAlchemyModel):
+    """Фоновый импорт CSV. Прогресс обновляется в одной транзакции со вставкой пачки,
+    поэтому committed_line - последняя строка файла, которая точно учтена в БД."""
+    __tablename__ = 'import_job'
+    id = Column(String(32), primary_key=True)
+
+    table_name = Column(String, nullable=False)
+    file_name = Column(String, nullable=False)
+    # queued, running, done, failed
+    status = Column(String, nullable=False, default="queued")
+
+    rows_read = Column(Integer, nullable=False, default=0)
+    rows_invalid = Column(Integer, nullable=False, default=0)
+    inserted = Column(Integer, nullable=False, default=0)
+    chunks = Column(Integer, nullable=False, default=0)
+    committed_line = Column(Integer, nullable=False, default=0)
+    ignored_columns = Column(JSON, nullable=False, default=list)
+    row_errors = Column(JSON, nullable=False, default=list)
+    chunk_errors = Column(JSON, nullable=False, default=list)
+    error = Column(String, nullable=True)
+    # запуск воркера, который сейчас выполняет задачу: прогресс сохраняет только он
+    lease_owner = Column(String(32), nullable=True)
+
+    created_by_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    def __str__(self) -> str:
+        return f"I#{self.id}:{self.table_name}:{self.status}"
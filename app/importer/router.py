@@ -1,12 +1,20 @@
-import codecs
-import csv
-from typing import Literal
+import asyncio
+import uuid
 
 from fastapi import APIRouter, Depends, UploadFile
+from fastapi_pagination import Params
 
-from app.exceptions import CannotAddDataToDatabase, CannotProcessCSV
-from app.importer.utils import TABLE_MODEL_MAP, convert_csv_to_postgres_format
 from app.auth.auth import current_active_user
+from app.base.schemas import CountedPage, CountStrategy
+from app.config import settings
+from app.database import after_commit
+from app.exceptions import ImportJobNotFoundException, ImportJobNotResumableException
+from app.importer.dao import ImportJobDAO
+from app.importer.jobs import spool_file
+from app.importer.schemas import SImportJob
+from app.importer.utils import ImportTableName
+from app.tasks.tasks import import_csv_job
+from app.user.model import User
 
 router = APIRouter(
     prefix="/import",
@@ -14,23 +22,67 @@ router = APIRouter(
 )
 
 
+async def enqueue_import_job(job_id: str) -> None:
+    import_csv_job.delay(job_id)
+
+
+async def get_my_job(job_id: str, user: User = Depends(current_active_user)) -> SImportJob:
+    job = await ImportJobDAO.get_one_or_none(id=job_id)
+    if job is None or (job.created_by_id != user.id and not user.is_superuser):
+        raise ImportJobNotFoundException
+    return SImportJob.model_validate(job)
+
+
 @router.post(
     "/{table_name}",
-    status_code=201,
-    dependencies=[Depends(current_active_user)],
+    status_code=202,
+    response_model=SImportJob,
 )
 async def import_data_to_table(
     file: UploadFile,
-    table_name: Literal["doctors", "patients", "users", "chats"],
+    table_name: ImportTableName,
+    user: User = Depends(current_active_user),
 ):
-    ModelDAO = TABLE_MODEL_MAP[table_name]
     # Внутри переменной file хранятся атрибуты:
     # file - сам файл, filename - название файла, size - размер файла.
-    csvReader = csv.DictReader(codecs.iterdecode(file.file, 'utf-8'), delimiter=";")
-    data = convert_csv_to_postgres_format(csvReader)
-    file.file.close()
-    if not data:
-        raise CannotProcessCSV
-    added_data = await ModelDAO.add_bulk(data)
-    if not added_data:
-        raise CannotAddDataToDatabase
+    # Файл сохраняется на диск, импорт выполняет celery (см. app.importer.jobs)
+    job_id = uuid.uuid4().hex
+    file_name = f"{job_id}.csv"
+    try:
+        await asyncio.to_thread(spool_file, file.file, file_name)
+    finally:
+        await file.close()
+    job = await ImportJobDAO.create_job(
+        job_id=job_id, table_name=table_name, file_name=file_name, created_by_id=user.id
+    )
+    # Воркер должен увидеть задачу в БД: ставим в очередь после коммита запроса
+    await after_commit(enqueue_import_job, job_id)
+    return job
+
+
+@router.get("/jobs", response_model=CountedPage[SImportJob])
+async def get_my_import_jobs(
+    params: Params = Depends(),
+    count_strategy: CountStrategy = CountStrategy.exact,
+    user: User = Depends(current_active_user),
+):
+    """Задачи импорта текущего пользователя, новые первыми.
+
+    count_strategy выбирает, как считается total (см. CountStrategy), и возвращается в ответе.
+    """
+    return await ImportJobDAO.get_user_jobs(user.id, params, count_strategy)
+
+
+@router.get("/jobs/{job_id}", response_model=SImportJob)
+async def get_import_job(job: SImportJob = Depends(get_my_job)):
+    return job
+
+
+@router.post("/jobs/{job_id}/resume", status_code=202, response_model=SImportJob)
+async def resume_import_job(job: SImportJob = Depends(get_my_job)):
+    """Перезапускает упавшую или зависшую задачу с последней закоммиченной пачки."""
+    job = await ImportJobDAO.requeue(job.id, settings.IMPORT_JOB_STALE_SECONDS)
+    if job is None:
+        raise ImportJobNotResumableException
+    await after_commit(enqueue_import_job, job.id)
+    return job
@@ -0,0 +1,50 @@
+from datetime import datetime
+
+from pydantic import BaseModel, ConfigDict, Field, computed_field
+
+
+class SImportRowError(BaseModel):
+    line: int
+    error: str
+
+
+class SImportChunkError(BaseModel):
+    # пачка не вставлена целиком: строки файла first_line..last_line
+    chunk: int
+    first_line: int
+    last_line: int
+    rows: int
+    error: str
+
+
+class SImportJob(BaseModel):
+    model_config = ConfigDict(from_attributes=True)  # type: ignore
+
+    id: str
+    table_name: str
+    # имя файла в IMPORT_SPOOL_DIR, клиенту не отдается
+    file_name: str = Field(exclude=True)
+    status: str
+    rows_read: int = 0
+    rows_invalid: int = 0
+    inserted: int = 0
+    chunks: int = 0
+    committed_line: int = 0
+    ignored_columns: list[str] = []
+    # первые IMPORT_MAX_ROW_ERRORS ошибок разбора строк
+    row_errors: list[SImportRowError] = []
+    chunk_errors: list[SImportChunkError] = []
+    error: str | None = None
+    created_by_id: int | None = None
+    created_at: datetime
+    started_at: datetime | None = None
+    updated_at: datetime | None = None
+    finished_at: datetime | None = None
+
+    @computed_field
+    @property
+    def rows_per_second(self) -> int:
+        end = self.finished_at or self.updated_at
+        if self.started_at is None or end is None or end <= self.started_at:
+            return 0
+        return round(self.rows_read / (end - self.started_at).total_seconds())
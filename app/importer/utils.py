@@ -1,29 +1,189 @@
-import datetime
+import codecs
+import csv
 import json
-from typing import Iterable
+from datetime import date, datetime
+from typing import IO, Any, Callable, Iterator, Literal
+
+from sqlalchemy import Column
 
 # from app.chat.dao import ChatDAO
+from app.exceptions import CannotProcessCSV
+from app.importer.schemas import SImportRowError
 from app.user.dao import UserDAO
-from app.logger import logger
 
 TABLE_MODEL_MAP = {
     "users": UserDAO,
     # "chat": ChatDAO,
 }
+# Таблицы, в которые можно импортировать (ключи TABLE_MODEL_MAP): остальные
+# отклоняются валидацией пути (422)
+ImportTableName = Literal["users"]
+
+TRUE_VALUES = {"1", "true", "t", "yes", "y"}
+FALSE_VALUES = {"0", "false", "f", "no", "n"}
+
 
+def parse_bool(value: str) -> bool:
+    value = value.lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValueError(f"not a boolean: {value!r}")
 
-def convert_csv_to_postgres_format(csv_iterable: Iterable):
+
+def parse_json(value: str) -> Any:
     try:
-        data = []
-        for row in csv_iterable:
-            for k, v in row.items():
-                if v.isdigit():
-                    row[k] = int(v)
-                elif k == "services":
-                    row[k] = json.loads(v.replace("'", '"'))
-                elif "date" in k:
-                    row[k] = datetime.strptime(v, "%Y-%m-%d")
-            data.append(row)
-        return data
-    except Exception:
-        logger.error("Cannot convert CSV into DB format", exc_info=True)
+        return json.loads(value)
+    except json.JSONDecodeError:
+        # Списки в выгрузках записаны в синтаксисе Python: ['a', 'b']
+        return json.loads(value.replace("'", '"'))
+
+
+CONVERTERS: dict[type, Callable[[str], Any]] = {
+    bool: parse_bool,
+    int: int,
+    float: float,
+    datetime: datetime.fromisoformat,
+    date: date.fromisoformat,
+    dict: parse_json,
+    list: parse_json,
+}
+
+
+def column_converter(column: Column) -> Callable[[str], Any]:
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return str
+    return CONVERTERS.get(python_type, str)
+
+
+class CSVRowReader:
+    """Потоково читает CSV и приводит значения к типам колонок модели.
+
+    Файл не читается целиком: read_batch отдает очередную пачку валидных строк.
+    Пустое значение - NULL или значение по умолчанию колонки. Строки с ошибками
+    пропускаются и попадают в row_errors (не больше max_errors), номера строк - как
+    в файле, считая заголовок первой строкой. Так же пропускаются строки, которые не
+    декодируются из UTF-8 или не разбираются как CSV (NUL, слишком длинное поле).
+    Строки до skip_lines включительно уже обработаны (продолжение импорта) и не разбираются.
+    """
+
+    def __init__(
+        self, model, file: IO[bytes], delimiter: str = ";", max_errors: int = 100, skip_lines: int = 0
+    ):
+        # Ошибка декодирования текущей записи: ее отклоняет rows()
+        self._decode_error: str | None = None
+        self.reader = csv.DictReader(self._decode(file), delimiter=delimiter)
+        columns = {column.key: column for column in model.__table__.columns}
+        try:
+            header = self.reader.fieldnames or []
+        except csv.Error:
+            raise CannotProcessCSV
+        if self._decode_error is not None:
+            raise CannotProcessCSV
+        self.columns = {name: columns[name] for name in header if name in columns}
+        if not self.columns:
+            raise CannotProcessCSV
+        self.ignored_columns = [name for name in header if name not in columns]
+        self.converters = {name: column_converter(column) for name, column in self.columns.items()}
+        required = {
+            name for name, column in columns.items()
+            if not column.nullable and column.default is None and column.server_default is None
+            and not (column.primary_key and column.autoincrement in (True, "auto"))
+        }
+        if not required <= self.columns.keys():
+            raise CannotProcessCSV
+        self.required = [name for name in self.columns if name in required]
+        self.max_errors = max_errors
+        self.skip_lines = skip_lines
+        self.rows_read = 0
+        self.rows_invalid = 0
+        self.row_errors: list[SImportRowError] = []
+        self._rows = self.rows()
+
+    def _decode(self, file: IO[bytes]) -> Iterator[str]:
+        """Декодирует файл построчно. Перевод строки в UTF-8 не бывает частью другого
+        символа, поэтому битая строка не портит следующие."""
+        decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        for line_num, line in enumerate(file, 1):
+            try:
+                yield decoder.decode(line)
+            except UnicodeDecodeError as e:
+                self._decode_error = f"line {line_num} is not valid UTF-8: {e.reason} at byte {e.start}"
+                decoder = codecs.getincrementaldecoder("utf-8")()
+                yield line.decode("utf-8", errors="replace")
+
+    @staticmethod
+    def _default(column: Column) -> Any:
+        default = column.default
+        if default is None or not (default.is_scalar or default.is_callable):
+            return None
+        return default.arg if default.is_scalar else default.arg(None)
+
+    def _convert(self, raw: dict[str | None, str | None]) -> dict[str, Any]:
+        if None in raw:
+            raise ValueError("more values than columns in header")
+        row = {}
+        for name, column in self.columns.items():
+            value = raw[name]
+            if value is None:
+                raise ValueError("fewer values than columns in header")
+            if value == "":
+                # Значение по умолчанию подставляется здесь, чтобы у всех строк пачки были одни ключи
+                row[name] = self._default(column)
+                continue
+            try:
+                row[name] = self.converters[name](value)
+            except (ValueError, TypeError) as e:
+                raise ValueError(f"{name}: {e}")
+        missing = [name for name in self.required if row.get(name) is None]
+        if missing:
+            raise ValueError(f"required columns are empty: {', '.join(missing)}")
+        return row
+
+    def rows(self) -> Iterator[tuple[int, dict[str, Any]]]:
+        while True:
+            raw, error = None, None
+            try:
+                raw = next(self.reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                # Разбор продолжается со следующей строки файла
+                error = f"malformed CSV: {e}"
+            if self._decode_error is not None:
+                error, self._decode_error = self._decode_error, None
+            if self.line_num <= self.skip_lines:
+                continue
+            self.rows_read += 1
+            try:
+                if error is not None:
+                    raise ValueError(error)
+                yield self.line_num, self._convert(raw)
+            except ValueError as e:
+                self.rows_invalid += 1
+                if len(self.row_errors) < self.max_errors:
+                    self.row_errors.append(SImportRowError(line=self.line_num, error=str(e)))
+
+    @property
+    def line_num(self) -> int:
+        # Счетчик самого csv.reader: DictReader.line_num не обновляется, если строка не разобрана
+        return self.reader.reader.line_num
+
+    @property
+    def line(self) -> int:
+        """Последняя прочитанная строка файла."""
+        return max(self.line_num, self.skip_lines)
+
+    def read_batch(self, size: int) -> tuple[list[dict[str, Any]], int, int]:
+        """Следующие size валидных строк и номера первой и последней из них в файле."""
+        batch, first_line, last_line = [], 0, 0
+        for line, row in self._rows:
+            batch.append(row)
+            first_line = first_line or line
+            last_line = line
+            if len(batch) >= size:
+                break
+        return batch, first_line, last_line
@@ -1,18 +1,20 @@
+import hashlib
 import json
 import time
 from fastapi.staticfiles import StaticFiles
-from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi_cache import FastAPICache
 from fastapi_cache.backends.redis import RedisBackend
 from prometheus_fastapi_instrumentator import Instrumentator
-from redis import asyncio as aioredis
 from sqladmin import Admin
 import sentry_sdk
 
 from app.admin.views import AttachmentsAdmin, ChatsAdmin, DoctorsAdmin, MessagesAdmin, PatientsAdmin, UsersAdmin, AccessTokenAdmin
 from app.config import settings
-from app.database import engine
+from app.crud_sqlalchemy._cache import PREFIX as RESPONSE_CACHE_PREFIX
+from app.database import engine, replica_router, rollback, unit_of_work
+from app.redis_client import redis
 
 from app.images.router import router as router_images
 from app.chat.router import router as router_chats
@@ -64,16 +66,10 @@ app.add_middleware(
 
 app.include_router(router_pages)
 
-if settings.MODE == "TEST":
-    # При тестировании через pytest, необходимо подключать Redis, чтобы кэширование работало.
-    # Иначе декоратор @cache из библиотеки fastapi-cache ломает выполнение кэшируемых эндпоинтов.
-    redis = aioredis.from_url(f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}", encoding="utf8", decode_responses=True)
-    FastAPICache.init(RedisBackend(redis), prefix="cache")
-
-@app.on_event("startup")
-def startup():
-    redis = aioredis.from_url(f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}", encoding="utf8", decode_responses=True)
-    FastAPICache.init(RedisBackend(redis), prefix="cache")
+# Кэш ответов на общем клиенте Redis. Инициализируется при импорте, а не в startup:
+# так кэш работает и в тестах, где события startup не вызываются (см. SQLAlchemyCRUDRouter).
+# Префикс общий с версиями тегов, которые сбрасывает app.database после коммита.
+FastAPICache.init(RedisBackend(redis), prefix=RESPONSE_CACHE_PREFIX)
 
 
 # Подключение эндпоинта для отображения метрик для их дальнейшего сбора Прометеусом
@@ -97,6 +93,20 @@ admin.add_view(AttachmentsAdmin)
 
 app.mount("/static", StaticFiles(directory="app/static"), "static")
 
+@app.middleware("http")
+async def request_unit_of_work(request: Request, call_next):
+    # Все DAO запроса работают в одной сессии: одно соединение из пула и один коммит.
+    # Ответ с ошибкой откатывает все, что запрос успел записать.
+    # Клиент определяется по токену: после записи он читает свои данные с primary
+    authorization = request.headers.get("authorization")
+    client = hashlib.sha256(authorization.encode()).hexdigest() if authorization else None
+    async with unit_of_work(client) as session:
+        response = await call_next(request)
+        if response.status_code >= 400:
+            await rollback(session)
+    return response
+
+
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
     start_time = time.time()
@@ -110,20 +120,67 @@ async def add_process_time_header(request: Request, call_next):
 
 
 
+from app.auth.auth import authenticate_token
+from app.chat.dao import ChatDAO
 from app.chat.ws_router import ws_manager
+from app.exceptions import ChatAccessDeniedException, ChatNotFoundException
+from app.auth.token_cache import token_user_cache
+
+@app.on_event("startup")
+async def start_ws_manager():
+    await ws_manager.start()
+
+
+@app.on_event("shutdown")
+async def stop_ws_manager():
+    await ws_manager.stop()
+
+
+@app.on_event("shutdown")
+async def dispose_replicas():
+    if replica_router is not None:
+        await replica_router.dispose()
+
+
+@app.on_event("startup")
+async def start_token_cache():
+    await token_user_cache.start()
+
+
+@app.on_event("shutdown")
+async def stop_token_cache():
+    await token_user_cache.stop()
+
 
 @app.websocket("/ws/{chat_id}")
-async def websocket_endpoint(websocket: WebSocket, chat_id: int):
-    await ws_manager.connect(websocket, client_id=chat_id)
+async def websocket_endpoint(websocket: WebSocket, chat_id: int, token: str | None = None):
+    # Пользователь определяется по токену, как в HTTP: браузер не передает заголовки
+    # в WebSocket, поэтому токен можно передать и в query
+    authorization = websocket.headers.get("authorization", "")
+    scheme, _, bearer = authorization.partition(" ")
+    user = await authenticate_token(token or (bearer if scheme.lower() == "bearer" else None))
+    if user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    try:
+        await ChatDAO.get_member_chat(chat_id, user.id)
+    except (ChatNotFoundException, ChatAccessDeniedException):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await ws_manager.connect(websocket, client_id=chat_id, user_id=user.id)
     try:
         while True:
             message_text = await websocket.receive_text()
-            message_data = json.loads(message_text)
-            await ws_manager.broadcast(chat_id= chat_id, 
-                                       message_data=message_data, 
-                                       add_to_db=True)
+            try:
+                message_data = json.loads(message_text)
+            except json.JSONDecodeError:
+                # Битый кадр отклоняется, соединение остается открытым
+                logger.warning("Rejected malformed websocket frame", extra={"chat_id": chat_id})
+                continue
+            await ws_manager.receive(websocket, message_data)
     except WebSocketDisconnect:
-        ws_manager.disconnect(websocket)
-        await ws_manager.broadcast(chat_id= chat_id,  
-                                   message_data={},
-                                   add_to_db=False)
+        pass
+    finally:
+        # Соединение снимается при любом выходе, иначе остаются его писатель, счетчик
+        # соединений пользователя и не уходит кадр presence об уходе из чата
+        await ws_manager.disconnect(websocket)
@@ -1,11 +1,11 @@
-from app.database import BaseAlchemyModel, MainModel
+from app.database import BaseAlchemyModel, MainModel, ResponseCachedModel, VersionedModel
 from app.user.model import User
 from sqlalchemy import Column, Date, ForeignKey, Integer, String
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 
-class Patient(BaseAlchemyModel, MainModel):
+class Patient(BaseAlchemyModel, MainModel, ResponseCachedModel, VersionedModel):
     __tablename__ = "patient"
     id = Column(Integer, primary_key=True, nullable=False, index=True, unique=True)
 
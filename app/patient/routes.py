@@ -2,6 +2,7 @@ from typing import Annotated
 from fastapi import APIRouter, Depends
 
 from app.auth.auth import current_active_user, current_admin_user
+from app.config import settings
 from app.crud_sqlalchemy.sqlalchemy import SQLAlchemyCRUDRouter
 from app.database import get_async_session
 from app.doctor.schemas import SDoctor
@@ -16,6 +17,7 @@ router = SQLAlchemyCRUDRouter(
     tags=["Patient"],
     db_model=Patient,
     schema=SPatientRead,
+    cache={"get_all": settings.CRUD_CACHE_TTL, "get_one": settings.CRUD_CACHE_TTL},
     delete_all_route=[Depends(current_admin_user)],
     delete_one_route=[Depends(current_admin_user)],
     dependencies=[Depends(current_active_user)]
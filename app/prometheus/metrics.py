@@ -0,0 +1,86 @@
+# Метрики приложения. Регистрируются в общем реестре prometheus_client,
+# поэтому отдаются тем же эндпоинтом /metrics, что и метрики Instrumentator.
+from prometheus_client import Counter, Gauge, Histogram
+
+# database
+DB_POOL_SIZE = Gauge(
+    "db_pool_size",
+    "Постоянные соединения в пуле воркера",
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "Соединения пула, выданные в работу",
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow",
+    "Открытые соединения сверх постоянного размера пула",
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds",
+    "Время получения соединения из пула, включая ожидание и pre-ping",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10),
+)
+DB_POOL_TIMEOUTS = Counter(
+    "db_pool_timeouts_total",
+    "Запросы, не дождавшиеся свободного соединения за DB_POOL_TIMEOUT",
+)
+DB_READS = Counter(
+    "db_reads_total",
+    "Сессии чтения по месту выполнения и причине выбора primary",
+    ["target", "reason"],
+)
+DB_REPLICA_LAG = Gauge(
+    "db_replica_lag_seconds",
+    "Отставание реплики по последней проверке",
+    ["replica"],
+)
+
+# websocket
+WS_CONNECTIONS = Gauge(
+    "ws_connections",
+    "Открытые WebSocket-соединения воркера",
+)
+WS_OUTBOUND_QUEUE_DEPTH = Gauge(
+    "ws_outbound_queue_depth",
+    "Сообщения в исходящих очередях всех соединений воркера",
+)
+WS_OUTBOUND_QUEUE_MAX_DEPTH = Gauge(
+    "ws_outbound_queue_max_depth",
+    "Самая длинная исходящая очередь среди соединений воркера",
+)
+WS_OUTBOUND_DROPPED = Counter(
+    "ws_outbound_dropped_total",
+    "Сообщения, не поставленные в переполненную исходящую очередь",
+)
+WS_SLOW_CONSUMER_EVICTIONS = Counter(
+    "ws_slow_consumer_evictions_total",
+    "Соединения, отключенные из-за медленного клиента",
+    ["reason"],
+)
+WS_EPHEMERAL_FRAMES = Counter(
+    "ws_ephemeral_frames_total",
+    "Эфемерные кадры (typing, presence, ack) по результату обработки",
+    ["type", "outcome"],
+)
+
+# chat
+CHAT_TAIL_CACHE_REQUESTS = Counter(
+    "chat_tail_cache_requests_total",
+    "Обращения к кэшу последних сообщений чатов по уровню кэша и результату",
+    ["layer", "result"],
+)
+
+# auth
+AUTH_TOKEN_CACHE_REQUESTS = Counter(
+    "auth_token_cache_requests_total",
+    "Обращения к кэшу токен -> пользователь",
+    ["result"],
+)
+AUTH_TOKEN_LOOKUP_SECONDS = Histogram(
+    "auth_token_lookup_seconds",
+    "Время поиска токена и пользователя в БД при промахе кэша",
+)
+AUTH_TOKEN_CACHE_SAVED_SECONDS = Counter(
+    "auth_token_cache_saved_seconds_total",
+    "Оценка сэкономленного кэшем времени: среднее время промаха на каждое попадание",
+)
@@ -0,0 +1,6 @@
+from redis import asyncio as aioredis
+
+from app.config import settings
+
+# Общий клиент Redis воркера. Соединения создаются лениво при первом запросе.
+redis = aioredis.from_url(settings.REDIS_URL, encoding="utf8", decode_responses=True)
@@ -1,3 +1,4 @@
+import asyncio
 import smtplib
 from pathlib import Path
 
@@ -5,6 +6,7 @@ from PIL import Image
 from pydantic import EmailStr
 
 from app.config import settings
+from app.importer.jobs import run_import_job
 from app.tasks.celery import celery
 from app.tasks.email_templates import create_chat_confirmation_template
 from app.logger import logger
@@ -37,3 +39,12 @@ def process_pic(
     ]:
         resized_img = im.resize(size=(width, height))
         resized_img.save(f"app/static/images/resized_{width}_{height}_{im_path.name}")
+
+
+@celery.task(acks_late=True, reject_on_worker_lost=True)
+def import_csv_job(
+    job_id: str,
+):
+    # Задача подтверждается после выполнения: если воркер умрет, celery отдаст ее
+    # другому воркеру, и импорт продолжится с последней закоммиченной пачки
+    asyncio.run(run_import_job(job_id))
@@ -0,0 +1,57 @@
+import secrets
+
+import pytest
+from sqlalchemy import event, insert, select
+
+from app.database import async_session_maker, engine
+from app.user.model import AccessToken, User
+
+
+@pytest.fixture
+async def auth_headers(prepare_database):
+    async with async_session_maker() as session:
+        user_ids = (await session.execute(select(User.id).order_by(User.id).limit(2))).scalars().all()
+        token = secrets.token_urlsafe()
+        await session.execute(insert(AccessToken).values(token=token, user_id=user_ids[0]))
+        await session.commit()
+    return {"Authorization": f"Bearer {token}"}, user_ids[1]
+
+
+@pytest.fixture
+def counters():
+    # Соединения из пула и коммиты, считаются через события SQLAlchemy
+    counters = {"checkout": 0, "commit": 0}
+
+    def on_checkout(*args):
+        counters["checkout"] += 1
+
+    def on_commit(*args):
+        counters["commit"] += 1
+
+    event.listen(engine.sync_engine, "checkout", on_checkout)
+    event.listen(engine.sync_engine, "commit", on_commit)
+    yield counters
+    event.remove(engine.sync_engine, "checkout", on_checkout)
+    event.remove(engine.sync_engine, "commit", on_commit)
+
+
+async def test_request_uses_one_connection_and_one_commit(ac, auth_headers, counters):
+    headers, other_user_id = auth_headers
+    response = await ac.post("/chats", params={"other_user_id": other_user_id}, headers=headers)
+    assert response.status_code == 200
+    chat_id = response.json()["chat_id"]
+
+    requests = [
+        ("GET", "/chats", {}),
+        ("POST", "/chats", {"other_user_id": other_user_id}),
+        ("GET", f"/chats/{chat_id}", {}),
+        ("PUT", f"/chats/{chat_id}/read", {}),
+        ("DELETE", f"/chats/{chat_id}", {}),
+    ]
+    for method, url, params in requests:
+        counters.update(checkout=0, commit=0)
+        response = await ac.request(method, url, params=params, headers=headers)
+        assert response.status_code < 400, (method, url, response.text)
+        # Все DAO запроса работают в одной сессии unit_of_work
+        assert counters["checkout"] <= 1, (method, url)
+        assert counters["commit"] <= 1, (method, url)
@@ -0,0 +1,75 @@
+import io
+
+import pytest
+from sqlalchemy import Boolean, Column, Integer, String
+from sqlalchemy.orm import DeclarativeBase
+
+from app.exceptions import CannotProcessCSV
+from app.importer.utils import CSVRowReader
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class Person(Base):
+    __tablename__ = "person"
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    age = Column(Integer, nullable=True)
+    active = Column(Boolean, default=True, nullable=False)
+
+
+def reader(text: bytes, **kwargs) -> CSVRowReader:
+    return CSVRowReader(Person, io.BytesIO(text), **kwargs)
+
+
+def test_converts_values_and_fills_defaults():
+    csv_reader = reader(b"name;age;active;unknown\nann;30;yes;x\nbob;;;y\n")
+    batch, first_line, last_line = csv_reader.read_batch(10)
+    assert batch == [
+        {"name": "ann", "age": 30, "active": True},
+        {"name": "bob", "age": None, "active": True},
+    ]
+    assert (first_line, last_line) == (2, 3)
+    assert csv_reader.ignored_columns == ["unknown"]
+    assert (csv_reader.rows_read, csv_reader.rows_invalid) == (2, 0)
+
+
+def test_invalid_rows_are_recorded_with_file_lines():
+    text = b"name;age\nann;30\nbob;old\n;5\ncid;1;extra\ndan\n\xff\xfe;1\neve;2\n"
+    csv_reader = reader(text)
+    batch, first_line, last_line = csv_reader.read_batch(10)
+    assert batch == [{"name": "ann", "age": 30}, {"name": "eve", "age": 2}]
+    assert (first_line, last_line) == (2, 8)
+    assert [error.line for error in csv_reader.row_errors] == [3, 4, 5, 6, 7]
+    assert csv_reader.row_errors[0].error.startswith("age:")
+    assert "name" in csv_reader.row_errors[1].error
+    assert "UTF-8" in csv_reader.row_errors[4].error
+    assert (csv_reader.rows_read, csv_reader.rows_invalid) == (7, 5)
+
+
+def test_row_errors_are_capped():
+    csv_reader = reader(b"name;age\n" + b"x;bad\n" * 5, max_errors=2)
+    assert csv_reader.read_batch(10)[0] == []
+    assert len(csv_reader.row_errors) == 2
+    assert csv_reader.rows_invalid == 5
+
+
+def test_batches_and_resume():
+    text = b"name\n" + b"".join(f"n{i}\n".encode() for i in range(5))
+    csv_reader = reader(text)
+    assert csv_reader.read_batch(2) == ([{"name": "n0"}, {"name": "n1"}], 2, 3)
+    assert csv_reader.line == 3
+
+    # Продолжение импорта: строки до 3-й включительно уже обработаны
+    resumed = reader(text, skip_lines=3)
+    assert resumed.read_batch(10) == ([{"name": "n2"}, {"name": "n3"}, {"name": "n4"}], 4, 6)
+    assert resumed.rows_read == 3
+
+
+@pytest.mark.parametrize("text", [b"", b"unknown\nx\n", b"age\n1\n"])
+def test_unusable_header(text):
+    # Пустой файл, ни одной известной колонки, нет обязательной колонки
+    with pytest.raises(CannotProcessCSV):
+        reader(text)
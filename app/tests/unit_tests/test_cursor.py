@@ -0,0 +1,36 @@
+from datetime import date, datetime
+
+import pytest
+
+from app.utils import decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        (1,),
+        ("b", 2),
+        (None, 5),
+        (1.5, "строка", True),
+    ],
+)
+def test_roundtrip(values):
+    assert decode_cursor(encode_cursor(*values)) == list(values)
+
+
+def test_dates_are_isoformat():
+    moment = datetime(2023, 9, 1, 12, 30, 15)
+    assert decode_cursor(encode_cursor(moment, date(2023, 9, 1), 7)) == [moment.isoformat(), "2023-09-01", 7]
+
+
+def test_cursor_is_url_safe_without_padding():
+    cursor = encode_cursor("???>>>", 1)
+    assert "=" not in cursor
+    assert "+" not in cursor and "/" not in cursor
+
+
+@pytest.mark.parametrize("cursor", ["%%%", "bm90IGpzb24", "eyJhIjogMX0", "MQ"])
+def test_garbage_raises_value_error(cursor):
+    # Не base64, не JSON, JSON-объект и JSON-число вместо списка
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
@@ -0,0 +1,60 @@
+import pytest
+from sqlalchemy import Column, Integer, MetaData, Table, create_engine, insert, select
+
+from app.crud_sqlalchemy.sqlalchemy import SQLAlchemyCRUDRouter
+
+metadata = MetaData()
+items = Table(
+    "items",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("value", Integer, nullable=True),
+)
+VALUES = [3, None, 1, 3, None, 2, 1, None, 5]
+
+
+@pytest.fixture(scope="module")
+def connection():
+    engine = create_engine("sqlite://")
+    with engine.connect() as connection:
+        metadata.create_all(connection)
+        connection.execute(insert(items), [{"id": i, "value": v} for i, v in enumerate(VALUES, 1)])
+        yield connection
+
+
+def ordering(descending: bool):
+    # Как в SQLAlchemyCRUDRouter._keyset_query: NULL в конце по возрастанию и в начале по убыванию
+    if descending:
+        return [items.c.value.desc().nulls_first(), items.c.id.desc()]
+    return [items.c.value.asc().nulls_last(), items.c.id.asc()]
+
+
+def pages(connection, descending: bool, size: int) -> list[tuple]:
+    rows, after = [], None
+    while True:
+        query = select(items.c.value, items.c.id).order_by(*ordering(descending)).limit(size)
+        if after is not None:
+            query = query.where(
+                SQLAlchemyCRUDRouter._keyset_after(items.c.value, items.c.id, descending, *after)
+            )
+        page = [tuple(row) for row in connection.execute(query)]
+        rows.extend(page)
+        if len(page) < size:
+            return rows
+        after = page[-1]
+
+
+@pytest.mark.parametrize("descending", [False, True])
+@pytest.mark.parametrize("size", [1, 2, 3, 4])
+def test_pages_cover_all_rows_in_order(connection, descending, size):
+    expected = [tuple(row) for row in connection.execute(select(items.c.value, items.c.id).order_by(*ordering(descending)))]
+    assert len(expected) == len(VALUES)
+    assert pages(connection, descending, size) == expected
+
+
+def test_not_nullable_column_has_no_null_branch():
+    column = Column("value", Integer, nullable=False)
+    pk = Column("id", Integer, primary_key=True)
+    Table("strict", MetaData(), pk, column)
+    condition = SQLAlchemyCRUDRouter._keyset_after(column, pk, False, 1, 2)
+    assert "IS NULL" not in str(condition)
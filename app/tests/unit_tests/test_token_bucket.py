@@ -0,0 +1,33 @@
+import pytest
+
+from app.chat import ws_router
+from app.chat.ws_router import TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ws_router.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_burst_then_limited(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.take() for _ in range(4)] == [True, True, True, False]
+
+
+def test_refills_with_rate(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    for _ in range(3):
+        bucket.take()
+    clock[0] += 0.25
+    assert not bucket.take()
+    clock[0] += 0.25
+    assert bucket.take()
+    assert not bucket.take()
+
+
+def test_refill_is_capped_by_burst(clock):
+    bucket = TokenBucket(rate=10, burst=2)
+    clock[0] += 60
+    assert [bucket.take() for _ in range(3)] == [True, True, False]
@@ -5,12 +5,12 @@ from fastapi.security import OAuth2AuthorizationCodeBearer
 from fastapi_users_db_sqlalchemy import SQLAlchemyUserDatabase
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi_users_db_sqlalchemy.access_token import SQLAlchemyAccessTokenDatabase
-from app.database import async_session_maker
+from app.database import get_session
 from app.user.model import AccessToken, User
 
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
-    async with async_session_maker() as session:
+    async with get_session() as session:
         yield session
 
 async def get_user_db(session: AsyncSession = Depends(get_async_session)):
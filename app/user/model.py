@@ -3,7 +3,7 @@ from sqlalchemy.orm import Mapped, mapped_column, relationship, declared_attr
 from fastapi_users_db_sqlalchemy.access_token import (
     SQLAlchemyBaseAccessTokenTable,
 )
-from app.database import BaseAlchemyModel, MainModel
+from app.database import BaseAlchemyModel, MainModel, VersionedModel
 
 
 class AccessToken(SQLAlchemyBaseAccessTokenTable[int], BaseAlchemyModel):
@@ -18,7 +18,7 @@ class AccessToken(SQLAlchemyBaseAccessTokenTable[int], BaseAlchemyModel):
         return f"T#{self.user_id}: {self.created_at.strftime('%Y-%m-%d %H:%M:%S')}"
 
 
-class User(BaseAlchemyModel, MainModel):
+class User(BaseAlchemyModel, MainModel, VersionedModel):
     __tablename__ = "user"
     id = Column(Integer, primary_key=True, nullable=False, index=True, unique=True)
 
@@ -2,7 +2,7 @@ import enum
 from typing import Literal, Optional
 
 from fastapi_users import schemas
-from pydantic import ConfigDict, EmailStr, constr
+from pydantic import BaseModel, ConfigDict, EmailStr, constr
 from sqlalchemy import Enum, String
 
 
@@ -36,3 +36,13 @@ class SUserRead(schemas.BaseUser[int]):
 
 class SUserUpdate(schemas.BaseUserUpdate):
     model_config = ConfigDict(from_attributes=True)  # type: ignore
+
+
+class STokenPair(BaseModel):
+    access_token: str
+    refresh_token: str
+    token_type: str = "bearer"
+
+
+class SRefreshToken(BaseModel):
+    refresh_token: str
@@ -1,4 +1,10 @@
-from datetime import datetime, timedelta
+import base64
+import json
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
 
 
 def get_month_days(date: datetime = datetime.today()):
@@ -17,3 +23,28 @@ def format_number_thousand_separator(
     separator: str = " ",
 ):
     return f"{number:,}".replace(",", separator)
+
+
+def encode_cursor(*values) -> str:
+    """Упаковывает значения ключа сортировки в непрозрачный курсор для клиента."""
+    payload = json.dumps(
+        [value.isoformat() if isinstance(value, date) else value for value in values],
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    """Распаковывает курсор, созданный encode_cursor. Бросает ValueError на мусоре."""
+    padded = cursor + "=" * (-len(cursor) % 4)
+    values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    if not isinstance(values, list):
+        raise ValueError("cursor must contain a list")
+    return values
+
+
+def batched(iterable: Iterable[T], size: int) -> Iterator[list[T]]:
+    """Разбивает итерируемое на списки по size элементов, не читая его целиком."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
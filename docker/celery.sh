@@ -1,7 +1,7 @@
 #!/bin/bash
 
 if [[ "${1}" == "celery" ]]; then
-    celery --app=app.tasks.celery:celery worker -l INFO
+    celery --app=app.tasks.celery:celery worker -l INFO --concurrency=${CELERY_CONCURRENCY:-2}
 elif [[ "${1}" == "flower" ]]; then
     celery --app=app.tasks.celery:celery flower
 fi
\ No newline at end of file
@@ -0,0 +1,67 @@
+"""
+Замер скорости BaseDAO.add_bulk на синтетических пользователях.
+
+Сравнивается загрузка через COPY (add_bulk на asyncpg) с INSERT executemany теми же
+пачками. Число строк - первый аргумент (по умолчанию миллион, для INSERT берется
+не больше 100 000). Скрипт удаляет созданных пользователей после замера, поэтому
+запускать его следует только на тестовой базе:
+
+    MODE=TEST python helpers/bench_add_bulk.py 1000000
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import delete, insert
+
+from app.config import settings
+from app.database import async_session_maker
+from app.user.dao import UserDAO
+from app.user.model import User
+from app.utils import batched
+
+INSERT_MAX_ROWS = 100_000
+
+
+def users(count: int, prefix: str):
+    for i in range(count):
+        yield {"email": f"{prefix}_{i}@bench.local", "hashed_password": "-", "type": "patient", "name": f"User {i}"}
+
+
+async def insert_executemany(count: int) -> None:
+    async with async_session_maker() as session:
+        for chunk in batched(users(count, "bulk_insert"), settings.DB_BULK_CHUNK_SIZE):
+            await session.execute(insert(User), chunk)
+        await session.commit()
+
+
+async def cleanup() -> None:
+    async with async_session_maker() as session:
+        await session.execute(delete(User).where(User.email.like("bulk_%@bench.local")))
+        await session.commit()
+
+
+async def main():
+    assert settings.MODE == "TEST", "Запускайте замер только на тестовой базе (MODE=TEST)"
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    try:
+        start = time.perf_counter()
+        result = await UserDAO.add_bulk(users(count, "bulk_copy"))
+        elapsed = time.perf_counter() - start
+        print(f"add_bulk (COPY):      {result.inserted:>9} rows {elapsed:8.2f} s {result.inserted / elapsed:>10.0f} rows/s")
+        assert not result.errors, result.errors
+
+        insert_count = min(count, INSERT_MAX_ROWS)
+        start = time.perf_counter()
+        await insert_executemany(insert_count)
+        elapsed = time.perf_counter() - start
+        print(f"INSERT executemany:   {insert_count:>9} rows {elapsed:8.2f} s {insert_count / elapsed:>10.0f} rows/s")
+    finally:
+        await cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+"""
+Замер времени построения списка чатов (GET /chats) в зависимости от числа чатов.
+
+Сравнивается старая реализация (1 + 2N запросов) с текущей
+ChatDAO.get_chats_list_by_user_id (один запрос).
+Скрипт создает тестовые данные и удаляет их после замера, поэтому запускать его
+следует только на тестовой базе:
+
+    MODE=TEST python helpers/bench_chats_list.py
+"""
+import asyncio
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import delete, insert, select, text
+
+from app.chat.dao import ChatDAO
+from app.chat.model import Chat, Message
+from app.config import settings
+from app.database import async_session_maker
+from app.user.model import User
+
+CHAT_COUNTS = (10, 100, 500, 1000)
+MESSAGES_PER_CHAT = 20
+REPEATS = 5
+
+
+async def get_chats_list_n_plus_one(user_id: int) -> int:
+    """Прежняя реализация: собеседник и последнее сообщение запрашиваются на каждый чат."""
+    async with async_session_maker() as session:
+        stmt = select(Chat).filter((Chat.user1_id == user_id) | (Chat.user2_id == user_id))
+        user_chats = (await session.execute(stmt)).scalars().all()
+        for chat in user_chats:
+            interlocutor_id = chat.user2_id if chat.user1_id == user_id else chat.user1_id
+            await session.get(User, interlocutor_id)
+            stmt = text(
+                "SELECT * FROM message WHERE chat_id = :chat_id ORDER BY timestamp DESC LIMIT 1"
+            ).bindparams(chat_id=chat.id)
+            (await session.execute(stmt)).first()
+    return len(user_chats)
+
+
+async def seed(chat_count: int) -> tuple[int, list[int]]:
+    async with async_session_maker() as session:
+        users = [
+            {"email": f"bench_{chat_count}_{i}@bench.local", "hashed_password": "-", "type": "patient"}
+            for i in range(chat_count + 1)
+        ]
+        user_ids = (await session.execute(insert(User).returning(User.id), users)).scalars().all()
+        owner_id, partner_ids = user_ids[0], user_ids[1:]
+
+        chats = [{"user1_id": owner_id, "user2_id": partner_id} for partner_id in partner_ids]
+        chat_ids = (await session.execute(insert(Chat).returning(Chat.id), chats)).scalars().all()
+
+        now = datetime.now()
+        messages = [
+            {
+                "chat_id": chat_id,
+                "sender_id": owner_id if i % 2 else partner_id,
+                "content": f"message {i}",
+                "timestamp": now - timedelta(minutes=MESSAGES_PER_CHAT - i),
+                "is_read": False,
+            }
+            for chat_id, partner_id in zip(chat_ids, partner_ids)
+            for i in range(MESSAGES_PER_CHAT)
+        ]
+        await session.execute(insert(Message), messages)
+        await session.commit()
+    return owner_id, list(user_ids)
+
+
+async def cleanup(user_ids: list[int]) -> None:
+    async with async_session_maker() as session:
+        chat_ids = select(Chat.id).where(Chat.user1_id.in_(user_ids))
+        await session.execute(delete(Message).where(Message.chat_id.in_(chat_ids)))
+        await session.execute(delete(Chat).where(Chat.user1_id.in_(user_ids)))
+        await session.execute(delete(User).where(User.id.in_(user_ids)))
+        await session.commit()
+
+
+async def measure(func, user_id: int) -> float:
+    await func(user_id)  # прогрев
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        await func(user_id)
+    return (time.perf_counter() - start) / REPEATS * 1000
+
+
+async def main():
+    assert settings.MODE == "TEST", "Запускайте замер только на тестовой базе (MODE=TEST)"
+    print(f"{'chats':>8} {'1 + 2N, ms':>12} {'single query, ms':>18}")
+    for chat_count in CHAT_COUNTS:
+        owner_id, user_ids = await seed(chat_count)
+        try:
+            before = await measure(get_chats_list_n_plus_one, owner_id)
+            after = await measure(ChatDAO.get_chats_list_by_user_id, owner_id)
+        finally:
+            await cleanup(user_ids)
+        print(f"{chat_count:>8} {before:>12.1f} {after:>18.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
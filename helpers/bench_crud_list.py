@@ -0,0 +1,95 @@
+"""
+Замер скорости GET /doctors (строк в секунду) до и после проекции колонок в
+SQLAlchemyCRUDRouter.
+
+"До" - роутер загружает ORM-объекты Doctor (как раньше), "после" - выбирает только
+колонки схемы ответа и сериализует строки одним TypeAdapter. Запросы идут через
+ASGI-приложение целиком, с сериализацией ответа. Число врачей - первый аргумент (по умолчанию 10 000).
+Скрипт создает тестовых пользователей и врачей и удаляет их после замера, поэтому
+запускать его следует только на тестовой базе:
+
+    MODE=TEST python helpers/bench_crud_list.py 10000
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import httpx
+from sqlalchemy import delete, insert
+
+from app.auth.auth import current_active_user
+from app.config import settings
+from app.database import async_session_maker
+from app.doctor.model import Doctor
+from app.doctor.routes import router as router_doctor
+from app.main import app
+from app.user.model import User
+
+REPEATS = 5
+
+
+async def seed(count: int) -> list[int]:
+    async with async_session_maker() as session:
+        users = [
+            {"email": f"crud_{i}@bench.local", "hashed_password": "-", "type": "doctor"}
+            for i in range(count)
+        ]
+        user_ids = (await session.execute(insert(User).returning(User.id), users)).scalars().all()
+        doctors = [
+            {
+                "user_id": user_id,
+                "first_name": "Bench",
+                "last_name": f"Doctor {i}",
+                "gender": "М",
+                "medical_institution": "Bench clinic",
+                "jobTitle": "therapist",
+            }
+            for i, user_id in enumerate(user_ids)
+        ]
+        await session.execute(insert(Doctor), doctors)
+        await session.commit()
+    return list(user_ids)
+
+
+async def cleanup(user_ids: list[int]) -> None:
+    async with async_session_maker() as session:
+        await session.execute(delete(Doctor).where(Doctor.user_id.in_(user_ids)))
+        await session.execute(delete(User).where(User.id.in_(user_ids)))
+        await session.commit()
+
+
+async def measure(client: httpx.AsyncClient, count: int) -> float:
+    response = await client.get("/doctors", params={"limit": count})  # прогрев
+    response.raise_for_status()
+    rows = len(response.json())
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        await client.get("/doctors", params={"limit": count})
+    return rows * REPEATS / (time.perf_counter() - start)
+
+
+async def main():
+    assert settings.MODE == "TEST", "Запускайте замер только на тестовой базе (MODE=TEST)"
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    app.dependency_overrides[current_active_user] = lambda: User(id=0, email="bench@bench.local")
+    user_ids = await seed(count)
+    projection = router_doctor._projection
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            router_doctor._projection = None
+            before = await measure(client, count)
+            router_doctor._projection = projection
+            after = await measure(client, count)
+    finally:
+        router_doctor._projection = projection
+        await cleanup(user_ids)
+    print(f"ORM entities:      {before:>10.0f} rows/s")
+    print(f"column projection: {after:>10.0f} rows/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
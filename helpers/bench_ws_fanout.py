@@ -0,0 +1,88 @@
+"""
+Замер пропускной способности рассылки сообщений чата между воркерами через Redis.
+
+Запускается N процессов-подписчиков (как воркеры gunicorn), каждый подписан на все
+чаты через RedisBroadcastBackend. Один процесс публикует сообщения, замеряется,
+сколько доставок в секунду получают воркеры в сумме.
+
+    python helpers/bench_ws_fanout.py [воркеров] [сообщений] [чатов]
+"""
+import asyncio
+import multiprocessing
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from redis import asyncio as aioredis
+
+from app.chat.broadcast import RedisBroadcastBackend
+from app.config import settings
+
+
+def run_worker(chat_count: int, expected: int, ready, results) -> None:
+    async def worker():
+        redis = aioredis.from_url(settings.REDIS_URL, encoding="utf8", decode_responses=True)
+        backend = RedisBroadcastBackend(redis)
+        received = 0
+        done = asyncio.Event()
+
+        async def handler(chat_id: int, payload: str):
+            nonlocal received
+            received += 1
+            if received >= expected:
+                done.set()
+
+        await backend.start(handler)
+        for chat_id in range(chat_count):
+            await backend.subscribe(chat_id)
+        ready.release()
+        await asyncio.wait_for(done.wait(), timeout=120)
+        results.put(time.perf_counter())
+        await backend.stop()
+        await redis.close()
+
+    asyncio.run(worker())
+
+
+async def publish(message_count: int, chat_count: int) -> float:
+    redis = aioredis.from_url(settings.REDIS_URL, encoding="utf8", decode_responses=True)
+    backend = RedisBroadcastBackend(redis)
+    payload = '{"chat_id": 0, "sender_id": 1, "content": "benchmark"}'
+    start = time.perf_counter()
+    for i in range(message_count):
+        await backend.publish(i % chat_count, payload)
+    await redis.close()
+    return start
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+    chats = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+
+    ready = multiprocessing.Semaphore(0)
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(chats, messages, ready, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.acquire()
+    time.sleep(0.5)  # даем подпискам дойти до Redis
+
+    start = asyncio.run(publish(messages, chats))
+    finished = max(results.get() for _ in processes)
+    for process in processes:
+        process.join()
+
+    elapsed = finished - start
+    print(f"workers={workers} messages={messages} chats={chats}")
+    print(f"published: {messages / elapsed:,.0f} msg/s, delivered: {messages * workers / elapsed:,.0f} msg/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Проверка маршрутизации чтения между primary и репликами.
+
+Нужна пара баз из docker-compose.replica.yml и DB_REPLICA_URLS в окружении. Скрипт
+создает двух пользователей, ждет, пока они доедут до реплики, и через приложение
+(с middleware unit of work) выполняет запросы, считая соединения, взятые из пулов
+primary и реплик:
+
+- чтение без предшествующей записи идет на реплику;
+- после записи клиент DB_READ_YOUR_WRITES_WINDOW секунд читает с primary;
+- по истечении окна чтение возвращается на реплику.
+
+Тестовые пользователи и их чаты удаляются после проверки:
+
+    python helpers/check_replica_routing.py
+"""
+import asyncio
+import secrets
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from httpx import AsyncClient
+from sqlalchemy import delete, event, insert, select
+
+from app.chat.model import Chat
+from app.config import settings
+from app.database import async_session_maker, engine, replica_router
+from app.main import app
+from app.user.model import AccessToken, User
+
+counters = {"primary": 0, "replica": 0}
+
+
+def counter(target: str):
+    def on_checkout(*args):
+        counters[target] += 1
+    return on_checkout
+
+
+async def seed() -> tuple[list[int], str]:
+    async with async_session_maker() as session:
+        users = [
+            {"email": f"replica_{i}@bench.local", "hashed_password": "-", "type": "patient"}
+            for i in range(2)
+        ]
+        user_ids = (await session.execute(insert(User).returning(User.id), users)).scalars().all()
+        token = secrets.token_urlsafe()
+        await session.execute(insert(AccessToken).values(token=token, user_id=user_ids[0]))
+        await session.commit()
+    return list(user_ids), token
+
+
+async def wait_replicated(user_id: int) -> None:
+    for replica in replica_router.replicas:
+        async with replica.session_maker() as session:
+            while await session.scalar(select(User.id).where(User.id == user_id)) is None:
+                await asyncio.sleep(0.1)
+
+
+async def cleanup(user_ids: list[int]) -> None:
+    async with async_session_maker() as session:
+        await session.execute(delete(Chat).where(Chat.user1_id.in_(user_ids)))
+        await session.execute(delete(User).where(User.id.in_(user_ids)))
+        await session.commit()
+
+
+async def request(client: AsyncClient, method: str, url: str, expected: str, **params) -> None:
+    counters.update(primary=0, replica=0)
+    response = await client.request(method, url, params=params)
+    print(
+        f"{method + ' ' + url:<20} {response.status_code:>6} "
+        f"{counters['primary']:>8} {counters['replica']:>8}"
+    )
+    assert counters[expected] > 0, f"{method} {url}: ожидалось чтение с {expected}"
+
+
+async def main():
+    assert replica_router is not None, "Задайте DB_REPLICA_URLS (см. docker-compose.replica.yml)"
+    user_ids, token = await seed()
+    listeners = [(engine.sync_engine, counter("primary"))]
+    listeners += [(replica.engine.sync_engine, counter("replica")) for replica in replica_router.replicas]
+    for target, listener in listeners:
+        event.listen(target, "checkout", listener)
+    try:
+        await wait_replicated(user_ids[1])
+        async with AsyncClient(
+            app=app, base_url="http://test", headers={"Authorization": f"Bearer {token}"}
+        ) as client:
+            print(f"{'request':<20} {'status':>6} {'primary':>8} {'replica':>8}")
+            await request(client, "GET", "/chats", "replica")
+            await request(client, "POST", "/chats", "primary", other_user_id=user_ids[1])
+            await request(client, "GET", "/chats", "primary")
+            await asyncio.sleep(settings.DB_READ_YOUR_WRITES_WINDOW)
+            await request(client, "GET", "/chats", "replica")
+    finally:
+        for target, listener in listeners:
+            event.remove(target, "checkout", listener)
+        await cleanup(user_ids)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+"""
+Подсчет соединений, взятых из пула, и коммитов на один HTTP-запрос.
+
+Запросы идут через приложение целиком (с middleware unit of work), события пула
+и коммитов считаются через SQLAlchemy events. Для каждого запроса ожидается не больше
+одного соединения и одного коммита. Скрипт создает тестовых пользователей и удаляет
+их после замера, поэтому запускать его следует только на тестовой базе:
+
+    MODE=TEST python helpers/count_pool_checkouts.py
+"""
+import asyncio
+import secrets
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from httpx import AsyncClient
+from sqlalchemy import delete, event, insert
+
+from app.chat.model import Chat
+from app.config import settings
+from app.database import async_session_maker, engine
+from app.main import app
+from app.user.model import AccessToken, User
+
+counters = {"checkout": 0, "commit": 0}
+
+
+def on_checkout(*args):
+    counters["checkout"] += 1
+
+
+def on_commit(*args):
+    counters["commit"] += 1
+
+
+async def seed() -> tuple[list[int], str]:
+    async with async_session_maker() as session:
+        users = [
+            {"email": f"checkouts_{i}@bench.local", "hashed_password": "-", "type": "patient"}
+            for i in range(2)
+        ]
+        user_ids = (await session.execute(insert(User).returning(User.id), users)).scalars().all()
+        token = secrets.token_urlsafe()
+        await session.execute(insert(AccessToken).values(token=token, user_id=user_ids[0]))
+        await session.commit()
+    return list(user_ids), token
+
+
+async def cleanup(user_ids: list[int]) -> None:
+    async with async_session_maker() as session:
+        await session.execute(delete(Chat).where(Chat.user1_id.in_(user_ids)))
+        await session.execute(delete(User).where(User.id.in_(user_ids)))
+        await session.commit()
+
+
+async def main():
+    assert settings.MODE == "TEST", "Запускайте замер только на тестовой базе (MODE=TEST)"
+    user_ids, token = await seed()
+    event.listen(engine.sync_engine, "checkout", on_checkout)
+    event.listen(engine.sync_engine, "commit", on_commit)
+    try:
+        async with AsyncClient(
+            app=app, base_url="http://test", headers={"Authorization": f"Bearer {token}"}
+        ) as client:
+            response = await client.post("/chats", params={"other_user_id": user_ids[1]})
+            chat_id = response.json()["chat_id"]
+            requests = [
+                ("GET", "/chats", {}),
+                ("POST", "/chats", {"other_user_id": user_ids[1]}),
+                ("GET", f"/chats/{chat_id}", {}),
+                ("PUT", f"/chats/{chat_id}/read", {}),
+                ("DELETE", f"/chats/{chat_id}", {}),
+            ]
+            print(f"{'request':<28} {'status':>6} {'checkouts':>10} {'commits':>8}")
+            for method, url, params in requests:
+                counters.update(checkout=0, commit=0)
+                response = await client.request(method, url, params=params)
+                print(
+                    f"{method + ' ' + url:<28} {response.status_code:>6} "
+                    f"{counters['checkout']:>10} {counters['commit']:>8}"
+                )
+                assert counters["checkout"] <= 1, "Запрос взял из пула больше одного соединения"
+                assert counters["commit"] <= 1, "Запрос закоммитил больше одного раза"
+    finally:
+        event.remove(engine.sync_engine, "checkout", on_checkout)
+        event.remove(engine.sync_engine, "commit", on_commit)
+        await cleanup(user_ids)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())